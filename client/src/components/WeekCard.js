@@ -4,6 +4,10 @@ import Button from './Button';
 import Card from './Card';
 import './WeekCard.css'; 
 
+// Ingest job polling: one request per interval, giving up after the timeout
+const INGEST_POLL_INTERVAL_MS = 1000;
+const INGEST_POLL_TIMEOUT_MS = 10 * 60 * 1000;
+
 const WeekCard = ({
   week,
   userRole,
@@ -39,7 +43,7 @@ D) [Option D]
 Include the correct answers at the very bottom.`;
     
     // Navigate to home (Classroom Copilot) and pass the prompt in state
-    navigate('/', { state: { autoSendPrompt: prompt } });
+    navigate('/', { state: { autoSendPrompt: prompt, module: week.title } });
   };
 
   const handleBrowseClick = () => {
@@ -75,6 +79,21 @@ Include the correct answers at the very bottom.`;
     window.open(`http://localhost:8000/uploads/${materialName}`, '_blank');
   };
 
+  // Poll the ingest job until it reaches a terminal status or the timeout passes
+  const waitForIngestJob = async (jobId) => {
+    const deadline = Date.now() + INGEST_POLL_TIMEOUT_MS;
+    while (Date.now() < deadline) {
+      await new Promise(resolve => setTimeout(resolve, INGEST_POLL_INTERVAL_MS));
+      const response = await fetch(`http://localhost:8000/jobs/${jobId}`);
+      const job = await response.json();
+      if (job.error && !job.status) throw new Error(job.error);
+      if (job.status === 'succeeded') return job;
+      if (job.status === 'failed') throw new Error(job.error || 'Ingestion failed.');
+      if (job.status === 'cancelled') throw new Error('Ingestion was cancelled because the material was deleted.');
+    }
+    throw new Error('Indexing is taking longer than expected; check Course Materials for its status.');
+  };
+
   const processFiles = async (files) => {
     setErrorMessage('');
     setStatusMessage('');
@@ -156,11 +175,19 @@ Include the correct answers at the very bottom.`;
           throw new Error(data.error);
         }
 
+        // The backend accepts the file right away and ingests it in the background
+        const materialId = data.id || initialMaterial.id;
+        if (data.job_id) {
+          onAddMaterial(week.id, { ...initialMaterial, id: materialId, status: 'processing' }, true);
+          setStatusMessage(`${file.name} uploaded, indexing slides...`);
+          await waitForIngestJob(data.job_id);
+        }
+
         setStatusMessage(`${file.name} uploaded & ingested successfully.`);
         
         // Update status to processed using the real ID from backend
         // We still use the file name as the matching key in case the temp ID changed
-        onAddMaterial(week.id, { ...initialMaterial, id: data.id || initialMaterial.id, status: 'processed' }, true);
+        onAddMaterial(week.id, { ...initialMaterial, id: materialId, status: 'processed' }, true);
 
       } catch (err) {
         setErrorMessage(`Failed to upload ${file.name}. ${err.message}`);
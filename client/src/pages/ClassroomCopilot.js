@@ -23,6 +23,10 @@ const ClassroomCopilot = () => {
   // state for error messages
   const [error, setError] = useState('');
 
+  // optional module scope for questions, with choices loaded from the uploaded materials
+  const [moduleFilter, setModuleFilter] = useState('');
+  const [moduleOptions, setModuleOptions] = useState([]);
+
   const location = useLocation();
   const navigate = useNavigate();
 
@@ -30,7 +34,7 @@ const ClassroomCopilot = () => {
    * Reusable function to send a message to the backend
    * Allows calling from both the form submit and auto-prompts
    */
-  const sendMessage = async (messageText) => {
+  const sendMessage = async (messageText, module = moduleFilter) => {
     if (!messageText.trim()) {
       setError('Please enter a question');
       return;
@@ -46,9 +50,16 @@ const ClassroomCopilot = () => {
       const response = await fetch('http://localhost:8000/ask', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ question: messageText })
+        body: JSON.stringify(module ? { question: messageText, module } : { question: messageText })
       });
       const data = await response.json();
+
+      // the server sheds load when the model is saturated; tell the user when to retry
+      if (response.status === 429) {
+        const retryAfter = response.headers.get('Retry-After') || data.retry_after;
+        setError(`The assistant is busy right now. Please try again in ${retryAfter} seconds.`);
+        return;
+      }
       
       // add question and answer to conversation history
       // Use functional update to ensure we have the latest conversation state
@@ -81,6 +92,16 @@ const ClassroomCopilot = () => {
     }
   };
 
+  /**
+   * Load the modules questions can be scoped to
+   */
+  useEffect(() => {
+    fetch('http://localhost:8000/materials/filters')
+      .then(response => response.json())
+      .then(data => setModuleOptions(data.modules || []))
+      .catch(err => console.error('Error loading module filters:', err));
+  }, []);
+
   /**
    * Effect to handle auto-sent prompts from navigation state
    * Checks if an autoSendPrompt was passed (e.g., from Module Quiz generation)
@@ -89,8 +110,8 @@ const ClassroomCopilot = () => {
     if (location.state && location.state.autoSendPrompt) {
       const prompt = location.state.autoSendPrompt;
       
-      // Send the prompt
-      sendMessage(prompt);
+      // Send the prompt, scoped to the module it was generated for
+      sendMessage(prompt, location.state.module || '');
       
       // Clear the state so it doesn't re-send on refresh or navigation
       navigate(location.pathname, { replace: true, state: {} });
@@ -211,6 +232,18 @@ const ClassroomCopilot = () => {
             />
             
             <div className="form-actions">
+              <select
+                className="module-filter"
+                value={moduleFilter}
+                onChange={(e) => setModuleFilter(e.target.value)}
+                disabled={isLoading}
+                aria-label="Limit answers to one module"
+              >
+                <option value="">All modules</option>
+                {moduleOptions.map(module => (
+                  <option key={module} value={module}>{module}</option>
+                ))}
+              </select>
               <Button
                 type="submit"
                 variant="primary"
@@ -0,0 +1,155 @@
+"""
+Admission control for LLM generation in AI Classroom Co-Pilot
+At most LLM_MAX_CONCURRENCY generations run against Ollama at once; the rest wait in a bounded
+priority queue (instructors ahead of students), and requests whose estimated wait would exceed
+the latency SLO are rejected immediately so the caller can retry later (HTTP 429 + Retry-After)
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "2"))
+LLM_QUEUE_LIMIT = int(os.environ.get("LLM_QUEUE_LIMIT", "32"))
+# Longest a request may be expected to wait for a generation slot before it is turned away
+LLM_LATENCY_SLO = float(os.environ.get("LLM_LATENCY_SLO", "20"))
+# Starting guess for one generation, refined by a moving average of observed generations
+LLM_INITIAL_SERVICE_SECONDS = float(os.environ.get("LLM_INITIAL_SERVICE_SECONDS", "5"))
+
+PRIORITY_INSTRUCTOR = 0
+PRIORITY_STUDENT = 1
+ROLE_PRIORITIES = {"instructor": PRIORITY_INSTRUCTOR, "student": PRIORITY_STUDENT}
+
+
+class AdmissionRejected(Exception):
+    """Raised when a generation cannot start within the latency SLO; retry_after is in whole seconds"""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Admission:
+    """One admitted request; queue_seconds is how long it waited for its slot"""
+
+    def __init__(self, priority: int, queue_seconds: float = 0.0):
+        self.priority = priority
+        self.queue_seconds = queue_seconds
+
+
+class AdmissionController:
+    """
+    Bounded concurrency, bounded priority queue and fast rejection around LLM generation
+    A released slot is handed straight to the best waiting request (lowest priority value,
+    then arrival order). The expected wait is the queue ahead of a request divided across the
+    slots, times the average generation time.
+    Must be used from the event loop.
+    """
+
+    def __init__(self, max_concurrency: int = LLM_MAX_CONCURRENCY, queue_limit: int = LLM_QUEUE_LIMIT,
+                 latency_slo: float = LLM_LATENCY_SLO, service_seconds: float = LLM_INITIAL_SERVICE_SECONDS,
+                 smoothing: float = 0.2):
+        self.max_concurrency = max(1, max_concurrency)
+        self.queue_limit = max(0, queue_limit)
+        self.latency_slo = latency_slo
+        self.service_seconds = service_seconds
+        self.smoothing = smoothing
+        self._active = 0
+        self._waiters: List[Tuple[int, int, "asyncio.Future[None]"]] = []
+        self._sequence = itertools.count()
+        self._queue_times: Deque[float] = deque(maxlen=512)
+        self.admitted = 0
+        self.rejected = 0
+
+    def _queued(self, priority: Optional[int] = None) -> int:
+        """Waiting requests, or only those that would be served before a new request at this priority"""
+        return sum(1 for waiter_priority, _, future in self._waiters
+                   if not future.done() and (priority is None or waiter_priority <= priority))
+
+    def estimated_wait(self, priority: int) -> float:
+        if self._active < self.max_concurrency and not self._queued():
+            return 0.0
+        ahead = self._queued(priority) + 1
+        return math.ceil(ahead / self.max_concurrency) * self.service_seconds
+
+    def check(self, priority: int) -> None:
+        """Raise AdmissionRejected if a request at this priority should be turned away now"""
+        if self._active < self.max_concurrency and not self._queued():
+            return
+        if self._queued() >= self.queue_limit:
+            self._reject(f"Generation queue is full ({self.queue_limit} waiting)", self.service_seconds)
+        wait = self.estimated_wait(priority)
+        if wait > self.latency_slo:
+            self._reject(f"Estimated wait {wait:.1f}s exceeds the {self.latency_slo:.0f}s latency target",
+                         wait - self.latency_slo)
+
+    def _reject(self, reason: str, retry_after: float) -> None:
+        self.rejected += 1
+        logger.warning(f"Rejected generation request: {reason}")
+        raise AdmissionRejected(reason, max(1, math.ceil(retry_after)))
+
+    @asynccontextmanager
+    async def slot(self, priority: int = PRIORITY_STUDENT) -> AsyncIterator[Admission]:
+        """
+        Hold one generation slot for the body of the with block
+        Raises AdmissionRejected instead of queueing a request past the SLO
+        """
+        self.check(priority)
+        queued_at = time.perf_counter()
+        if self._active < self.max_concurrency and not self._queued():
+            self._active += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+            try:
+                await future
+            except asyncio.CancelledError:
+                # Handed a slot just as the caller went away: pass it on
+                if future.done() and not future.cancelled():
+                    self._release()
+                raise
+
+        admission = Admission(priority, time.perf_counter() - queued_at)
+        self._queue_times.append(admission.queue_seconds)
+        self.admitted += 1
+        started = time.perf_counter()
+        try:
+            yield admission
+            elapsed = time.perf_counter() - started
+            self.service_seconds += self.smoothing * (elapsed - self.service_seconds)
+        finally:
+            self._release()
+
+    def _release(self) -> None:
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)  # the slot moves to the waiter; _active is unchanged
+                return
+        self._active -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        queue_times = sorted(self._queue_times)
+        return {
+            "max_concurrency": self.max_concurrency,
+            "active": self._active,
+            "queued": self._queued(),
+            "queue_limit": self.queue_limit,
+            "latency_slo": self.latency_slo,
+            "service_seconds": round(self.service_seconds, 3),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "queue_seconds_avg": round(sum(queue_times) / len(queue_times), 3) if queue_times else 0.0,
+            "queue_seconds_p95": round(queue_times[int(0.95 * (len(queue_times) - 1))], 3) if queue_times else 0.0,
+            "queue_seconds_max": round(queue_times[-1], 3) if queue_times else 0.0,
+        }
@@ -0,0 +1,109 @@
+"""
+Chunk policy benchmark for AI Classroom Co-Pilot
+Indexes the given decks once per chunk policy, asks the same questions against each index,
+and reports chunk counts, prompt tokens and retrieval / generation latency per policy
+
+Usage (from the repository root, with Ollama running):
+    python -m server.benchmarks.chunking server/uploads/*.pptx
+    python -m server.benchmarks.chunking deck.pptx --policies slide,token:128:16:32 --skip-generation
+"""
+
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from typing import Dict, List
+
+from server.ingest import ChunkPolicy, TokenChunkPolicy, get_chunk_policy, ingest_pptx_to_chroma
+from server.generation import AnswerGenerator
+from server.retrieval import SlideRetriever
+from server.tokens import estimate_tokens
+
+DEFAULT_QUESTIONS = [
+    "What is a firewall?",
+    "How does a SYN flood attack work?",
+    "Explain ARP spoofing and how to detect it.",
+    "What is the difference between symmetric and asymmetric encryption?",
+    "Summarize the main topics of this module.",
+]
+
+
+def parse_policy(spec: str) -> ChunkPolicy:
+    """Parse a policy spec: slide, token, or token:<target>:<overlap>:<min>"""
+    name, _, params = spec.partition(":")
+    if name == TokenChunkPolicy.name and params:
+        target, overlap, minimum = (int(p) for p in params.split(":"))
+        return TokenChunkPolicy(target_tokens=target, overlap_tokens=overlap, min_tokens=minimum)
+    return get_chunk_policy(name)
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def run_policy(policy: ChunkPolicy, decks: List[str], questions: List[str], generator: AnswerGenerator,
+               skip_generation: bool) -> Dict[str, float]:
+    with tempfile.TemporaryDirectory(prefix="chunk-bench-") as persist_directory:
+        started = time.perf_counter()
+        chunks = sum(
+            ingest_pptx_to_chroma(deck, week_title="Benchmark", persist_directory=persist_directory,
+                                  chunk_policy=policy)
+            for deck in decks
+        )
+        ingest_seconds = time.perf_counter() - started
+
+        retriever = SlideRetriever(persist_directory=persist_directory)
+        prompt_tokens, retrieval_ms, generation_ms, total_ms = [], [], [], []
+        for question in questions:
+            retriever.query_cache.clear()
+            started = time.perf_counter()
+            retrieval = retriever.retrieve_relevant_content(question)
+            retrieved = time.perf_counter()
+            prompt_tokens.append(estimate_tokens(generator.build_prompt(question, retrieval["context"])))
+            if not skip_generation:
+                generator.generate_answer(question, retrieval["context"])
+            finished = time.perf_counter()
+            retrieval_ms.append((retrieved - started) * 1000)
+            generation_ms.append((finished - retrieved) * 1000)
+            total_ms.append((finished - started) * 1000)
+
+    return {
+        "chunks": chunks,
+        "ingest_s": ingest_seconds,
+        "prompt_tokens_avg": statistics.mean(prompt_tokens),
+        "prompt_tokens_max": max(prompt_tokens),
+        "retrieval_ms_p50": percentile(retrieval_ms, 50),
+        "generation_ms_p50": percentile(generation_ms, 50),
+        "total_ms_p50": percentile(total_ms, 50),
+        "total_ms_p95": percentile(total_ms, 95),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("decks", nargs="+", help=".pptx files to index")
+    parser.add_argument("--policies", default="slide,token", help="comma-separated policies to compare")
+    parser.add_argument("--questions", help="file with one question per line")
+    parser.add_argument("--skip-generation", action="store_true", help="measure retrieval and prompt size only")
+    args = parser.parse_args()
+
+    questions = DEFAULT_QUESTIONS
+    if args.questions:
+        with open(args.questions, "r", encoding="utf-8") as f:
+            questions = [line.strip() for line in f if line.strip()]
+    decks = [os.path.abspath(deck) for deck in args.decks]
+    generator = AnswerGenerator()
+
+    columns = ["chunks", "ingest_s", "prompt_tokens_avg", "prompt_tokens_max",
+               "retrieval_ms_p50", "generation_ms_p50", "total_ms_p50", "total_ms_p95"]
+    print(f"{'policy':<24}" + "".join(f"{c:>19}" for c in columns))
+    for spec in args.policies.split(","):
+        policy = parse_policy(spec.strip())
+        result = run_policy(policy, decks, questions, generator, args.skip_generation)
+        print(f"{policy.signature():<24}" + "".join(f"{result[c]:>19.1f}" for c in columns))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+"""
+Local Ollama stand-in for offline benchmarks of AI Classroom Co-Pilot
+Serves /api/embed, /api/embeddings and /api/generate (streamed or not) on localhost with
+configurable latency, token rate and parallelism, so the server can be measured without a GPU,
+a model download or any network access
+Embeddings are deterministic hashed bag-of-words vectors: the same text always gets the same
+vector and texts that share words are close, so retrieval still finds the matching slides
+
+Usage (from the repository root):
+    python -m server.benchmarks.fake_ollama --port 11435
+    OLLAMA_BASE_URL=http://127.0.0.1:11435 python -m uvicorn server.main:app
+"""
+
+import argparse
+import hashlib
+import json
+import re
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+FILLER_WORDS = ("the", "course", "materials", "explain", "that", "this", "topic", "covers", "key", "ideas")
+
+
+@lru_cache(maxsize=65536)
+def _feature(token: str, dim: int) -> Tuple[int, float]:
+    digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+    value = int.from_bytes(digest, "little")
+    return value % dim, 1.0 if value >> 63 else -1.0
+
+
+def hashed_embedding(text: str, dim: int = 768) -> List[float]:
+    """Unit vector of signed hashed word and word-bigram counts"""
+    words = WORD_PATTERN.findall(text.lower())
+    vector = np.zeros(dim, dtype=np.float32)
+    for token in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+        index, sign = _feature(token, dim)
+        vector[index] += sign
+    norm = float(np.linalg.norm(vector))
+    if norm == 0:
+        index, _ = _feature(text, dim)
+        vector[index] = 1.0
+        norm = 1.0
+    return (vector / norm).tolist()
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address) -> None:
+        # Callers that give up early (e.g. a query embedding past its timeout) just close the socket
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class FakeOllama:
+    """
+    Threaded HTTP server that answers like Ollama
+    Each embedding request takes embed_latency_ms plus embed_per_text_ms per input; each generation
+    waits first_token_ms and then emits tokens at tokens_per_second, answer_tokens long unless the
+    request's num_predict is lower. At most parallel requests of each kind are served at once and the
+    rest wait, like OLLAMA_NUM_PARALLEL.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, dim: int = 768, embed_latency_ms: float = 15.0,
+                 embed_per_text_ms: float = 2.0, first_token_ms: float = 250.0, tokens_per_second: float = 40.0,
+                 answer_tokens: int = 120, parallel: int = 1):
+        self.dim = dim
+        self.embed_latency = embed_latency_ms / 1000
+        self.embed_per_text = embed_per_text_ms / 1000
+        self.first_token = first_token_ms / 1000
+        self.tokens_per_second = tokens_per_second
+        self.answer_tokens = answer_tokens
+        self._embed_slots = threading.BoundedSemaphore(max(1, parallel))
+        self._generate_slots = threading.BoundedSemaphore(max(1, parallel))
+        self._lock = threading.Lock()
+        self.counts: Dict[str, int] = {"embed": 0, "texts_embedded": 0, "generate": 0, "tokens": 0}
+        self._server = _Server((host, port), self._handler())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeOllama":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-ollama", daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self) -> None:
+        """Serve in the calling thread until interrupted"""
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "FakeOllama":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def _count(self, **amounts: int) -> None:
+        with self._lock:
+            for name, amount in amounts.items():
+                self.counts[name] += amount
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        with self._embed_slots:
+            time.sleep(self.embed_latency + self.embed_per_text * len(texts))
+            vectors = [hashed_embedding(text, self.dim) for text in texts]
+        self._count(embed=1, texts_embedded=len(texts))
+        return vectors
+
+    def answer_words(self, prompt: str, limit: Optional[int]) -> List[str]:
+        """Deterministic answer text: words from the retrieved content, padded with filler"""
+        count = self.answer_tokens if not limit or limit <= 0 else min(self.answer_tokens, limit)
+        content = " ".join(line.split(":", 1)[1] for line in prompt.splitlines() if line.startswith("Content:"))
+        words = content.split() or list(FILLER_WORDS)
+        return [words[n % len(words)] for n in range(count)]
+
+    def generate(self, prompt: str, limit: Optional[int]) -> Iterator[str]:
+        """Yield answer tokens at the configured rate while holding a generation slot"""
+        with self._generate_slots:
+            time.sleep(self.first_token)
+            interval = 1 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+            words = self.answer_words(prompt, limit)
+            for index, word in enumerate(words):
+                if index:
+                    time.sleep(interval)
+                yield (" " if index else "") + word
+        self._count(generate=1, tokens=len(words))
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args) -> None:
+                pass
+
+            def _json(self, payload: Dict[str, Any], status: int = 200) -> None:
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _chunk(self, payload: Dict[str, Any]) -> None:
+                data = (json.dumps(payload) + "\n").encode("utf-8")
+                self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+            def do_GET(self) -> None:
+                if self.path == "/api/tags":
+                    self._json({"models": []})
+                elif self.path == "/api/version":
+                    self._json({"version": "fake"})
+                else:
+                    self._json({"error": "not found"}, status=404)
+
+            def do_POST(self) -> None:
+                length = int(self.headers.get("Content-Length") or 0)
+                request = json.loads(self.rfile.read(length) or b"{}")
+                if self.path == "/api/embed":
+                    texts = request.get("input") or ""
+                    texts = [texts] if isinstance(texts, str) else list(texts)
+                    self._json({"model": request.get("model", ""), "embeddings": fake.embed(texts)})
+                elif self.path == "/api/embeddings":
+                    self._json({"embedding": fake.embed([request.get("prompt", "")])[0]})
+                elif self.path == "/api/generate":
+                    self._generate(request)
+                else:
+                    self._json({"error": "not found"}, status=404)
+
+            def _generate(self, request: Dict[str, Any]) -> None:
+                started = time.perf_counter_ns()
+                limit = (request.get("options") or {}).get("num_predict")
+                tokens = fake.generate(request.get("prompt", ""), limit)
+                base = {"model": request.get("model", ""), "created_at": datetime.now(timezone.utc).isoformat()}
+                if request.get("stream", True):
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/x-ndjson")
+                    self.send_header("Transfer-Encoding", "chunked")
+                    self.end_headers()
+                    count = 0
+                    for token in tokens:
+                        count += 1
+                        self._chunk({**base, "response": token, "done": False})
+                    self._chunk({**base, "response": "", "done": True, "done_reason": "stop",
+                                 "eval_count": count, "eval_duration": time.perf_counter_ns() - started,
+                                 "total_duration": time.perf_counter_ns() - started})
+                    self.wfile.write(b"0\r\n\r\n")
+                else:
+                    parts = list(tokens)
+                    self._json({**base, "response": "".join(parts), "done": True, "done_reason": "stop",
+                                "eval_count": len(parts), "eval_duration": time.perf_counter_ns() - started,
+                                "total_duration": time.perf_counter_ns() - started})
+
+        return Handler
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--dim", type=int, default=768, help="768 matches nomic-embed-text")
+    parser.add_argument("--embed-latency-ms", type=float, default=15.0)
+    parser.add_argument("--embed-per-text-ms", type=float, default=2.0)
+    parser.add_argument("--first-token-ms", type=float, default=250.0)
+    parser.add_argument("--tokens-per-second", type=float, default=40.0)
+    parser.add_argument("--answer-tokens", type=int, default=120)
+    parser.add_argument("--parallel", type=int, default=1, help="Requests of each kind served at once")
+    args = parser.parse_args()
+
+    fake = FakeOllama(args.host, args.port, args.dim, args.embed_latency_ms, args.embed_per_text_ms,
+                      args.first_token_ms, args.tokens_per_second, args.answer_tokens, args.parallel)
+    print(f"Fake Ollama listening on {fake.url}", flush=True)
+    try:
+        fake.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+"""
+Classroom-shaped load generator for AI Classroom Co-Pilot
+Replays the real question distribution from the faqs table: questions are drawn with probability
+proportional to ask_count and sent to /ask, /ask/stream or a mix of both by a configurable number of
+virtual students. Requests arrive as a Poisson process at --rate per second (open loop, like a class
+working through an exercise), or back to back per student when --rate is 0 (closed loop, to find
+the saturation point). Reports throughput, error and 429 rates, time to first byte, time to first
+token for streams, and latency percentiles
+
+Questions come from GET /faqs on the target server, or from an app.db given with --db. Every replayed
+question is recorded in the server's faqs table again, so point the server at a copy of the database
+(APP_DB_PATH) when the real distribution must stay untouched
+
+Usage (from the repository root, with the server running):
+    python -m server.benchmarks.loadgen --url http://127.0.0.1:8000 --students 30 --rate 2 --duration 120
+    python -m server.benchmarks.loadgen --db server/app.db --students 60 --rate 0 --requests 300 --mode mixed
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import sqlite3
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+from server.benchmarks.suite import latency_summary
+
+MODES = ("ask", "stream", "mixed")
+
+
+def load_faqs_from_db(path: str) -> List[Tuple[str, int]]:
+    """(question, ask_count) pairs read without write access, so a live server is not disturbed"""
+    with sqlite3.connect(f"file:{path}?mode=ro", uri=True) as conn:
+        return [(question, count) for question, count in
+                conn.execute("SELECT question, ask_count FROM faqs WHERE ask_count > 0")]
+
+
+def load_faqs_from_server(url: str) -> List[Tuple[str, int]]:
+    response = httpx.get(url.rstrip("/") + "/faqs", timeout=30)
+    response.raise_for_status()
+    return [(row["question"], row["ask_count"]) for row in response.json() if row.get("ask_count", 0) > 0]
+
+
+class QuestionSampler:
+    """Draws questions with probability proportional to how often students asked them"""
+
+    def __init__(self, faqs: List[Tuple[str, int]], seed: Optional[int] = None):
+        if not faqs:
+            raise ValueError("The faqs table is empty; ask some questions first or pass --db with a populated app.db")
+        self.questions = [question for question, _ in faqs]
+        self.weights = [count for _, count in faqs]
+        self._rng = random.Random(seed)
+
+    def sample(self) -> str:
+        return self._rng.choices(self.questions, weights=self.weights)[0]
+
+
+async def send_question(client: httpx.AsyncClient, question: str, stream: bool) -> Dict[str, Any]:
+    """
+    Ask one question and time it
+    first_byte_ms is when the response body starts (the citations event for streams, the whole
+    answer for /ask); first_token_ms is when the first answer token event arrives on a stream
+    """
+    started = time.perf_counter()
+    first_byte_ms = first_token_ms = None
+    summary: Dict[str, Any] = {}
+    error = None
+    status = 0
+    try:
+        if stream:
+            async with client.stream("POST", "/ask/stream", json={"question": question}) as response:
+                status = response.status_code
+                event = None
+                async for line in response.aiter_lines():
+                    if first_byte_ms is None:
+                        first_byte_ms = (time.perf_counter() - started) * 1000
+                    if line.startswith("event: "):
+                        event = line[len("event: "):]
+                        if event == "token" and first_token_ms is None:
+                            first_token_ms = (time.perf_counter() - started) * 1000
+                    elif line.startswith("data: ") and event in ("done", "error"):
+                        summary = {**json.loads(line[len("data: "):]), "event": event}
+            if status == 200 and summary.get("event") != "done":
+                error = "stream_error" if summary else "incomplete_stream"
+        else:
+            body = b""
+            async with client.stream("POST", "/ask", json={"question": question}) as response:
+                status = response.status_code
+                async for chunk in response.aiter_bytes():
+                    if first_byte_ms is None:
+                        first_byte_ms = (time.perf_counter() - started) * 1000
+                    body += chunk
+            if status == 200:
+                summary = json.loads(body)
+                if "error" in summary:
+                    error = "answer_error"
+    except httpx.HTTPError as e:
+        status, error = 0, type(e).__name__
+    if status == 429:
+        error = "rejected"
+    elif status not in (0, 200):
+        error = f"http_{status}"
+    return {
+        "stream": stream,
+        "status": status,
+        "error": error,
+        "latency_ms": (time.perf_counter() - started) * 1000,
+        "first_byte_ms": first_byte_ms,
+        "first_token_ms": first_token_ms,
+        "fallback": bool(summary.get("fallback")),
+        "cached": bool(summary.get("cached")),
+    }
+
+
+async def run_load(url: str, sampler: QuestionSampler, students: int, rate: float, duration: Optional[float],
+                   requests: Optional[int], mode: str, stream_ratio: float, seed: Optional[int] = None,
+                   progress_every: float = 10.0) -> Tuple[List[Dict[str, Any]], float]:
+    """
+    Drive the server and return (per-request results, wall seconds)
+    At most students requests are outstanding; an arrival that finds every student busy waits,
+    and the wait is reported as queued_ms so an overloaded client is visible in the results
+    """
+    rng = random.Random(seed)
+    results: List[Dict[str, Any]] = []
+    busy = asyncio.Semaphore(students)
+    started = time.perf_counter()
+    stop_at = started + duration if duration else None
+
+    def more() -> bool:
+        if requests is not None and issued >= requests:
+            return False
+        return stop_at is None or time.perf_counter() < stop_at
+
+    def next_stream() -> bool:
+        return mode == "stream" or (mode == "mixed" and rng.random() < stream_ratio)
+
+    async def one(question: str, stream: bool, arrived: float) -> None:
+        async with busy:
+            queued_ms = (time.perf_counter() - arrived) * 1000
+            result = await send_question(client, question, stream)
+        results.append({**result, "queued_ms": queued_ms})
+
+    async def report_progress() -> None:
+        while True:
+            await asyncio.sleep(progress_every)
+            done = len(results)
+            errors = sum(1 for r in results if r["error"])
+            print(f"  {time.perf_counter() - started:6.0f}s  {done} done, {errors} errors, "
+                  f"{issued - done} in flight", file=sys.stderr, flush=True)
+
+    issued = 0
+    limits = httpx.Limits(max_connections=students, max_keepalive_connections=students)
+    async with httpx.AsyncClient(base_url=url, timeout=httpx.Timeout(300, connect=10), limits=limits) as client:
+        reporter = asyncio.ensure_future(report_progress())
+        tasks = []
+        if rate > 0:
+            # Open loop: arrivals do not wait for earlier answers
+            next_arrival = time.perf_counter()
+            while more():
+                await asyncio.sleep(max(0.0, next_arrival - time.perf_counter()))
+                tasks.append(asyncio.ensure_future(one(sampler.sample(), next_stream(), time.perf_counter())))
+                issued += 1
+                next_arrival += rng.expovariate(rate)
+        else:
+            # Closed loop: each student asks again as soon as the last answer arrives
+            async def student() -> None:
+                nonlocal issued
+                while more():
+                    issued += 1
+                    await one(sampler.sample(), next_stream(), time.perf_counter())
+
+            tasks = [asyncio.ensure_future(student()) for _ in range(students)]
+        await asyncio.gather(*tasks)
+        reporter.cancel()
+    return results, time.perf_counter() - started
+
+
+def summarize(results: List[Dict[str, Any]], wall_seconds: float) -> Dict[str, Any]:
+    answered = [r for r in results if not r["error"]]
+    total = len(results)
+    errors: Dict[str, int] = {}
+    for r in results:
+        if r["error"]:
+            errors[r["error"]] = errors.get(r["error"], 0) + 1
+    return {
+        "requests": total,
+        "answered": len(answered),
+        "wall_s": round(wall_seconds, 1),
+        "throughput_rps": round(len(answered) / wall_seconds, 2) if wall_seconds else 0.0,
+        "error_rate": round((total - len(answered)) / total, 4) if total else 0.0,
+        "rejected_rate": round(errors.get("rejected", 0) / total, 4) if total else 0.0,
+        "errors": errors,
+        "fallback_rate": round(sum(r["fallback"] for r in answered) / len(answered), 4) if answered else 0.0,
+        "cached_rate": round(sum(r["cached"] for r in answered) / len(answered), 4) if answered else 0.0,
+        **latency_summary([r["latency_ms"] for r in answered], "latency_ms"),
+        **latency_summary([r["first_byte_ms"] for r in answered if r["first_byte_ms"] is not None],
+                          "first_byte_ms"),
+        **latency_summary([r["first_token_ms"] for r in answered if r["first_token_ms"] is not None],
+                          "first_token_ms"),
+        **latency_summary([r["queued_ms"] for r in results], "client_queued_ms"),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--db", help="Read the question distribution from this app.db instead of GET /faqs")
+    parser.add_argument("--students", type=int, default=30, help="Virtual students (requests outstanding at once)")
+    parser.add_argument("--rate", type=float, default=1.0, help="Arrivals per second; 0 for closed-loop students")
+    parser.add_argument("--duration", type=float, default=60.0, help="Seconds to generate load (0 for no limit)")
+    parser.add_argument("--requests", type=int, help="Stop after this many requests")
+    parser.add_argument("--mode", choices=MODES, default="ask")
+    parser.add_argument("--stream-ratio", type=float, default=0.5, help="Share of streamed requests in mixed mode")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--output", help="Also write the summary and per-request results as JSON")
+    args = parser.parse_args()
+    if not args.duration and args.requests is None:
+        parser.error("Give --duration, --requests or both")
+
+    faqs = load_faqs_from_db(args.db) if args.db else load_faqs_from_server(args.url)
+    sampler = QuestionSampler(faqs, seed=args.seed)
+    print(f"Replaying {len(faqs)} questions ({sum(count for _, count in faqs)} recorded asks) against {args.url}: "
+          f"{args.students} students, {'closed loop' if args.rate <= 0 else f'{args.rate}/s arrivals'}, "
+          f"mode {args.mode}", file=sys.stderr, flush=True)
+
+    results, wall_seconds = asyncio.run(run_load(
+        args.url, sampler, args.students, args.rate, args.duration or None, args.requests, args.mode,
+        args.stream_ratio, seed=args.seed,
+    ))
+    summary = summarize(results, wall_seconds)
+    for key, value in summary.items():
+        print(f"{key:<24}{value}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"config": vars(args), "summary": summary, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,375 @@
+"""
+Offline benchmark suite for AI Classroom Co-Pilot
+Starts the fake Ollama and the real server (uvicorn, with a scratch database, uploads folder and
+index), generates a synthetic corpus and runs these scenarios over HTTP:
+    ingest       upload each deck and poll /jobs until it is searchable (NFR-2)
+    ask          one question at a time through /ask and /ask/stream: latency and time-to-first-token
+                 percentiles (NFR-1), then the same questions again to time answer cache hits
+    concurrency  bursts of distinct questions at each concurrency level: throughput, latency,
+                 429 rejections and deadline fallbacks
+Results go to a JSON file; --compare reports every metric that got worse than in an earlier
+results file by more than --tolerance and exits non-zero, so releases can be checked for regressions
+Server settings (VECTOR_BACKEND, LLM_MAX_CONCURRENCY, ASK_DEADLINE_SECONDS, ...) are taken from the
+environment as usual
+
+Usage (from the repository root; no network or Ollama needed):
+    python -m server.benchmarks.suite --output bench.json
+    python -m server.benchmarks.suite --decks 8 --slides 60 --concurrency 1,4,16 --compare baseline.json
+    VECTOR_BACKEND=numpy python -m server.benchmarks.suite --scenarios ask,concurrency
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+from server.benchmarks.chunking import percentile
+from server.benchmarks.fake_ollama import FakeOllama
+from server.benchmarks.synthetic_decks import generate_corpus, sample_questions
+
+SCENARIOS = ("ingest", "ask", "concurrency")
+# Counts where any increase over the baseline is a regression
+FAILURE_COUNTS = ("errors", "fallbacks", "rejected", "failed")
+REPOSITORY_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def latency_summary(values: List[float], prefix: str) -> Dict[str, float]:
+    if not values:
+        return {}
+    return {f"{prefix}_p{pct}": round(percentile(values, pct), 1) for pct in (50, 95, 99)}
+
+
+class ServerProcess:
+    """The FastAPI app under uvicorn in a child process, using scratch paths and the given Ollama URL"""
+
+    def __init__(self, workdir: str, ollama_url: str, paraphrase_cache: bool):
+        self.port = _free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.log_path = os.path.join(workdir, "server.log")
+        uploads = os.path.join(workdir, "uploads")
+        os.makedirs(uploads, exist_ok=True)
+        self.env = {
+            **os.environ,
+            "OLLAMA_BASE_URL": ollama_url,
+            "APP_DB_PATH": os.path.join(workdir, "app.db"),
+            "UPLOADS_DIR": uploads,
+            "CHROMA_DIR": os.path.join(workdir, "index"),
+        }
+        if not paraphrase_cache:
+            # Distinct questions then always reach the LLM; repeats of the same question still hit the cache
+            self.env["ANSWER_CACHE_SIMILARITY"] = "1.01"
+        self._process: Optional[subprocess.Popen] = None
+
+    def __enter__(self) -> "ServerProcess":
+        log = open(self.log_path, "w")
+        self._process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "server.main:app", "--host", "127.0.0.1", "--port", str(self.port),
+             "--log-level", "warning"],
+            cwd=REPOSITORY_ROOT, env=self.env, stdout=log, stderr=subprocess.STDOUT,
+        )
+        log.close()
+        deadline = time.monotonic() + 60
+        while time.monotonic() < deadline:
+            if self._process.poll() is not None:
+                raise RuntimeError(f"Server exited during startup; see {self.log_path}")
+            try:
+                if httpx.get(self.url + "/", timeout=1).status_code == 200:
+                    return self
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.2)
+        raise RuntimeError(f"Server did not start within 60s; see {self.log_path}")
+
+    def __exit__(self, *exc) -> None:
+        if self._process is not None:
+            self._process.terminate()
+            try:
+                self._process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self._process.kill()
+
+
+async def upload_deck(client: httpx.AsyncClient, path: str, week_title: str) -> Tuple[float, int, str]:
+    """Upload one deck and wait for its ingest job; returns (seconds to searchable, chunks indexed, status)"""
+    started = time.perf_counter()
+    with open(path, "rb") as deck:
+        response = await client.post("/upload", files={"file": (os.path.basename(path), deck)},
+                                     data={"week_title": week_title})
+    job_id = response.json().get("job_id")
+    if job_id is None:
+        return time.perf_counter() - started, 0, "failed"
+    while True:
+        job = (await client.get(f"/jobs/{job_id}")).json()
+        if job.get("status") in ("succeeded", "failed", "cancelled"):
+            return time.perf_counter() - started, job.get("chunks_total") or 0, job["status"]
+        await asyncio.sleep(0.05)
+
+
+async def scenario_ingest(client: httpx.AsyncClient, corpus: List[Tuple[str, str]]) -> Dict[str, Any]:
+    started = time.perf_counter()
+    seconds, chunks, failed = [], 0, 0
+    for path, week_title in corpus:
+        elapsed, deck_chunks, status = await upload_deck(client, path, week_title)
+        seconds.append(elapsed)
+        chunks += deck_chunks
+        failed += status != "succeeded"
+    total = time.perf_counter() - started
+    return {
+        "decks": len(corpus),
+        "chunks": chunks,
+        "failed": failed,
+        "total_s": round(total, 2),
+        "chunks_per_s": round(chunks / total, 1) if total else 0.0,
+        "upload_to_searchable_s_p50": round(percentile(seconds, 50), 2),
+        "upload_to_searchable_s_p95": round(percentile(seconds, 95), 2),
+        "upload_to_searchable_s_max": round(max(seconds), 2),
+    }
+
+
+async def timed_ask(client: httpx.AsyncClient, question: str) -> Dict[str, Any]:
+    started = time.perf_counter()
+    response = await client.post("/ask", json={"question": question})
+    latency = (time.perf_counter() - started) * 1000
+    body = response.json() if response.status_code in (200, 429) else {}
+    return {
+        "latency_ms": latency,
+        "status": response.status_code,
+        "error": response.status_code != 200 or "error" in body,
+        "fallback": bool(body.get("fallback")),
+        "cached": bool(body.get("cached")),
+    }
+
+
+async def timed_stream(client: httpx.AsyncClient, question: str) -> Dict[str, Any]:
+    """Time to the first token event and to the end of the stream"""
+    started = time.perf_counter()
+    first_token_ms, done = None, {}
+    async with client.stream("POST", "/ask/stream", json={"question": question}) as response:
+        event = None
+        async for line in response.aiter_lines():
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+                if event == "token" and first_token_ms is None:
+                    first_token_ms = (time.perf_counter() - started) * 1000
+            elif line.startswith("data: ") and event in ("done", "error"):
+                done = {**json.loads(line[len("data: "):]), "event": event}
+        status = response.status_code
+    return {
+        "latency_ms": (time.perf_counter() - started) * 1000,
+        "first_token_ms": first_token_ms,
+        "status": status,
+        "error": status != 200 or done.get("event") != "done",
+        "fallback": bool(done.get("fallback")),
+    }
+
+
+async def scenario_ask(client: httpx.AsyncClient, questions: List[str], count: int) -> Dict[str, Any]:
+    asked = [await timed_ask(client, question) for question in questions[:count]]
+    streamed = [await timed_stream(client, question) for question in questions[count:2 * count]]
+    repeated = [await timed_ask(client, question) for question in questions[:count]]
+    return {
+        "questions": count,
+        **latency_summary([r["latency_ms"] for r in asked if not r["error"]], "ask_ms"),
+        **latency_summary([r["latency_ms"] for r in streamed if not r["error"]], "stream_ms"),
+        **latency_summary([r["first_token_ms"] for r in streamed if r["first_token_ms"] is not None],
+                          "first_token_ms"),
+        **latency_summary([r["latency_ms"] for r in repeated if r["cached"]], "cached_ms"),
+        "cache_hits": sum(r["cached"] for r in repeated),
+        "fallbacks": sum(r["fallback"] for r in asked + streamed),
+        "errors": sum(r["error"] for r in asked + streamed + repeated),
+    }
+
+
+async def scenario_concurrency(client: httpx.AsyncClient, questions: List[str], levels: List[int],
+                               requests_per_level: int) -> List[Dict[str, Any]]:
+    rows = []
+    offset = 0
+    for level in levels:
+        batch = questions[offset:offset + requests_per_level]
+        offset += requests_per_level
+        pending = iter(batch)
+        results: List[Dict[str, Any]] = []
+
+        async def student() -> None:
+            for question in pending:
+                results.append(await timed_ask(client, question))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(student() for _ in range(level)))
+        wall = time.perf_counter() - started
+        answered = [r for r in results if not r["error"]]
+        rows.append({
+            "concurrency": level,
+            "requests": len(results),
+            "throughput_rps": round(len(answered) / wall, 2) if wall else 0.0,
+            **latency_summary([r["latency_ms"] for r in answered], "latency_ms"),
+            "rejected": sum(r["status"] == 429 for r in results),
+            "fallbacks": sum(r["fallback"] for r in answered),
+            "errors": sum(r["error"] and r["status"] != 429 for r in results),
+        })
+        print(f"concurrency {level}: {rows[-1]}", flush=True)
+    return rows
+
+
+def _flatten(results: Dict[str, Any]) -> Dict[str, float]:
+    """Numeric scenario metrics keyed like ingest.chunks_per_s or concurrency[4].latency_ms_p95"""
+    flat = {}
+    for name, scenario in results.get("scenarios", {}).items():
+        rows = scenario if isinstance(scenario, list) else [scenario]
+        for row in rows:
+            label = f"{name}[{row['concurrency']}]" if "concurrency" in row else name
+            for key, value in row.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    flat[f"{label}.{key}"] = value
+    return flat
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """
+    Describe each metric that is worse than the baseline: timings and throughput by more than tolerance,
+    and failure counts (errors, fallbacks, 429s, failed ingests) by any increase, even from zero, since a
+    run that turns answers into fast fallbacks would otherwise look like a speed-up
+    """
+    regressions = []
+    current, previous = _flatten(results), _flatten(baseline)
+    for key, before in previous.items():
+        after = current.get(key)
+        if after is None:
+            continue
+        metric = key.rsplit(".", 1)[1]
+        if metric in FAILURE_COUNTS:
+            worse = after > before
+        elif not before:
+            continue
+        elif metric.endswith("_per_s") or metric.endswith("_rps"):
+            worse = after < before * (1 - tolerance)
+        elif "_ms" in metric or "_s_" in metric or metric.endswith("_s"):
+            worse = after > before * (1 + tolerance)
+        else:
+            continue
+        if worse:
+            regressions.append(f"{key}: {before} -> {after}")
+    return regressions
+
+
+async def run_scenarios(server_url: str, scenarios: List[str], corpus: List[Tuple[str, str]],
+                        args: argparse.Namespace) -> Dict[str, Any]:
+    results: Dict[str, Any] = {}
+    questions = sample_questions(2 * args.questions + args.requests * len(args.concurrency), decks=args.decks)
+    limits = httpx.Limits(max_connections=max(args.concurrency) + 4)
+    async with httpx.AsyncClient(base_url=server_url, timeout=120, limits=limits) as client:
+        # Asking needs an index, so the corpus is always ingested; only the ingest results are optional
+        ingest = await scenario_ingest(client, corpus)
+        if "ingest" in scenarios:
+            results["ingest"] = ingest
+            print(f"ingest: {ingest}", flush=True)
+        if "ask" in scenarios:
+            results["ask"] = await scenario_ask(client, questions, args.questions)
+            print(f"ask: {results['ask']}", flush=True)
+        questions = questions[2 * args.questions:]
+        if "concurrency" in scenarios:
+            results["concurrency"] = await scenario_concurrency(client, questions, args.concurrency, args.requests)
+        results["server_stats"] = (await client.get("/stats")).json()
+    return results
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPOSITORY_ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma-separated subset of " +
+                        ", ".join(SCENARIOS))
+    parser.add_argument("--decks", type=int, default=4)
+    parser.add_argument("--slides", type=int, default=30, help="Slides per deck")
+    parser.add_argument("--questions", type=int, default=10, help="Questions per mode in the ask scenario")
+    parser.add_argument("--concurrency", default="1,4,16", help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=16, help="Requests per concurrency level")
+    parser.add_argument("--paraphrase-cache", action="store_true",
+                        help="Let similar (not just identical) questions share cached answers")
+    parser.add_argument("--embed-latency-ms", type=float, default=15.0)
+    parser.add_argument("--first-token-ms", type=float, default=150.0)
+    parser.add_argument("--tokens-per-second", type=float, default=60.0)
+    parser.add_argument("--answer-tokens", type=int, default=80)
+    parser.add_argument("--ollama-parallel", type=int, default=2, help="Requests the fake Ollama serves at once")
+    parser.add_argument("--output", default="benchmark-results.json")
+    parser.add_argument("--compare", help="Earlier results file to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative slowdown before flagging")
+    args = parser.parse_args()
+    args.concurrency = [int(level) for level in args.concurrency.split(",")]
+    scenarios = [name for name in args.scenarios.split(",") if name]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    fake_config = {
+        "embed_latency_ms": args.embed_latency_ms,
+        "first_token_ms": args.first_token_ms,
+        "tokens_per_second": args.tokens_per_second,
+        "answer_tokens": args.answer_tokens,
+        "parallel": args.ollama_parallel,
+    }
+    with tempfile.TemporaryDirectory(prefix="classroom-bench-") as workdir:
+        corpus = generate_corpus(os.path.join(workdir, "corpus"), args.decks, args.slides)
+        with FakeOllama(**fake_config) as fake, ServerProcess(workdir, fake.url, args.paraphrase_cache) as server:
+            results = asyncio.run(run_scenarios(server.url, scenarios, corpus, args))
+            fake_counts = dict(fake.counts)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "config": {
+            "decks": args.decks,
+            "slides_per_deck": args.slides,
+            "questions": args.questions,
+            "concurrency": args.concurrency,
+            "requests_per_level": args.requests,
+            "paraphrase_cache": args.paraphrase_cache,
+            "fake_ollama": fake_config,
+        },
+        "scenarios": {name: results[name] for name in scenarios},
+        "server_stats": results["server_stats"],
+        "fake_ollama_counts": fake_counts,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.tolerance:.0%} against {args.compare}")
+
+
+if __name__ == "__main__":
+    main()
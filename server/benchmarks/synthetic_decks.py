@@ -0,0 +1,140 @@
+"""
+Synthetic PPTX corpus generator for AI Classroom Co-Pilot benchmarks
+Writes any number of decks of any length on network security topics, deterministic for a seed,
+plus questions about the same topics so /ask benchmarks retrieve real matches
+
+Usage (from the repository root):
+    python -m server.benchmarks.synthetic_decks /tmp/decks --decks 10 --slides 40
+"""
+
+import argparse
+import os
+import random
+from typing import List, Tuple
+
+from pptx import Presentation
+from pptx.util import Inches, Pt
+
+TOPICS = {
+    "Firewalls": ["packet filtering", "stateful inspection", "access control lists", "DMZ",
+                  "application layer gateways", "default deny rules"],
+    "SYN floods": ["TCP handshake", "half-open connections", "SYN cookies", "backlog queue",
+                   "rate limiting", "spoofed source addresses"],
+    "ARP spoofing": ["ARP cache", "MAC addresses", "gratuitous ARP", "man-in-the-middle",
+                     "dynamic ARP inspection", "static ARP entries"],
+    "Encryption": ["symmetric keys", "public key cryptography", "AES", "RSA", "key exchange",
+                   "block cipher modes"],
+    "Hashing": ["SHA-256", "collision resistance", "password salting", "HMAC", "rainbow tables",
+                "digital signatures"],
+    "Intrusion detection": ["signature detection", "anomaly detection", "Snort rules", "false positives",
+                            "network sensors", "alert triage"],
+    "VPNs": ["IPsec tunnels", "TLS VPNs", "split tunneling", "authentication headers",
+             "encapsulating security payload", "site-to-site links"],
+    "DNS security": ["DNS cache poisoning", "DNSSEC", "zone transfers", "resolver hardening",
+                     "DNS tunneling", "response rate limiting"],
+    "Wireless security": ["WPA3", "rogue access points", "evil twin attacks", "802.1X",
+                          "handshake capture", "channel jamming"],
+    "Web attacks": ["SQL injection", "cross-site scripting", "CSRF tokens", "input validation",
+                    "prepared statements", "content security policy"],
+}
+
+SENTENCES = [
+    "{term} is a core idea when studying {topic}.",
+    "Administrators rely on {term} to reduce the risk posed by {other}.",
+    "A common exam question compares {term} with {other}.",
+    "{term} fails when {other} is misconfigured or ignored.",
+    "Lab exercises show how {term} behaves under real traffic.",
+    "Attackers often target weaknesses in {term} before moving on to {other}.",
+    "Logging {term} events helps incident responders reconstruct an attack.",
+]
+
+QUESTIONS = [
+    "What is {term}?",
+    "How does {term} relate to {topic}?",
+    "Explain {term} and why it matters for {topic}.",
+    "What is the difference between {term} and {other}?",
+    "How would you defend against attacks on {term}?",
+]
+
+
+def slide_text(topic: str, rng: random.Random) -> Tuple[str, List[str]]:
+    terms = TOPICS[topic]
+    term = rng.choice(terms)
+    bullets = []
+    for _ in range(rng.randint(3, 6)):
+        other = rng.choice([t for t in terms if t != term])
+        sentence = rng.choice(SENTENCES).format(term=term, other=other, topic=topic)
+        bullets.append(sentence[0].upper() + sentence[1:])
+    return f"{topic}: {term}", bullets
+
+
+def make_deck(path: str, topic: str, slides: int, rng: random.Random) -> int:
+    """Write one deck of title-and-bullets slides about a topic; returns the slide count"""
+    presentation = Presentation()
+    layout = presentation.slide_layouts[1]  # title and content
+    for _ in range(slides):
+        title, bullets = slide_text(topic, rng)
+        slide = presentation.slides.add_slide(layout)
+        slide.shapes.title.text = title
+        body = slide.placeholders[1].text_frame
+        body.text = bullets[0]
+        for bullet in bullets[1:]:
+            body.add_paragraph().text = bullet
+        notes = slide.shapes.add_textbox(Inches(0.5), Inches(6.8), Inches(9), Inches(0.5)).text_frame
+        notes.text = f"See the {topic} reading for more detail."
+        notes.paragraphs[0].font.size = Pt(10)
+    presentation.save(path)
+    return slides
+
+
+def generate_corpus(directory: str, decks: int = 5, slides_per_deck: int = 30,
+                    seed: int = 0) -> List[Tuple[str, str]]:
+    """
+    Write decks named "Week 01 - <topic>.pptx" and return (path, week title) pairs
+    The name follows the uploads-folder convention, so the file watcher derives the same week title
+    as the upload and its own ingest of an uploaded deck finds nothing to change
+    """
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(seed)
+    topics = list(TOPICS)
+    corpus = []
+    for index in range(decks):
+        topic = topics[index % len(topics)]
+        week_title = f"Week {index + 1:02d}"
+        path = os.path.join(directory, f"{week_title} - {topic}.pptx")
+        make_deck(path, topic, slides_per_deck, rng)
+        corpus.append((path, week_title))
+    return corpus
+
+
+def sample_questions(count: int, decks: int = len(TOPICS), seed: int = 1) -> List[str]:
+    """Distinct questions about the topics covered by the first `decks` decks, in a deterministic order"""
+    topics = list(TOPICS)[:max(1, min(decks, len(TOPICS)))]
+    candidates = []
+    for topic in topics:
+        for term in TOPICS[topic]:
+            for template in QUESTIONS:
+                other = next(t for t in TOPICS[topic] if t != term)
+                candidates.append(template.format(term=term, topic=topic, other=other))
+    random.Random(seed).shuffle(candidates)
+    # Past the distinct combinations, number the repeats so each question is still unique
+    return [candidates[n % len(candidates)] + (f" (part {n // len(candidates) + 1})" if n >= len(candidates) else "")
+            for n in range(count)]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory")
+    parser.add_argument("--decks", type=int, default=5)
+    parser.add_argument("--slides", type=int, default=30, help="Slides per deck")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    corpus = generate_corpus(args.directory, args.decks, args.slides, args.seed)
+    for path, week_title in corpus:
+        print(f"{week_title}: {path}")
+    print(f"Wrote {len(corpus)} decks, {len(corpus) * args.slides} slides")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Vector backend benchmark for AI Classroom Co-Pilot
+Loads the same synthetic unit vectors into each backend and reports load time, query latency,
+recall against exact search, vector bytes scanned per query and peak resident memory per backend
+A backend spec of numpy:float16 or numpy:int8 selects quantized storage with exact re-scoring;
+when chroma is benchmarked too, recall@k against its results is reported as recall_vs_chroma
+Each backend runs in its own process so peak RSS is measured separately
+
+Usage (from the repository root; no Ollama needed):
+    python -m server.benchmarks.vector_backends
+    python -m server.benchmarks.vector_backends --vectors 50000 --dim 768 --backends chroma,numpy
+    python -m server.benchmarks.vector_backends --backends chroma,numpy,numpy:float16,numpy:int8
+"""
+
+import argparse
+import multiprocessing
+import resource
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+from langchain_core.documents import Document
+
+from server.benchmarks.chunking import percentile
+
+
+def _synthetic_vectors(count: int, dim: int, seed: int) -> np.ndarray:
+    vectors = np.random.default_rng(seed).normal(size=(count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def run_backend(spec: str, vectors: int, dim: int, queries: int, k: int, batch_size: int,
+                rescore_factor: int) -> Dict[str, Any]:
+    """Child process entry point: load and query one backend in a scratch directory"""
+    from server import registry
+
+    name, _, quantization = spec.partition(":")
+    registry.VECTOR_QUANTIZATION = quantization or "none"
+    registry.VECTOR_RESCORE_FACTOR = rescore_factor
+
+    corpus = _synthetic_vectors(vectors, dim, seed=0)
+    probes = _synthetic_vectors(queries, dim, seed=1)
+    exact = np.argsort(-(probes @ corpus.T), axis=1)[:, :k]
+
+    with tempfile.TemporaryDirectory(prefix="vector-bench-") as persist_directory:
+        backend = registry.get_vector_backend(persist_directory, name=name)
+        started = time.perf_counter()
+        for start in range(0, vectors, batch_size):
+            end = min(start + batch_size, vectors)
+            backend.upsert(
+                [f"v{n}" for n in range(start, end)],
+                corpus[start:end].tolist(),
+                [Document(page_content=f"chunk {n}", metadata={"source": f"deck{n % 50}.pptx", "slide": n})
+                 for n in range(start, end)],
+            )
+        load_seconds = time.perf_counter() - started
+
+        latencies: List[float] = []
+        results: List[List[str]] = []
+        found = 0
+        for probe, expected in zip(probes, exact):
+            started = time.perf_counter()
+            hits = backend.query(probe.tolist(), k=k)
+            latencies.append((time.perf_counter() - started) * 1000)
+            results.append([doc_id for doc_id, *_ in hits])
+            found += len(set(results[-1]) & {f"v{n}" for n in expected})
+        search_bytes = backend.stats().get("search_bytes", vectors * dim * 4)
+
+    # ru_maxrss is reported in KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_mb = peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    return {
+        "load_s": round(load_seconds, 2),
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "recall": round(found / (len(probes) * k), 3),
+        "search_mb": round(search_bytes / (1024 * 1024), 1),
+        "peak_rss_mb": round(peak_mb, 1),
+        "results": results,
+    }
+
+
+def recall_against(results: List[List[str]], reference: List[List[str]]) -> float:
+    found = sum(len(set(hits) & set(expected)) for hits, expected in zip(results, reference))
+    total = sum(len(expected) for expected in reference)
+    return round(found / total, 3) if total else 0.0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", default="chroma,numpy,numpy:float16,numpy:int8",
+                        help="Comma-separated backend specs")
+    parser.add_argument("--vectors", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=768, help="768 matches nomic-embed-text")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=12, help="Candidates per query (RETRIEVAL_FETCH_K)")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--rescore-factor", type=int, default=4,
+                        help="Candidates re-scored per result for quantized storage")
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    rows = []
+    for spec in args.backends.split(","):
+        with context.Pool(1) as pool:
+            result = pool.apply(run_backend, (spec, args.vectors, args.dim, args.queries, args.k, args.batch_size,
+                                              args.rescore_factor))
+        rows.append((spec, result))
+        print(f"{spec}: { {key: value for key, value in result.items() if key != 'results'} }", flush=True)
+
+    columns = ["load_s", "p50_ms", "p95_ms", "recall", "search_mb", "peak_rss_mb"]
+    reference = dict(rows).get("chroma")
+    if reference:
+        columns.append("recall_vs_chroma")
+        for _, result in rows:
+            result["recall_vs_chroma"] = recall_against(result["results"], reference["results"])
+    print()
+    print(f"{'backend':<16}" + "".join(f"{column:>18}" for column in columns))
+    for spec, result in rows:
+        print(f"{spec:<16}" + "".join(f"{result[column]:>18}" for column in columns))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,303 @@
+"""
+Parallel bulk ingestion for the startup scan and large imports
+Three stages run concurrently:
+  1. a process pool parses decks with python-pptx
+  2. a shared EmbeddingBatcher sends adaptive, bounded-concurrency embed_documents batches to Ollama
+  3. a single writer thread commits embedded slides to the vector backend in large batches
+"""
+
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from server.ingest import (
+    ChunkPolicy,
+    EmbeddingBatcher,
+    _init_vector_store,
+    document_id,
+    file_sha256,
+    file_unchanged,
+    get_chunk_policy,
+    get_manifest,
+    manifest_entry,
+    mirror_lexical_delete,
+    mirror_lexical_upsert,
+    notify_index_changed,
+    plan_index_changes,
+    pptx_to_documents,
+    upsert_embedded_documents,
+)
+from server.metrics import INGEST_EMBED_SECONDS, INGEST_PARSE_SECONDS, INGEST_WRITE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+INGEST_WORKERS = int(os.environ.get("INGEST_WORKERS", str(min(4, os.cpu_count() or 1))))
+INGEST_EMBED_CONCURRENCY = int(os.environ.get("INGEST_EMBED_CONCURRENCY", "2"))
+INGEST_WRITE_BATCH_SIZE = int(os.environ.get("INGEST_WRITE_BATCH_SIZE", "512"))
+
+
+def _parse_deck(file_path: str, week_title: str, chunk_policy: ChunkPolicy) -> Dict[str, Any]:
+    """
+    Process pool entry point: parse and chunk one deck into picklable plain data
+    Metrics live in the parent process, so the parse time is returned for the caller to record
+    """
+    started = time.perf_counter()
+    slides = pptx_to_documents(file_path=file_path, week_title=week_title)
+    documents = chunk_policy.chunk(slides)
+    return {
+        "sha256": file_sha256(file_path),
+        "documents": documents,
+        "ids": [document_id(doc) for doc in documents],
+        "slides": slides,
+        "parse_seconds": time.perf_counter() - started,
+    }
+
+
+class _FileJob:
+    """Bookkeeping for one deck while its batches move through the pipeline"""
+
+    def __init__(self, file_path: str, week_title: str, stat: os.stat_result, entry: Optional[Dict[str, Any]]):
+        self.file_path = file_path
+        self.source = os.path.basename(file_path)
+        self.week_title = week_title
+        self.stat = stat
+        self.entry = entry
+        self.sha256: Optional[str] = None
+        self.documents = 0
+        self.new_slides = 0
+        self.stale_ids: List[str] = []
+        self.failed = False
+
+
+class _VectorWriter(threading.Thread):
+    """
+    Single writer that owns every vector store write during a bulk run
+    Buffers embedded slides from all decks and upserts them in large batches;
+    a finished deck is finalized (stale slides deleted, manifest updated) after its last rows are written
+    """
+
+    def __init__(self, persist_directory: str, vector_backend, manifest, batch_size: int, chunk_policy: ChunkPolicy):
+        super().__init__(name="bulk-ingest-writer", daemon=True)
+        self.persist_directory = persist_directory
+        self.vector_backend = vector_backend
+        self.manifest = manifest
+        self.batch_size = batch_size
+        self.chunk_policy = chunk_policy
+        self.queue: "queue.Queue" = queue.Queue()
+        self.slides_written = 0
+        self.slides_removed = 0
+        self.files_ingested = 0
+        self.write_seconds = 0.0
+        self._buffer: List[Tuple[_FileJob, List[str], List[List[float]], List[Any]]] = []
+        self._buffered_rows = 0
+        self._finished: List[_FileJob] = []
+
+    def submit(self, job: _FileJob, ids: List[str], embeddings: List[List[float]], documents: List[Any]) -> None:
+        self.queue.put(("rows", job, ids, embeddings, documents))
+
+    def finish(self, job: _FileJob) -> None:
+        """Mark a deck complete; queued after all of its rows, so it is finalized after they are written"""
+        self.queue.put(("finish", job))
+
+    def close(self) -> None:
+        self.queue.put(None)
+        self.join()
+
+    def run(self) -> None:
+        while True:
+            try:
+                item = self.queue.get(timeout=0.5)
+            except queue.Empty:
+                self._flush()
+                continue
+            if item is None:
+                self._flush()
+                return
+            if item[0] == "finish":
+                self._finished.append(item[1])
+                continue
+            _, job, ids, embeddings, documents = item
+            self._buffer.append((job, ids, embeddings, documents))
+            self._buffered_rows += len(ids)
+            if self._buffered_rows >= self.batch_size:
+                self._flush()
+
+    def _flush(self) -> None:
+        if self._buffer:
+            batch, self._buffer, self._buffered_rows = self._buffer, [], 0
+
+            ids, embeddings, documents = [], [], []
+            for _, batch_ids, batch_embeddings, batch_documents in batch:
+                ids.extend(batch_ids)
+                embeddings.extend(batch_embeddings)
+                documents.extend(batch_documents)
+
+            started = time.perf_counter()
+            try:
+                upsert_embedded_documents(self.vector_backend, ids, documents, embeddings)
+                mirror_lexical_upsert(self.persist_directory, ids, documents)
+                self.slides_written += len(ids)
+                INGEST_WRITE_SECONDS.observe((time.perf_counter() - started) / len(ids))
+            except Exception as e:
+                logger.error(f"Bulk ingest write of {len(ids)} slides failed: {e}")
+                for job, *_ in batch:
+                    job.failed = True
+            self.write_seconds += time.perf_counter() - started
+
+        finished, self._finished = self._finished, []
+        for job in finished:
+            self._finalize(job)
+
+    def _finalize(self, job: _FileJob) -> None:
+        if job.failed:
+            logger.error(f"Bulk ingest of '{job.source}' failed; it will be retried on the next scan.")
+            return
+        if job.stale_ids:
+            self.vector_backend.delete(job.stale_ids)
+            mirror_lexical_delete(self.persist_directory, job.stale_ids)
+            self.slides_removed += len(job.stale_ids)
+        self.manifest.record(job.source, manifest_entry(job.stat, job.sha256, job.week_title, job.documents,
+                                                        self.chunk_policy))
+        self.files_ingested += 1
+        if job.new_slides or job.stale_ids:
+            notify_index_changed(job.source)
+
+
+class BulkIngestor:
+    """
+    Ingests many decks at once with parallel parsing, concurrent embedding and batched writes
+    Uses the same manifest and deterministic IDs as ingest_pptx_to_chroma, so unchanged files are skipped
+    """
+
+    def __init__(self, persist_directory: str = "./chroma_db", workers: int = INGEST_WORKERS,
+                 embed_concurrency: int = INGEST_EMBED_CONCURRENCY, write_batch_size: int = INGEST_WRITE_BATCH_SIZE,
+                 chunk_policy: Optional[ChunkPolicy] = None, **batcher_options: Any):
+        self.persist_directory = persist_directory
+        self.chunk_policy = chunk_policy or get_chunk_policy()
+        self.workers = max(1, workers)
+        self.embed_concurrency = max(1, embed_concurrency)
+        self.write_batch_size = max(1, write_batch_size)
+        # Forwarded to EmbeddingBatcher, e.g. batch_size or target_latency
+        self.batcher_options = batcher_options
+
+    def run(self, files: List[Tuple[str, str]],
+            on_documents: Optional[Callable[[str, List[Any]], None]] = None) -> Dict[str, Any]:
+        """
+        Ingest (file_path, week_title) pairs and return throughput statistics
+        on_documents(file_path, slides) receives each parsed deck's slides, before chunking, as in
+        ingest_pptx_to_chroma; unchanged decks are not parsed
+        """
+        started = time.perf_counter()
+        manifest = get_manifest(self.persist_directory)
+        vector_backend, embeddings = _init_vector_store(persist_directory=self.persist_directory)
+
+        jobs: List[_FileJob] = []
+        skipped = 0
+        for file_path, week_title in files:
+            source = os.path.basename(file_path)
+            entry = manifest.get(source)
+            stat = os.stat(file_path)
+            unchanged, _ = file_unchanged(entry, stat, week_title, file_path, self.chunk_policy)
+            if unchanged:
+                skipped += 1
+                continue
+            jobs.append(_FileJob(file_path, week_title, stat, entry))
+
+        logger.info(f"Bulk ingest: {len(jobs)} decks to process, {skipped} unchanged "
+                    f"({self.workers} parse workers, {self.embed_concurrency} embedding requests in flight).")
+
+        writer = _VectorWriter(self.persist_directory, vector_backend, manifest, self.write_batch_size, self.chunk_policy)
+        writer.start()
+        batcher = EmbeddingBatcher(embeddings, max_in_flight=self.embed_concurrency, **self.batcher_options)
+        slides_embedded = 0
+        embed_seconds = 0.0
+        embed_lock = threading.Lock()
+
+        def embed_deck(job: _FileJob, ids: List[str], documents: List[Any]) -> None:
+            """Embed one deck through the shared batcher, streaming each batch to the writer"""
+            nonlocal slides_embedded, embed_seconds
+            deck_started = time.perf_counter()
+            embedded = 0
+
+            def write_batch(start: int, end: int, vectors: List[List[float]]) -> None:
+                nonlocal embedded
+                embedded += end - start
+                writer.submit(job, ids[start:end], vectors, documents[start:end])
+
+            try:
+                batcher.embed([doc.page_content for doc in documents], on_batch=write_batch)
+            except Exception as e:
+                logger.error(f"Embedding '{job.source}' failed after retries: {e}")
+                job.failed = True
+            deck_seconds = time.perf_counter() - deck_started
+            if embedded:
+                INGEST_EMBED_SECONDS.observe(deck_seconds / embedded)
+            with embed_lock:
+                embed_seconds += deck_seconds
+                slides_embedded += embedded
+            writer.finish(job)
+
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=context) as parse_pool, \
+                ThreadPoolExecutor(max_workers=self.embed_concurrency, thread_name_prefix="bulk-embed") as embed_pool:
+            parse_futures = {parse_pool.submit(_parse_deck, job.file_path, job.week_title, self.chunk_policy): job for job in jobs}
+            embed_futures = []
+            # Back-pressure: parsed decks wait here rather than queueing unbounded embedding work
+            max_queued_decks = self.embed_concurrency * 4
+
+            for future in as_completed(parse_futures):
+                job = parse_futures[future]
+                try:
+                    parsed = future.result()
+                except Exception as e:
+                    logger.error(f"Failed to parse '{job.source}': {e}")
+                    job.failed = True
+                    continue
+
+                if parsed["slides"]:
+                    INGEST_PARSE_SECONDS.observe(parsed["parse_seconds"] / len(parsed["slides"]))
+                if on_documents:
+                    on_documents(job.file_path, parsed["slides"])
+                job.sha256 = parsed["sha256"]
+                job.documents = len(parsed["documents"])
+                new_ids, new_documents, job.stale_ids = plan_index_changes(
+                    vector_backend, job.source, job.week_title, job.entry, parsed["ids"], parsed["documents"]
+                )
+                job.new_slides = len(new_documents)
+
+                if not new_documents:
+                    writer.finish(job)
+                    continue
+                while len(embed_futures) >= max_queued_decks:
+                    wait(embed_futures, return_when=FIRST_COMPLETED)
+                    embed_futures = [f for f in embed_futures if not f.done()]
+                embed_futures.append(embed_pool.submit(embed_deck, job, new_ids, new_documents))
+
+            wait(embed_futures)
+
+        batcher.close()
+        writer.close()
+        failed_sources = [job.source for job in jobs if job.failed]
+
+        elapsed = time.perf_counter() - started
+        stats = {
+            "files_total": len(files),
+            "files_skipped": skipped,
+            "files_ingested": writer.files_ingested,
+            "files_failed": len(failed_sources),
+            "failed_sources": failed_sources,
+            "slides_written": writer.slides_written,
+            "slides_removed": writer.slides_removed,
+            "embed_seconds": round(embed_seconds, 3),
+            "write_seconds": round(writer.write_seconds, 3),
+            "seconds": round(elapsed, 3),
+            "slides_per_second": round(slides_embedded / elapsed, 2) if elapsed > 0 else 0.0,
+        }
+        logger.info(f"Bulk ingest finished: {stats}")
+        return stats
+
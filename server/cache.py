@@ -0,0 +1,199 @@
+"""
+In-process caches for the AI Classroom Co-Pilot RAG pipeline
+Repeated review questions skip work that would produce the same result
+"""
+
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+QUERY_EMBEDDING_CACHE_SIZE = int(os.environ.get("QUERY_EMBEDDING_CACHE_SIZE", "2048"))
+QUERY_EMBEDDING_CACHE_TTL = float(os.environ.get("QUERY_EMBEDDING_CACHE_TTL", "3600"))
+ANSWER_CACHE_SIZE = int(os.environ.get("ANSWER_CACHE_SIZE", "1024"))
+ANSWER_CACHE_SIMILARITY = float(os.environ.get("ANSWER_CACHE_SIMILARITY", "0.95"))
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_question(text: str) -> str:
+    """
+    Canonical form of a question used as a cache key
+    Case, repeated whitespace and trailing punctuation do not change the meaning
+    """
+    return _WHITESPACE.sub(" ", text).strip().rstrip("?!. ").lower()
+
+
+def filter_scope(filters: Optional[Dict[str, Any]]) -> str:
+    """Stable cache scope for retrieval filters; the same question asked within another module is a different entry"""
+    if not filters:
+        return ""
+    return "&".join(f"{field}={filters[field]}" for field in sorted(filters))
+
+
+class QueryEmbeddingCache:
+    """
+    Bounded LRU cache of query embeddings with a time-to-live
+    Keys are normalized question text; safe to share across threads
+    """
+
+    def __init__(self, max_entries: int = QUERY_EMBEDDING_CACHE_SIZE,
+                 ttl_seconds: float = QUERY_EMBEDDING_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, text: str) -> Optional[List[float]]:
+        """Return the cached embedding for text, or None if absent or expired"""
+        key = normalize_question(text)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, text: str, embedding: List[float]) -> None:
+        """Store an embedding, evicting the least recently used entry when full"""
+        if self.max_entries <= 0:
+            return
+        key = normalize_question(text)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, embedding)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+class SemanticAnswerCache:
+    """
+    Cache of generated answers looked up by question embedding
+    A new question reuses a stored answer when its cosine similarity to a previously
+    answered question reaches the threshold. Every entry belongs to a corpus generation;
+    invalidate() starts a new generation whenever the slide index changes.
+    Entries are also scoped by the retrieval filters they were answered with, and only
+    questions in the same scope can match each other.
+    """
+
+    def __init__(self, similarity_threshold: float = ANSWER_CACHE_SIMILARITY,
+                 max_entries: int = ANSWER_CACHE_SIZE):
+        self.similarity_threshold = similarity_threshold
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str], tuple]" = OrderedDict()
+        # Per scope: the keys and stacked unit embeddings searched by lookup, rebuilt after a store
+        self._matrices: Dict[str, Tuple[List[Tuple[str, str]], np.ndarray]] = {}
+        self._lock = threading.Lock()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _unit(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, question: str, embedding: Optional[List[float]],
+               scope: str = "") -> Optional[Tuple[Dict[str, Any], float]]:
+        """
+        Return (answer payload, similarity) for the closest cached question in the same scope,
+        or None when nothing is similar enough; without an embedding only exact matches are found
+        """
+        key = (scope, normalize_question(question))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1], 1.0
+
+            if self._entries and embedding is not None:
+                if scope not in self._matrices:
+                    keys = [k for k in self._entries if k[0] == scope]
+                    self._matrices[scope] = (keys, np.stack([self._entries[k][0] for k in keys]) if keys else None)
+                keys, matrix = self._matrices[scope]
+                if keys:
+                    similarities = matrix @ self._unit(embedding)
+                    best = int(np.argmax(similarities))
+                    if similarities[best] >= self.similarity_threshold:
+                        best_key = keys[best]
+                        self._entries.move_to_end(best_key)
+                        self.hits += 1
+                        return self._entries[best_key][1], float(similarities[best])
+
+            self.misses += 1
+            return None
+
+    def contains(self, question: str, scope: str = "") -> bool:
+        """Whether this exact question has a cached answer; unlike lookup it does not count a hit or miss"""
+        with self._lock:
+            return (scope, normalize_question(question)) in self._entries
+
+    def store(self, question: str, embedding: List[float], payload: Dict[str, Any],
+              generation: int, scope: str = "") -> bool:
+        """
+        Remember an answer produced while the corpus was at the given generation
+        Answers that raced with an index change are dropped
+        """
+        if self.max_entries <= 0:
+            return False
+        key = (scope, normalize_question(question))
+        with self._lock:
+            if generation != self.generation:
+                return False
+            self._entries[key] = (self._unit(embedding), payload)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._matrices.clear()
+            return True
+
+    def invalidate(self) -> None:
+        """Drop every cached answer; called whenever course materials change"""
+        with self._lock:
+            self._entries.clear()
+            self._matrices.clear()
+            self.generation += 1
+            self.invalidations += 1
+        logger.info("Semantic answer cache invalidated after a course material change")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "similarity_threshold": self.similarity_threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+            }
@@ -0,0 +1,24 @@
+"""
+Bounded executor for blocking work called from async request handlers
+Chroma, SQLite and python-pptx calls run here so they never stall the event loop
+"""
+
+import asyncio
+import functools
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on blocking calls running at once; extra calls wait for a free thread
+BLOCKING_WORKERS = int(os.environ.get("BLOCKING_WORKERS", "8"))
+
+_executor = ThreadPoolExecutor(max_workers=BLOCKING_WORKERS, thread_name_prefix="blocking")
+
+
+async def run_blocking(func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """Run a synchronous callable on the shared executor and await its result"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
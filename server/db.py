@@ -0,0 +1,179 @@
+"""
+SQLite access layer for AI Classroom Co-Pilot
+A small thread-safe pool of long-lived WAL connections plus versioned schema migrations
+"""
+
+import logging
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Iterator, List
+
+logger = logging.getLogger(__name__)
+
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "8"))
+DB_BUSY_TIMEOUT_MS = int(os.environ.get("DB_BUSY_TIMEOUT_MS", "5000"))
+
+# Compiled statements are cached per connection and keyed by SQL text; because pooled
+# connections live for the whole process, repeated queries skip re-preparing
+STATEMENT_CACHE_SIZE = 256
+
+# Each entry is one schema version; PRAGMA user_version records how many have been applied
+MIGRATIONS: List[List[str]] = [
+    # 1: original schema
+    [
+        """
+        CREATE TABLE IF NOT EXISTS faqs (
+            question TEXT PRIMARY KEY,
+            answer TEXT NOT NULL,
+            ask_count INTEGER NOT NULL DEFAULT 1,
+            last_asked TEXT NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS materials (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            filename TEXT NOT NULL,
+            week_title TEXT NOT NULL,
+            uploaded_at TEXT NOT NULL,
+            size_bytes INTEGER NOT NULL
+        )
+        """,
+    ],
+    # 2: indexes for the watcher's filename lookup, /materials ordering and /faqs ranking
+    [
+        "CREATE INDEX IF NOT EXISTS idx_materials_filename ON materials(filename)",
+        "CREATE INDEX IF NOT EXISTS idx_materials_uploaded ON materials(uploaded_at, id)",
+        "CREATE INDEX IF NOT EXISTS idx_faqs_rank ON faqs(ask_count DESC, last_asked DESC)",
+    ],
+    # 3: persistent queue of upload ingest jobs
+    [
+        """
+        CREATE TABLE IF NOT EXISTS ingest_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            material_id INTEGER,
+            file_path TEXT NOT NULL,
+            week_title TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            slides_total INTEGER,
+            slides_processed INTEGER NOT NULL DEFAULT 0,
+            error TEXT,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT NOT NULL,
+            started_at TEXT,
+            finished_at TEXT
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_ingest_jobs_status ON ingest_jobs(status, id)",
+    ],
+    # 4: SHA-256 of each uploaded deck, computed while the upload streams to disk
+    [
+        "ALTER TABLE materials ADD COLUMN content_hash TEXT",
+    ],
+    # 5: slide text extracted at ingest, so viewing a deck never re-parses the PPTX
+    [
+        """
+        CREATE TABLE IF NOT EXISTS slides (
+            material_id INTEGER NOT NULL,
+            slide INTEGER NOT NULL,
+            content TEXT NOT NULL,
+            PRIMARY KEY (material_id, slide)
+        ) WITHOUT ROWID
+        """,
+        "ALTER TABLE materials ADD COLUMN slides_hash TEXT",
+    ],
+    # 6: which process runs an ingest job and when it last checked in, so only abandoned jobs are requeued
+    [
+        "ALTER TABLE ingest_jobs ADD COLUMN owner TEXT",
+        "ALTER TABLE ingest_jobs ADD COLUMN heartbeat_at TEXT",
+        "CREATE INDEX IF NOT EXISTS idx_ingest_jobs_material ON ingest_jobs(material_id, id)",
+    ],
+    # 7: job progress counts the chunks the chunk policy produced, not slides
+    [
+        "ALTER TABLE ingest_jobs RENAME COLUMN slides_total TO chunks_total",
+        "ALTER TABLE ingest_jobs RENAME COLUMN slides_processed TO chunks_processed",
+    ],
+]
+
+
+class ConnectionPool:
+    """
+    Fixed-size pool of SQLite connections shared across threads
+    WAL journaling lets readers proceed while a writer commits, and the busy timeout
+    makes concurrent writers wait for the lock instead of failing immediately
+    """
+
+    def __init__(self, path: str, size: int = DB_POOL_SIZE, busy_timeout_ms: int = DB_BUSY_TIMEOUT_MS):
+        self.path = path
+        self.size = max(1, size)
+        self.busy_timeout_ms = busy_timeout_ms
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.busy_timeout_ms / 1000,
+            check_same_thread=False,
+            cached_statements=STATEMENT_CACHE_SIZE,
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+        return conn
+
+    def _acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                try:
+                    return self._connect()
+                except Exception:
+                    self._created -= 1
+                    raise
+        # Pool exhausted: wait for another thread to return a connection
+        return self._idle.get(timeout=self.busy_timeout_ms / 1000)
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """
+        Borrow a connection for one unit of work
+        Commits on success, rolls back on error, and always returns the connection to the pool
+        """
+        conn = self._acquire()
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self._idle.put(conn)
+
+    def migrate(self) -> int:
+        """Apply pending migrations and return the resulting schema version"""
+        with self.connection() as conn:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            for number, statements in enumerate(MIGRATIONS[version:], start=version + 1):
+                for statement in statements:
+                    conn.execute(statement)
+                conn.execute(f"PRAGMA user_version={number}")
+                logger.info(f"Applied database migration {number}")
+            return max(version, len(MIGRATIONS))
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._lock:
+            self._created = 0
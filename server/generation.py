@@ -3,30 +3,109 @@ Answer Generation System for AI Classroom Co-Pilot
 Responsible for taking retrieved context and generating answers with citations
 """
 
-import ollama
-from typing import List, Dict, Any
+import asyncio
+import math
+import os
+import time
+from contextlib import AsyncExitStack
+from typing import List, Dict, Any, Iterator, AsyncIterator, Optional, Tuple
 import logging
+from langchain_core.documents import Document
+from server import registry
+from server.admission import PRIORITY_STUDENT, Admission, AdmissionController
+from server.cache import SemanticAnswerCache, filter_scope, normalize_question
+from server.deadline import DEADLINE_GENERATION_SHARE, Deadline
+from server.metrics import DEADLINE_FALLBACKS, ERRORS, LLM_GENERATION_SECONDS
 from server.retrieval import SlideRetriever
+from server.singleflight import AsyncSingleFlight, SingleFlight, StreamFlight
+from server.vector_backends import MetadataFilter
 
 logger = logging.getLogger(__name__)
 
+# Under a deadline, generation is capped at the tokens the model can produce in the time left,
+# starting from this speed guess and refined from Ollama's eval stats, up to GENERATION_MAX_TOKENS.
+# GENERATION_MIN_TOKENS is the shortest usable answer: when the time left cannot fit it, Ollama is not
+# called at all and the extractive fallback answers
+GENERATION_TOKENS_PER_SECOND = float(os.environ.get("GENERATION_TOKENS_PER_SECOND", "25"))
+GENERATION_MIN_TOKENS = int(os.environ.get("GENERATION_MIN_TOKENS", "256"))
+GENERATION_MAX_TOKENS = int(os.environ.get("GENERATION_MAX_TOKENS", "512"))
+# Extractive fallback answers quote this many top slides, each cut to this many characters
+FALLBACK_REFERENCES = int(os.environ.get("FALLBACK_REFERENCES", "3"))
+FALLBACK_EXCERPT_CHARS = int(os.environ.get("FALLBACK_EXCERPT_CHARS", "280"))
+FALLBACK_MODEL = "extractive"
+
 
 class AnswerGenerator:
+    GENERATION_OPTIONS = {
+        'temperature': 0.1,  # Low temperature for consistent, factual answers
+        'top_p': 0.9,
+    }
+
     def __init__(self, model: str = "llama3:8b"):
         """Initialize the answer generator with local LLM"""
         self.model = model
-        self.client = ollama.Client(host='http://localhost:11434')
+        # Shared clients so concurrent requests reuse one HTTP connection pool
+        self.client = registry.get_ollama_client()
+        self.async_client = registry.get_async_ollama_client()
+        self.tokens_per_second = GENERATION_TOKENS_PER_SECOND
         logger.info(f"AnswerGenerator initialized with model: {model}")
 
-    def generate_answer(self, question: str, context: str) -> Dict[str, Any]:
+    def token_budget(self, seconds: Optional[float]) -> Optional[int]:
+        """Tokens the model is expected to produce in this many seconds; None (no cap) without a limit"""
+        if seconds is None or math.isinf(seconds):
+            return None
+        return int(min(GENERATION_MAX_TOKENS, seconds * self.tokens_per_second))
+
+    @staticmethod
+    def fits_answer(max_tokens: Optional[int]) -> bool:
+        """Whether a token cap leaves room for a usable answer (GENERATION_MIN_TOKENS)"""
+        return max_tokens is None or max_tokens >= GENERATION_MIN_TOKENS
+
+    def _options(self, max_tokens: Optional[int]) -> Dict[str, Any]:
+        if max_tokens is None:
+            return self.GENERATION_OPTIONS
+        return {**self.GENERATION_OPTIONS, 'num_predict': max_tokens}
+
+    def _observe_speed(self, response) -> None:
+        """Refine tokens_per_second from a finished response's eval_count and eval_duration (nanoseconds)"""
+        try:
+            count, duration = response.get('eval_count'), response.get('eval_duration')
+        except AttributeError:
+            return
+        if isinstance(count, (int, float)) and isinstance(duration, (int, float)) and count > 0 and duration > 0:
+            self.tokens_per_second += 0.2 * (count / (duration / 1e9) - self.tokens_per_second)
+
+    @staticmethod
+    def _truncated(response, max_tokens: Optional[int]) -> bool:
+        """Whether Ollama stopped at the token cap rather than at the end of the answer"""
+        try:
+            done_reason, count = response.get('done_reason'), response.get('eval_count')
+        except AttributeError:
+            return False
+        if done_reason == 'length':
+            return True
+        return max_tokens is not None and isinstance(count, (int, float)) and count >= max_tokens
+
+    @staticmethod
+    def extractive_answer(documents: List[Tuple[Document, float]]) -> str:
         """
-        Generate an answer using retrieved context and local LLM
-        Ensures answers are based on course materials with proper citations
+        Answer quoting the top retrieved slides with their citations
+        Used when the LLM cannot finish within the request deadline
         """
-        logger.info(f"Generating answer for question: '{question}'")
+        if not documents:
+            return "I couldn't finish an answer in time, and no relevant course materials were found."
 
-        # Build prompt that emphasizes citation and accuracy
-        prompt = f"""You are an AI teaching assistant. Use the following course materials to answer the student's question.
+        parts = ["I couldn't finish a full answer in time. Here is what the most relevant course slides say:"]
+        for index, (document, _) in enumerate(documents[:FALLBACK_REFERENCES]):
+            excerpt = " ".join(document.page_content.split())
+            if len(excerpt) > FALLBACK_EXCERPT_CHARS:
+                excerpt = excerpt[:FALLBACK_EXCERPT_CHARS].rsplit(" ", 1)[0] + "..."
+            parts.append(f"{index + 1}. {excerpt} ({SlideRetriever.format_citation(document.metadata)})")
+        return "\n\n".join(parts)
+
+    def build_prompt(self, question: str, context: str) -> str:
+        """Build the prompt that emphasizes citation and accuracy"""
+        return f"""You are an AI teaching assistant. Use the following course materials to answer the student's question.
 
 {context}
 
@@ -40,33 +119,129 @@ INSTRUCTIONS:
 
 ANSWER:"""
 
+    def generate_answer(self, question: str, context: str) -> Dict[str, Any]:
+        """
+        Generate an answer using retrieved context and local LLM
+        Ensures answers are based on course materials with proper citations
+        """
+        logger.info(f"Generating answer for question: '{question}'")
+
+        prompt = self.build_prompt(question, context)
+
         try:
             # Generate answer using local LLM
+            started = time.perf_counter()
             response = self.client.generate(
                 model=self.model,
                 prompt=prompt,
-                options={
-                    'temperature': 0.1,  # Low temperature for consistent, factual answers
-                    'top_p': 0.9,
-                }
+                options=self.GENERATION_OPTIONS
             )
 
             answer = response['response']
+            LLM_GENERATION_SECONDS.observe(time.perf_counter() - started, "complete")
             logger.info("Answer generated successfully")
 
             return {
                 "answer": answer,
                 "context_used": context,
-                "model_used": self.model
+                "model_used": self.model,
+                "truncated": self._truncated(response, None),
             }
 
         except Exception as e:
+            ERRORS.inc("generation")
             logger.error(f"Error generating answer: {e}")
             return {
                 "answer": "I'm sorry, I encountered an error while generating an answer.",
                 "error": str(e)
             }
 
+    def stream_answer(self, question: str, context: str) -> Iterator[str]:
+        """
+        Generate an answer token by token as Ollama produces it
+        Lets the caller forward partial output before generation finishes
+        """
+        logger.info(f"Streaming answer for question: '{question}'")
+
+        prompt = self.build_prompt(question, context)
+        started = time.perf_counter()
+        for chunk in self.client.generate(
+            model=self.model,
+            prompt=prompt,
+            options=self.GENERATION_OPTIONS,
+            stream=True
+        ):
+            token = chunk['response']
+            if token:
+                yield token
+
+        LLM_GENERATION_SECONDS.observe(time.perf_counter() - started, "stream")
+        logger.info("Answer streamed successfully")
+
+    async def agenerate_answer(self, question: str, context: str, max_tokens: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Async variant of generate_answer using the shared async Ollama client
+        max_tokens caps the answer length (Ollama's num_predict)
+        """
+        logger.info(f"Generating answer for question: '{question}'")
+
+        prompt = self.build_prompt(question, context)
+
+        try:
+            started = time.perf_counter()
+            response = await self.async_client.generate(
+                model=self.model,
+                prompt=prompt,
+                options=self._options(max_tokens)
+            )
+
+            answer = response['response']
+            LLM_GENERATION_SECONDS.observe(time.perf_counter() - started, "complete")
+            self._observe_speed(response)
+            logger.info("Answer generated successfully")
+
+            return {
+                "answer": answer,
+                "context_used": context,
+                "model_used": self.model,
+                "truncated": self._truncated(response, max_tokens),
+            }
+
+        except Exception as e:
+            ERRORS.inc("generation")
+            logger.error(f"Error generating answer: {e}")
+            return {
+                "answer": "I'm sorry, I encountered an error while generating an answer.",
+                "error": str(e)
+            }
+
+    async def astream_answer(self, question: str, context: str, max_tokens: Optional[int] = None,
+                             outcome: Optional[Dict[str, Any]] = None) -> AsyncIterator[str]:
+        """
+        Async variant of stream_answer using the shared async Ollama client; max_tokens as in agenerate_answer
+        outcome, if given, gets "truncated" set once the stream ends
+        """
+        logger.info(f"Streaming answer for question: '{question}'")
+
+        prompt = self.build_prompt(question, context)
+        started = time.perf_counter()
+        async for chunk in await self.async_client.generate(
+            model=self.model,
+            prompt=prompt,
+            options=self._options(max_tokens),
+            stream=True
+        ):
+            if chunk.get('done'):
+                self._observe_speed(chunk)
+                if outcome is not None:
+                    outcome["truncated"] = self._truncated(chunk, max_tokens)
+            token = chunk['response']
+            if token:
+                yield token
+
+        LLM_GENERATION_SECONDS.observe(time.perf_counter() - started, "stream")
+        logger.info("Answer streamed successfully")
+
 
 class RetrievalAugmentedGeneration:
     """
@@ -77,27 +252,55 @@ class RetrievalAugmentedGeneration:
     def __init__(self, persist_directory: str):
         self.retriever = SlideRetriever(persist_directory=persist_directory)
         self.generator = AnswerGenerator()
+        # Repeated or paraphrased questions are answered from here without calling the LLM
+        self.answer_cache = SemanticAnswerCache()
+        # Identical questions asked while one is being answered share that answer (or its token stream)
+        self.inflight = SingleFlight()
+        self.ainflight = AsyncSingleFlight()
+        self.inflight_streams = StreamFlight()
+        # Caps concurrent LLM generations; excess requests queue by priority or are rejected
+        self.admission = AdmissionController()
         logger.info("RAG pipeline initialized")
 
-    def ask_question(self, question: str) -> Dict[str, Any]:
+    @staticmethod
+    def _flight_key(question: str, filters: Optional[MetadataFilter], priority: int = PRIORITY_STUDENT) -> tuple:
         """
-        Complete RAG pipeline: retrieve relevant content and generate answer
+        Requests coalesce only at the same priority, so an instructor never joins (and inherits the queue
+        position of) a student's in-flight question
         """
-        logger.info(f"Processing question: '{question}'")
+        return priority, filter_scope(filters), normalize_question(question)
 
-        # Step 1: Retrieve relevant content
-        retrieval_result = self.retriever.retrieve_relevant_content(question)
+    @staticmethod
+    def _as_coalesced(question: str, result: Dict[str, Any]) -> Dict[str, Any]:
+        """A shared result or event, relabelled with this request's own wording of the question"""
+        return {**result, "question": question, "coalesced": True}
 
-        # Step 2: Generate answer using retrieved context
-        generation_result = self.generator.generate_answer(
-            question,
-            retrieval_result['context']
-        )
+    def check_admission(self, question: str, filters: Optional[MetadataFilter] = None,
+                        priority: int = PRIORITY_STUDENT) -> None:
+        """
+        Raise AdmissionRejected now if this question would need a generation slot it cannot get in time
+        Lets the endpoints answer 429 before any embedding, search or event stream; exact cached answers
+        and questions already being answered at this priority need no slot
+        """
+        key = self._flight_key(question, filters, priority)
+        if self.inflight_streams.in_flight(key) or self.ainflight.in_flight(key):
+            return
+        if self.answer_cache.contains(question, scope=filter_scope(filters)):
+            return
+        self.admission.check(priority)
 
-        # Combine results
-        # Serialize documents into JSON-safe structures: [ {page_content, metadata}, score ]
+    def coalescing_stats(self) -> Dict[str, Any]:
+        return {
+            "answers": self.inflight.stats(),
+            "async_answers": self.ainflight.stats(),
+            "streams": self.inflight_streams.stats(),
+        }
+
+    @staticmethod
+    def _serialize_documents(documents) -> List[Any]:
+        """Serialize documents into JSON-safe structures: [ {page_content, metadata}, score ]"""
         serialized_documents = []
-        for doc, score in retrieval_result["documents"]:
+        for doc, score in documents:
             try:
                 serialized_documents.append([
                     {
@@ -108,23 +311,331 @@ class RetrievalAugmentedGeneration:
                 ])
             except Exception:
                 continue
+        return serialized_documents
 
-        final_result = {
+    def _combine_results(self, question: str, retrieval_result: Dict[str, Any],
+                         generation_result: Dict[str, Any]) -> Dict[str, Any]:
+        """Merge retrieval and generation output into the /ask response shape"""
+        return {
             "question": question,
             "answer": generation_result['answer'],
             "documents_retrieved": retrieval_result['documents_found'],
             "retrieval_context": retrieval_result['context'],
-            "documents": serialized_documents,
-            "model_used": generation_result.get('model_used', 'gpt-oss')
+            "documents": self._serialize_documents(retrieval_result["documents"]),
+            "model_used": generation_result.get('model_used', 'gpt-oss'),
+            "context_tokens": retrieval_result.get("context_tokens"),
+            "tokens_saved": retrieval_result.get("tokens_saved", 0),
+            "truncated": generation_result.get("truncated", False),
+        }
+
+    def _fallback_result(self, question: str, retrieval_result: Dict[str, Any], deadline: Deadline) -> Dict[str, Any]:
+        """Extractive answer from the retrieved slides, flagged as a fallback; never cached"""
+        logger.warning(f"Answer to '{question}' missed its {deadline.seconds:.1f}s deadline; "
+                       f"returning an extractive answer")
+        DEADLINE_FALLBACKS.inc()
+        generation_result = {"answer": self.generator.extractive_answer(retrieval_result["documents"]),
+                             "model_used": FALLBACK_MODEL}
+        return {**self._combine_results(question, retrieval_result, generation_result), "fallback": True}
+
+    def _cached_answer(self, question: str, query_embedding: Optional[List[float]],
+                       filters: Optional[MetadataFilter] = None) -> Optional[Dict[str, Any]]:
+        """Return a previously generated result for a similar question asked with the same filters, if any"""
+        cached = self.answer_cache.lookup(question, query_embedding, scope=filter_scope(filters))
+        if cached is None:
+            return None
+        payload, similarity = cached
+        logger.info(f"Answer cache hit (similarity {similarity:.3f}) for question: '{question}'")
+        return {**payload, "question": question, "cached": True, "cache_similarity": similarity}
+
+    def _remember_answer(self, question: str, query_embedding: Optional[List[float]], final_result: Dict[str, Any],
+                         generation_result: Dict[str, Any], cache_generation: int,
+                         filters: Optional[MetadataFilter] = None) -> None:
+        """Cache a successful answer; failures and answers cut off at the token cap are never replayed"""
+        if "error" in generation_result or generation_result.get("truncated") or query_embedding is None:
+            return
+        self.answer_cache.store(question, query_embedding, final_result, cache_generation, scope=filter_scope(filters))
+
+    @staticmethod
+    def _citations_event(question: str, documents_retrieved: int, documents: List[Any]) -> Dict[str, Any]:
+        return {
+            "event": "citations",
+            "data": {
+                "question": question,
+                "documents_retrieved": documents_retrieved,
+                "documents": documents,
+            }
         }
 
+    @staticmethod
+    def _done_event(question: str, answer: str, documents_retrieved: int, model_used: str,
+                    started: float, first_token_at: Optional[float], cached: bool = False,
+                    queue_seconds: float = 0.0, fallback: bool = False, truncated: bool = False) -> Dict[str, Any]:
+        finished = time.perf_counter()
+        return {
+            "event": "done",
+            "data": {
+                "question": question,
+                "answer": answer,
+                "documents_retrieved": documents_retrieved,
+                "model_used": model_used,
+                "cached": cached,
+                "time_to_first_token": (first_token_at - started) if first_token_at else None,
+                "total_time": finished - started,
+                "queue_seconds": queue_seconds,
+                "fallback": fallback,
+                "truncated": truncated,
+            }
+        }
+
+    def _cached_events(self, cached_result: Dict[str, Any], started: float) -> List[Dict[str, Any]]:
+        """Replay a cached answer as the same citations/token/done event sequence"""
+        question = cached_result["question"]
+        return [
+            self._citations_event(question, cached_result["documents_retrieved"], cached_result["documents"]),
+            {"event": "token", "data": {"text": cached_result["answer"]}},
+            self._done_event(question, cached_result["answer"], cached_result["documents_retrieved"],
+                             cached_result["model_used"], started, time.perf_counter(), cached=True),
+        ]
+
+    def ask_question(self, question: str, filters: Optional[MetadataFilter] = None) -> Dict[str, Any]:
+        """
+        Complete RAG pipeline: retrieve relevant content and generate answer
+        Optional metadata filters (module, source) limit retrieval to part of the course
+        A question identical to one already being answered waits for that answer instead
+        """
+        result, shared = self.inflight.run(self._flight_key(question, filters),
+                                           lambda: self._ask_question(question, filters))
+        return self._as_coalesced(question, result) if shared else result
+
+    def _ask_question(self, question: str, filters: Optional[MetadataFilter]) -> Dict[str, Any]:
+        logger.info(f"Processing question: '{question}'")
+        cache_generation = self.answer_cache.generation
+
+        # Step 1: Reuse an earlier answer to the same or a paraphrased question
+        query_embedding = self.retriever.embed_query(question)
+        cached_result = self._cached_answer(question, query_embedding, filters)
+        if cached_result is not None:
+            return cached_result
+
+        # Step 2: Retrieve relevant content
+        retrieval_result = self.retriever.retrieve_relevant_content(question, filters=filters)
+
+        # Step 3: Generate answer using retrieved context
+        generation_result = self.generator.generate_answer(
+            question,
+            retrieval_result['context']
+        )
+
+        # Combine results
+        final_result = self._combine_results(question, retrieval_result, generation_result)
+        self._remember_answer(question, query_embedding, final_result, generation_result, cache_generation, filters)
+
         logger.info(f"RAG pipeline completed. Retrieved {retrieval_result['documents_found']} documents.")
         return final_result
 
+    async def aask_question(self, question: str, filters: Optional[MetadataFilter] = None,
+                            priority: int = PRIORITY_STUDENT) -> Dict[str, Any]:
+        """
+        Async RAG pipeline with the same result as ask_question
+        Nothing here blocks the event loop, so concurrent questions are served in parallel,
+        and identical in-flight questions share one retrieval and generation
+        Generation waits for an admission slot at the given priority and raises AdmissionRejected
+        when the wait would exceed the latency SLO
+        Embedding, search and generation share one ASK_DEADLINE_SECONDS budget (time queued for a slot
+        excluded); an answer that cannot be generated within it is replaced by an extractive one flagged
+        "fallback", and one cut off at the token cap is flagged "truncated" and not cached
+        """
+        result, shared = await self.ainflight.run(self._flight_key(question, filters, priority),
+                                                  lambda: self._aask_question(question, filters, priority))
+        return self._as_coalesced(question, result) if shared else result
+
+    async def _aask_question(self, question: str, filters: Optional[MetadataFilter],
+                             priority: int) -> Dict[str, Any]:
+        logger.info(f"Processing question: '{question}'")
+        deadline = Deadline()
+        cache_generation = self.answer_cache.generation
+
+        # None when Ollama is slow or saturated; retrieval then falls back to BM25
+        query_embedding = await self.retriever.aembed_query_fast(question, timeout=self.retriever.embed_budget(deadline))
+        cached_result = self._cached_answer(question, query_embedding, filters)
+        if cached_result is not None:
+            return cached_result
+
+        retrieval_result = await self.retriever.aretrieve_relevant_content(
+            question, filters=filters, deadline=deadline, query_embedding=query_embedding, embedded=True
+        )
+        # Retrieval may already have used up the budget; then no slot is taken at all
+        if not self._answer_fits(deadline):
+            return self._fallback_result(question, retrieval_result, deadline)
+        try:
+            generation_result, admission = await self._agenerate(question, retrieval_result['context'], priority,
+                                                                 deadline)
+        except asyncio.TimeoutError:
+            return self._fallback_result(question, retrieval_result, deadline)
+        final_result = self._combine_results(question, retrieval_result, generation_result)
+        self._remember_answer(question, query_embedding, final_result, generation_result, cache_generation, filters)
+
+        logger.info(f"RAG pipeline completed. Retrieved {retrieval_result['documents_found']} documents.")
+        return {**final_result, "queue_seconds": admission.queue_seconds, "fallback": False}
+
+    def _max_tokens(self, deadline: Deadline) -> Optional[int]:
+        """Token cap for the generation share of what is left of the deadline; None without one"""
+        return self.generator.token_budget(deadline.timeout(DEADLINE_GENERATION_SHARE))
+
+    def _answer_fits(self, deadline: Deadline) -> bool:
+        """False once the deadline cannot fit a usable answer, so the fallback is used without calling Ollama"""
+        return not deadline.expired() and self.generator.fits_answer(self._max_tokens(deadline))
+
+    async def _agenerate(self, question: str, context: str, priority: int,
+                         deadline: Deadline) -> Tuple[Dict[str, Any], Admission]:
+        async with self.admission.slot(priority) as admission:
+            # Admission control already bounds the queue wait (429 past its SLO), so only generation is timed
+            deadline.exclude(admission.queue_seconds)
+            max_tokens = self._max_tokens(deadline)
+            if not self.generator.fits_answer(max_tokens):
+                raise asyncio.TimeoutError()
+            # On timeout the generation is cancelled and the slot released
+            generation_result = await asyncio.wait_for(
+                self.generator.agenerate_answer(question, context, max_tokens=max_tokens),
+                timeout=deadline.timeout()
+            )
+        return generation_result, admission
+
+    def stream_question(self, question: str, filters: Optional[MetadataFilter] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Streaming RAG pipeline: yields events as soon as each part is ready
+        Order is one "citations" event, then "token" events, then a "done" summary
+        """
+        logger.info(f"Processing streamed question: '{question}'")
+        started = time.perf_counter()
+        cache_generation = self.answer_cache.generation
+
+        query_embedding = self.retriever.embed_query(question)
+        cached_result = self._cached_answer(question, query_embedding, filters)
+        if cached_result is not None:
+            yield from self._cached_events(cached_result, started)
+            return
+
+        # Step 1: Retrieve relevant content and send the citations right away
+        retrieval_result = self.retriever.retrieve_relevant_content(question, filters=filters)
+        yield self._citations_event(question, retrieval_result['documents_found'],
+                                    self._serialize_documents(retrieval_result["documents"]))
+
+        # Step 2: Forward answer tokens as the model produces them
+        answer_parts: List[str] = []
+        first_token_at = None
+        for token in self.generator.stream_answer(question, retrieval_result['context']):
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+            answer_parts.append(token)
+            yield {"event": "token", "data": {"text": token}}
+
+        # Step 3: Summarize the completed answer
+        generation_result = {"answer": "".join(answer_parts), "model_used": self.generator.model}
+        self._remember_answer(question, query_embedding,
+                              self._combine_results(question, retrieval_result, generation_result),
+                              generation_result, cache_generation, filters)
+        yield self._done_event(question, generation_result["answer"], retrieval_result['documents_found'],
+                               self.generator.model, started, first_token_at)
+
+        logger.info(f"Streamed RAG pipeline completed. Retrieved {retrieval_result['documents_found']} documents.")
+
+    async def astream_question(self, question: str, filters: Optional[MetadataFilter] = None,
+                               priority: int = PRIORITY_STUDENT) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Async variant of stream_question with the same event order
+        A request identical to a stream already in progress replays its events so far and then follows it
+        Token generation waits for an admission slot like aask_question
+        If no token arrives within the deadline, the extractive fallback is streamed instead; once tokens
+        flow the answer is bounded by the token cap rather than cut off
+        """
+        events, shared = self.inflight_streams.subscribe(self._flight_key(question, filters, priority),
+                                                         lambda: self._astream_question(question, filters, priority))
+        async for event in events:
+            if shared and "question" in event["data"]:
+                event = {**event, "data": self._as_coalesced(question, event["data"])}
+            yield event
+
+    async def _astream_question(self, question: str, filters: Optional[MetadataFilter],
+                                priority: int) -> AsyncIterator[Dict[str, Any]]:
+        logger.info(f"Processing streamed question: '{question}'")
+        started = time.perf_counter()
+        deadline = Deadline()
+        cache_generation = self.answer_cache.generation
+
+        # None when Ollama is slow or saturated; retrieval then falls back to BM25
+        query_embedding = await self.retriever.aembed_query_fast(question, timeout=self.retriever.embed_budget(deadline))
+        cached_result = self._cached_answer(question, query_embedding, filters)
+        if cached_result is not None:
+            for event in self._cached_events(cached_result, started):
+                yield event
+            return
+
+        retrieval_result = await self.retriever.aretrieve_relevant_content(
+            question, filters=filters, deadline=deadline, query_embedding=query_embedding, embedded=True
+        )
+        yield self._citations_event(question, retrieval_result['documents_found'],
+                                    self._serialize_documents(retrieval_result["documents"]))
+
+        answer_parts: List[str] = []
+        first_token_at = None
+        queue_seconds = 0.0
+        # Retrieval may already have used up the budget; then no slot is taken at all
+        timed_out = not self._answer_fits(deadline)
+        first_token = None
+        outcome: Dict[str, Any] = {}
+        async with AsyncExitStack() as stack:
+            try:
+                if not timed_out:
+                    admission = await stack.enter_async_context(self.admission.slot(priority))
+                    # As in _agenerate, the queue wait is bounded by admission control, not the deadline
+                    queue_seconds = admission.queue_seconds
+                    deadline.exclude(queue_seconds)
+                    max_tokens = self._max_tokens(deadline)
+                    if not self.generator.fits_answer(max_tokens):
+                        raise asyncio.TimeoutError()
+                    tokens = self.generator.astream_answer(question, retrieval_result['context'],
+                                                           max_tokens=max_tokens, outcome=outcome)
+                    stack.push_async_callback(tokens.aclose)
+                    first_token = await asyncio.wait_for(tokens.__anext__(), timeout=deadline.timeout())
+            except asyncio.TimeoutError:
+                timed_out = True
+            except StopAsyncIteration:
+                pass
+
+            if first_token is not None:
+                first_token_at = time.perf_counter()
+                answer_parts.append(first_token)
+                yield {"event": "token", "data": {"text": first_token}}
+                async for token in tokens:
+                    answer_parts.append(token)
+                    yield {"event": "token", "data": {"text": token}}
+
+        if timed_out:
+            fallback = self._fallback_result(question, retrieval_result, deadline)
+            yield {"event": "token", "data": {"text": fallback["answer"]}}
+            yield self._done_event(question, fallback["answer"], retrieval_result['documents_found'],
+                                   FALLBACK_MODEL, started, None, queue_seconds=queue_seconds, fallback=True)
+            return
+
+        generation_result = {"answer": "".join(answer_parts), "model_used": self.generator.model,
+                             "truncated": outcome.get("truncated", False)}
+        self._remember_answer(question, query_embedding,
+                              self._combine_results(question, retrieval_result, generation_result),
+                              generation_result, cache_generation, filters)
+        yield self._done_event(question, generation_result["answer"], retrieval_result['documents_found'],
+                               self.generator.model, started, first_token_at, queue_seconds=queue_seconds,
+                               truncated=generation_result["truncated"])
+
+        logger.info(f"Streamed RAG pipeline completed. Retrieved {retrieval_result['documents_found']} documents.")
+
 
 # Test the complete system
 if __name__ == "__main__":
-    rag_system = RetrievalAugmentedGeneration()
+    # The same index the server uses (CHROMA_DIR in main.py)
+    rag_system = RetrievalAugmentedGeneration(
+        persist_directory=os.environ.get("CHROMA_DIR", os.path.join(os.path.dirname(__file__), "chroma_db"))
+    )
 
     test_question = "What are the main types of machine learning?"
     result = rag_system.ask_question(test_question)
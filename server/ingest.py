@@ -1,26 +1,389 @@
+import hashlib
+import json
+import logging
 import os
-from typing import List, Tuple
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 from langchain_core.documents import Document
-from langchain_chroma import Chroma
 from langchain_ollama import OllamaEmbeddings
 
+from server import registry
+from server.metrics import INGEST_EMBED_SECONDS, INGEST_PARSE_SECONDS, INGEST_WRITE_SECONDS
+from server.tokens import estimate_tokens, split_words
+from server.vector_backends import VectorBackend
+
 try:
     from pptx import Presentation
 except Exception as e:
     Presentation = None
 
+logger = logging.getLogger(__name__)
+
+EMBED_BATCH_SIZE = int(os.environ.get("EMBED_BATCH_SIZE", "32"))
+EMBED_MAX_IN_FLIGHT = int(os.environ.get("EMBED_MAX_IN_FLIGHT", "2"))
+EMBED_TARGET_LATENCY = float(os.environ.get("EMBED_TARGET_LATENCY", "2.0"))
+EMBED_MAX_RETRIES = int(os.environ.get("EMBED_MAX_RETRIES", "3"))
+
+# Chunking of parsed slides before embedding; see ChunkPolicy
+CHUNK_POLICY = os.environ.get("CHUNK_POLICY", "token")
+CHUNK_TARGET_TOKENS = int(os.environ.get("CHUNK_TARGET_TOKENS", "256"))
+CHUNK_OVERLAP_TOKENS = int(os.environ.get("CHUNK_OVERLAP_TOKENS", "32"))
+CHUNK_MIN_TOKENS = int(os.environ.get("CHUNK_MIN_TOKENS", "48"))
+
+# Callbacks run after the slide index changes, e.g. to drop cached answers
+_index_listeners: List[Callable[[str], None]] = []
+
+
+def add_index_listener(listener: Callable[[str], None]) -> None:
+    """Register a callback that receives the source filename whenever its slides change"""
+    _index_listeners.append(listener)
+
+
+def notify_index_changed(source: str) -> None:
+    for listener in _index_listeners:
+        try:
+            listener(source)
+        except Exception as e:
+            logger.error(f"Index listener failed for source {source}: {e}")
+
+
+MANIFEST_FILENAME = "ingest_manifest.json"
+
+
+class IngestManifest:
+    """
+    Record of what is already indexed for each source file, stored in the persist directory
+    Maps source filename -> size, mtime, content hash, week title and document IDs
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable ingest manifest {path}: {e}")
+
+    def get(self, source: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(source)
+            return dict(entry) if entry else None
+
+    def record(self, source: str, entry: Dict[str, Any]) -> None:
+        with self._lock:
+            self._entries[source] = entry
+            self._save()
+
+    def remove(self, source: str) -> None:
+        with self._lock:
+            if self._entries.pop(source, None) is not None:
+                self._save()
+
+    def _save(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._entries, f)
+        os.replace(tmp_path, self.path)
+
+
+_manifests: Dict[str, IngestManifest] = {}
+_manifests_lock = threading.Lock()
+
+
+def get_manifest(persist_directory: str = "./chroma_db") -> IngestManifest:
+    """Manifest for the configured vector backend; each backend tracks what it has indexed separately"""
+    filename = MANIFEST_FILENAME
+    if registry.VECTOR_BACKEND != "chroma":
+        filename = f"ingest_manifest.{registry.VECTOR_BACKEND}.json"
+    path = os.path.join(os.path.abspath(persist_directory), filename)
+    with _manifests_lock:
+        if path not in _manifests:
+            _manifests[path] = IngestManifest(path)
+        return _manifests[path]
+
+
+def file_sha256(file_path: str, chunk_size: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def document_id(document: Document) -> str:
+    """
+    Deterministic ID derived from source, slide, chunk and text hash
+    Re-ingesting an unchanged slide produces the same ID, so it is never duplicated
+    """
+    text_hash = hashlib.sha256(document.page_content.encode("utf-8")).hexdigest()
+    key = f"{document.metadata.get('source')}\x1f{document.metadata.get('slide')}\x1f{text_hash}"
+    if "chunk" in document.metadata:
+        key += f"\x1f{document.metadata['chunk']}"
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+
+
+class ChunkPolicy:
+    """
+    Turns parsed slides into the documents that are embedded and retrieved
+    Every chunk keeps the source, module and slide metadata used for citations
+    """
+
+    name = "base"
+
+    def chunk(self, documents: List[Document]) -> List[Document]:
+        raise NotImplementedError
+
+    def signature(self) -> str:
+        """Recorded in the manifest; a different signature makes the next ingest re-chunk the deck"""
+        return self.name
+
+
+class SlideChunkPolicy(ChunkPolicy):
+    """One chunk per slide, whatever its size"""
+
+    name = "slide"
+
+    def chunk(self, documents: List[Document]) -> List[Document]:
+        return list(documents)
+
+
+class TokenChunkPolicy(ChunkPolicy):
+    """
+    Token-budgeted chunks
+    Adjacent slides under min_tokens are merged while the result stays within target_tokens;
+    slides over target_tokens are split into windows of target_tokens that overlap by overlap_tokens
+    """
+
+    name = "token"
+
+    def __init__(self, target_tokens: int = CHUNK_TARGET_TOKENS, overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+                 min_tokens: int = CHUNK_MIN_TOKENS):
+        self.target_tokens = max(1, target_tokens)
+        self.overlap_tokens = min(max(0, overlap_tokens), self.target_tokens // 2)
+        self.min_tokens = min(max(0, min_tokens), self.target_tokens)
+
+    def signature(self) -> str:
+        return f"{self.name}:{self.target_tokens}:{self.overlap_tokens}:{self.min_tokens}"
+
+    def chunk(self, documents: List[Document]) -> List[Document]:
+        chunks: List[Document] = []
+        pending: List[Document] = []
+        pending_tokens = 0
+
+        def flush() -> None:
+            nonlocal pending, pending_tokens
+            if pending:
+                chunks.append(self._merge(pending))
+            pending, pending_tokens = [], 0
+
+        for doc in documents:
+            tokens = estimate_tokens(doc.page_content)
+            if tokens > self.target_tokens:
+                flush()
+                chunks.extend(self._split(doc))
+                continue
+            same_deck = not pending or pending[-1].metadata.get("source") == doc.metadata.get("source")
+            if pending and (pending_tokens >= self.min_tokens or pending_tokens + tokens > self.target_tokens
+                            or not same_deck):
+                flush()
+            pending.append(doc)
+            pending_tokens += tokens
+        flush()
+        return chunks
 
-def _init_vector_store(persist_directory: str = "./chroma_db") -> Tuple[Chroma, OllamaEmbeddings]:
-    embeddings = OllamaEmbeddings(
-        model="nomic-embed-text",
-        base_url="http://localhost:11434"
-    )
-    vector_store = Chroma(
-        persist_directory=persist_directory,
-        embedding_function=embeddings
-    )
-    return vector_store, embeddings
+    @staticmethod
+    def _merge(documents: List[Document]) -> Document:
+        if len(documents) == 1:
+            return documents[0]
+        metadata = dict(documents[0].metadata)
+        metadata["slide_end"] = documents[-1].metadata.get("slide")
+        return Document(page_content="\n\n".join(doc.page_content for doc in documents), metadata=metadata)
+
+    def _split(self, document: Document) -> List[Document]:
+        words = split_words(document.page_content)
+        costs = [estimate_tokens(word) for word in words]
+        windows: List[Tuple[int, int]] = []
+        start = 0
+        while start < len(words):
+            end, used = start, 0
+            while end < len(words) and (end == start or used + costs[end] <= self.target_tokens):
+                used += costs[end]
+                end += 1
+            windows.append((start, end))
+            if end >= len(words):
+                break
+            # Step back far enough to repeat about overlap_tokens, but always make progress
+            back, overlap = end, 0
+            while back > start + 1 and overlap + costs[back - 1] <= self.overlap_tokens:
+                back -= 1
+                overlap += costs[back]
+            start = back
+
+        return [
+            Document(
+                page_content="".join(words[a:b]).strip(),
+                metadata={**document.metadata, "chunk": n, "chunks": len(windows)},
+            )
+            for n, (a, b) in enumerate(windows)
+        ]
+
+
+def get_chunk_policy(name: Optional[str] = None) -> ChunkPolicy:
+    """Build the configured chunk policy, "token" by default or "slide" for one chunk per slide"""
+    name = name or CHUNK_POLICY
+    if name == SlideChunkPolicy.name:
+        return SlideChunkPolicy()
+    if name == TokenChunkPolicy.name:
+        return TokenChunkPolicy()
+    raise ValueError(f"Unknown chunk policy '{name}'")
+
+
+def file_unchanged(entry: Optional[Dict[str, Any]], stat: os.stat_result, week_title: str,
+                    file_path: str, chunk_policy: Optional[ChunkPolicy] = None,
+                    content_hash: Optional[str] = None) -> Tuple[bool, Optional[str]]:
+    """
+    Compare a file against its manifest entry; returns (unchanged, content hash)
+    Size and mtime matching skips hashing entirely; otherwise the content hash decides, using
+    content_hash when the caller already has it (e.g. computed while the upload streamed in).
+    A deck chunked under a different policy always counts as changed.
+    """
+    policy = chunk_policy or get_chunk_policy()
+    if entry is None or entry.get("week_title") != week_title or entry.get("chunk_policy") != policy.signature():
+        return False, None
+    if entry.get("size") == stat.st_size and entry.get("mtime_ns") == stat.st_mtime_ns:
+        return True, entry.get("sha256")
+    file_hash = content_hash or file_sha256(file_path)
+    return file_hash == entry.get("sha256"), file_hash
+
+
+class EmbeddingBatcher:
+    """
+    Embeds slide text in batches with a bounded number of Ollama requests in flight
+    The batch size adapts so each request takes about target_latency seconds, and a failed
+    batch is retried with exponential backoff without re-embedding batches that already succeeded.
+    One batcher can be shared by several threads; the in-flight limit applies to all of them.
+    """
+
+    def __init__(self, embeddings, batch_size: int = EMBED_BATCH_SIZE, max_in_flight: int = EMBED_MAX_IN_FLIGHT,
+                 target_latency: float = EMBED_TARGET_LATENCY, max_retries: int = EMBED_MAX_RETRIES,
+                 min_batch_size: int = 4, max_batch_size: int = 256, backoff_seconds: float = 0.5):
+        self.embeddings = embeddings
+        self.min_batch_size = max(1, min_batch_size)
+        self.max_batch_size = max(self.min_batch_size, max_batch_size)
+        self.batch_size = min(max(batch_size, self.min_batch_size), self.max_batch_size)
+        self.max_in_flight = max(1, max_in_flight)
+        self.target_latency = target_latency
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self._seconds_per_text: Optional[float] = None
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix="embed-batch")
+
+    def embed(self, texts: List[str],
+              on_batch: Optional[Callable[[int, int, List[List[float]]], None]] = None) -> List[List[float]]:
+        """
+        Embed texts and return their vectors in order
+        on_batch(start, end, vectors) runs in the calling thread as each batch completes,
+        so callers can persist partial progress before the whole list is done
+        """
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        cursor = 0
+        in_flight: Dict[Any, Tuple[int, int]] = {}
+        try:
+            while cursor < len(texts) or in_flight:
+                while cursor < len(texts) and len(in_flight) < self.max_in_flight:
+                    end = min(cursor + self.batch_size, len(texts))
+                    future = self._executor.submit(self._embed_with_retry, texts[cursor:end])
+                    in_flight[future] = (cursor, end)
+                    cursor = end
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    start, end = in_flight.pop(future)
+                    vectors, latency = future.result()
+                    results[start:end] = vectors
+                    self._adapt(end - start, latency)
+                    if on_batch is not None:
+                        on_batch(start, end, vectors)
+        finally:
+            for future in in_flight:
+                future.cancel()
+        return results
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
+
+    def _embed_with_retry(self, texts: List[str]) -> Tuple[List[List[float]], float]:
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                vectors = self.embeddings.embed_documents(texts)
+                return vectors, time.perf_counter() - started
+            except Exception as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = self.backoff_seconds * (2 ** attempt)
+                attempt += 1
+                logger.warning(f"Embedding batch of {len(texts)} failed ({e}); retry {attempt}/{self.max_retries} in {delay:.1f}s")
+                time.sleep(delay)
+
+    def _adapt(self, size: int, latency: float) -> None:
+        """Move the batch size toward target_latency, at most halving or doubling per step"""
+        with self._lock:
+            per_text = latency / max(size, 1)
+            if self._seconds_per_text is None:
+                self._seconds_per_text = per_text
+            else:
+                self._seconds_per_text = 0.7 * self._seconds_per_text + 0.3 * per_text
+            ideal = int(self.target_latency / max(self._seconds_per_text, 1e-6))
+            ideal = min(max(ideal, self.batch_size // 2), self.batch_size * 2)
+            self.batch_size = min(max(ideal, self.min_batch_size), self.max_batch_size)
+
+
+def upsert_embedded_documents(vector_backend: VectorBackend, ids: List[str], documents: List[Document],
+                              embeddings: List[List[float]]) -> None:
+    """Write already-embedded documents without letting the store embed them again"""
+    vector_backend.upsert(ids, embeddings, documents)
+
+
+def mirror_lexical_upsert(persist_directory: str, ids: List[str], documents: List[Document]) -> None:
+    """Apply a vector store upsert to the BM25 index too, once that index has been built"""
+    index = registry.peek_lexical_index(persist_directory)
+    if index is not None:
+        index.upsert(ids, documents)
+
+
+def mirror_lexical_delete(persist_directory: str, ids: List[str]) -> None:
+    """Apply a vector store delete to the BM25 index too, once that index has been built"""
+    index = registry.peek_lexical_index(persist_directory)
+    if index is not None:
+        index.delete(ids)
+
+
+def _init_vector_store(persist_directory: str = "./chroma_db") -> Tuple[VectorBackend, OllamaEmbeddings]:
+    """Shared vector backend and embedding client from the process-wide registry"""
+    return registry.get_vector_backend(persist_directory), registry.get_embeddings()
+
+
+_shared_batcher: Optional[EmbeddingBatcher] = None
+_shared_batcher_lock = threading.Lock()
+
+
+def _get_batcher(embeddings) -> EmbeddingBatcher:
+    """One batcher for single-file ingests so uploads and the watcher share its in-flight limit and tuning"""
+    global _shared_batcher
+    with _shared_batcher_lock:
+        if _shared_batcher is None or _shared_batcher.embeddings is not embeddings:
+            _shared_batcher = EmbeddingBatcher(embeddings)
+        return _shared_batcher
 
 
 def pptx_to_documents(file_path: str, week_title: str) -> List[Document]:
@@ -51,13 +414,128 @@ def pptx_to_documents(file_path: str, week_title: str) -> List[Document]:
     return documents
 
 
-def ingest_pptx_to_chroma(file_path: str, week_title: str, persist_directory: str = "./chroma_db") -> int:
-    vector_store, _ = _init_vector_store(persist_directory=persist_directory)
-    documents = pptx_to_documents(file_path=file_path, week_title=week_title)
-    if not documents:
-        return 0
-    # Upsert by content+metadata; Chroma add_documents handles dedup by ids if provided. Keep simple here.
-    vector_store.add_documents(documents)
+def plan_index_changes(vector_backend: VectorBackend, source: str, week_title: str, entry: Optional[Dict[str, Any]],
+                       ids: List[str], documents: List[Document]) -> Tuple[List[str], List[Document], List[str]]:
+    """
+    Diff a freshly parsed deck against what the index holds for its source
+    Returns (ids to add, documents to add, ids to delete)
+    """
+    existing_ids = set(vector_backend.ids_for_source(source))
+
+    # A new week title changes metadata but not IDs, so every slide is rewritten
+    rewrite_all = entry is not None and entry.get("week_title") != week_title
+    new_ids, new_documents = [], []
+    for doc_id, doc in zip(ids, documents):
+        if rewrite_all or doc_id not in existing_ids:
+            new_ids.append(doc_id)
+            new_documents.append(doc)
+    stale_ids = list(existing_ids - set(ids))
+    return new_ids, new_documents, stale_ids
+
+
+def manifest_entry(stat: os.stat_result, file_hash: str, week_title: str, documents: int,
+                   chunk_policy: Optional[ChunkPolicy] = None) -> Dict[str, Any]:
+    return {
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "sha256": file_hash,
+        "week_title": week_title,
+        "documents": documents,
+        "chunk_policy": (chunk_policy or get_chunk_policy()).signature(),
+    }
+
+
+def ingest_pptx_to_chroma(file_path: str, week_title: str, persist_directory: str = "./chroma_db",
+                          progress: Optional[Callable[[int, int], None]] = None,
+                          on_documents: Optional[Callable[[List[Document]], None]] = None,
+                          chunk_policy: Optional[ChunkPolicy] = None,
+                          before_write: Optional[Callable[[], None]] = None,
+                          content_hash: Optional[str] = None) -> int:
+    """
+    Index a deck incrementally and return its number of chunk documents
+    Unchanged files are skipped; changed files only add new chunks and delete stale ones
+    progress, if given, receives (chunks_processed, chunks_total) as batches are written;
+    on_documents receives the parsed slides, before chunking, whenever the deck had to be parsed;
+    before_write is called before every index write and may raise to abort (e.g. a cancelled job);
+    content_hash, the file's SHA-256 if already known, saves reading the file a second time to hash it
+    """
+    source = os.path.basename(file_path)
+    manifest = get_manifest(persist_directory)
+    entry = manifest.get(source)
+    stat = os.stat(file_path)
+    chunk_policy = chunk_policy or get_chunk_policy()
+
+    unchanged, file_hash = file_unchanged(entry, stat, week_title, file_path, chunk_policy, content_hash)
+    if unchanged:
+        logger.info(f"Skipping '{source}': unchanged since last ingest.")
+        entry.update({"size": stat.st_size, "mtime_ns": stat.st_mtime_ns})
+        manifest.record(source, entry)
+        if progress:
+            progress(entry.get("documents", 0), entry.get("documents", 0))
+        return entry.get("documents", 0)
+
+    vector_backend, embeddings = _init_vector_store(persist_directory=persist_directory)
+    parse_started = time.perf_counter()
+    slides = pptx_to_documents(file_path=file_path, week_title=week_title)
+    documents = chunk_policy.chunk(slides)
+    if slides:
+        INGEST_PARSE_SECONDS.observe((time.perf_counter() - parse_started) / len(slides))
+    if on_documents:
+        on_documents(slides)
+    ids = [document_id(doc) for doc in documents]
+
+    new_ids, new_documents, stale_ids = plan_index_changes(vector_backend, source, week_title, entry, ids, documents)
+    processed = len(documents) - len(new_documents)
+    if progress:
+        progress(processed, len(documents))
+
+    if new_documents:
+        # Each batch is written as soon as it is embedded; if a later batch fails for good,
+        # the next ingest finds the written slides by ID and only embeds the rest
+        write_seconds = 0.0
+
+        def write_batch(start: int, end: int, vectors: List[List[float]]) -> None:
+            nonlocal processed, write_seconds
+            if before_write:
+                before_write()
+            write_started = time.perf_counter()
+            upsert_embedded_documents(vector_backend, new_ids[start:end], new_documents[start:end], vectors)
+            mirror_lexical_upsert(persist_directory, new_ids[start:end], new_documents[start:end])
+            write_seconds += time.perf_counter() - write_started
+            processed += end - start
+            if progress:
+                progress(processed, len(documents))
+
+        embed_started = time.perf_counter()
+        _get_batcher(embeddings).embed([doc.page_content for doc in new_documents], on_batch=write_batch)
+        # Writes run between embedding batches, so they are taken out of the embedding time
+        embed_seconds = time.perf_counter() - embed_started - write_seconds
+        INGEST_EMBED_SECONDS.observe(embed_seconds / len(new_documents))
+        INGEST_WRITE_SECONDS.observe(write_seconds / len(new_documents))
+    if before_write:
+        before_write()
+    if stale_ids:
+        vector_backend.delete(stale_ids)
+        mirror_lexical_delete(persist_directory, stale_ids)
+
+    manifest.record(source, manifest_entry(stat, file_hash or content_hash or file_sha256(file_path), week_title, len(documents),
+                                           chunk_policy))
+    logger.info(f"Ingested '{source}': {len(slides)} slides as {len(documents)} chunks; {len(new_documents)} added, "
+                f"{len(stale_ids)} removed, {len(documents) - len(new_documents)} unchanged.")
+
+    if new_documents or stale_ids:
+        notify_index_changed(source)
     return len(documents)
 
 
+def remove_pptx_from_chroma(source: str, persist_directory: str = "./chroma_db") -> int:
+    """Delete every slide of a source from the index and forget it in the manifest"""
+    vector_backend, _ = _init_vector_store(persist_directory=persist_directory)
+    ids = vector_backend.ids_for_source(source)
+    if ids:
+        vector_backend.delete(ids)
+        mirror_lexical_delete(persist_directory, ids)
+    get_manifest(persist_directory).remove(source)
+    if ids:
+        notify_index_changed(source)
+    return len(ids)
@@ -0,0 +1,275 @@
+"""
+Persistent background queue for upload ingestion
+/upload stores the deck and enqueues a job; a pool of worker threads claims jobs from
+SQLite, runs the parse-and-embed, and records progress that /jobs/{id} reports
+Several server processes may share one app.db: each claims jobs under its own owner ID and
+heartbeats them, and only jobs whose owner stopped heartbeating are requeued
+"""
+
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from server.db import ConnectionPool
+
+logger = logging.getLogger(__name__)
+
+INGEST_JOB_WORKERS = int(os.environ.get("INGEST_JOB_WORKERS", "2"))
+# Workers also poll so jobs enqueued by another process are picked up
+INGEST_JOB_POLL_SECONDS = float(os.environ.get("INGEST_JOB_POLL_SECONDS", "2.0"))
+# Running jobs are heartbeated this often; a job not heartbeated for INGEST_JOB_STALE_SECONDS is
+# taken to belong to a process that died and is requeued
+INGEST_JOB_HEARTBEAT_SECONDS = float(os.environ.get("INGEST_JOB_HEARTBEAT_SECONDS", "10"))
+INGEST_JOB_STALE_SECONDS = float(os.environ.get("INGEST_JOB_STALE_SECONDS", "60"))
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+# UPDATE ... RETURNING needs SQLite 3.35; older libraries claim with a compare-and-set update instead
+_HAS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+# handler(job, progress) ingests job["file_path"] and returns the number of chunks indexed (slides are
+# merged or split into chunks by the chunk policy); progress(chunks_processed, chunks_total) may be
+# called any number of times along the way
+JobHandler = Callable[[Dict[str, Any], Callable[[int, int], None]], int]
+
+_JOB_COLUMNS = ("id, material_id, file_path, week_title, status, chunks_total, chunks_processed, "
+                "error, attempts, created_at, started_at, finished_at")
+
+
+class JobCancelled(Exception):
+    """Raised inside a handler to stop a job that was cancelled while it ran"""
+
+
+def _now() -> str:
+    # Fixed width, so timestamps stored as text also compare correctly
+    return datetime.utcnow().isoformat(timespec="microseconds")
+
+
+class IngestJobQueue:
+    """
+    SQLite-backed job queue with a configurable pool of worker threads
+    Jobs survive restarts: anything left running by a process that stopped heartbeating is requeued
+    by recover()
+    """
+
+    def __init__(self, db: ConnectionPool, handler: JobHandler, workers: int = INGEST_JOB_WORKERS,
+                 poll_seconds: float = INGEST_JOB_POLL_SECONDS, heartbeat_seconds: float = INGEST_JOB_HEARTBEAT_SECONDS,
+                 stale_seconds: float = INGEST_JOB_STALE_SECONDS):
+        self.db = db
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.poll_seconds = poll_seconds
+        self.heartbeat_seconds = heartbeat_seconds
+        self.stale_seconds = stale_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._wakeup = threading.Condition()
+        self._pending = 0
+        self._stopping = False
+        self._threads: List[threading.Thread] = []
+
+    def enqueue(self, file_path: str, week_title: str, material_id: Optional[int] = None) -> int:
+        """Add a job and wake one idle worker; returns the job ID"""
+        with self.db.connection() as conn:
+            cur = conn.execute(
+                "INSERT INTO ingest_jobs (material_id, file_path, week_title, status, created_at) VALUES (?, ?, ?, ?, ?)",
+                (material_id, file_path, week_title, QUEUED, _now()),
+            )
+            job_id = cur.lastrowid
+        with self._wakeup:
+            self._pending += 1
+            self._wakeup.notify()
+        return job_id
+
+    def get(self, job_id: int) -> Optional[Dict[str, Any]]:
+        with self.db.connection() as conn:
+            row = conn.execute(f"SELECT {_JOB_COLUMNS} FROM ingest_jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def claim(self) -> Optional[Dict[str, Any]]:
+        """Atomically move the oldest queued job to running under this queue's owner and return it"""
+        if not _HAS_RETURNING:
+            return self._claim_compare_and_set()
+        now = _now()
+        with self.db.connection() as conn:
+            rows = conn.execute(
+                f"""
+                UPDATE ingest_jobs SET status = ?, started_at = ?, attempts = attempts + 1, owner = ?, heartbeat_at = ?
+                WHERE id = (SELECT id FROM ingest_jobs WHERE status = ? ORDER BY id LIMIT 1)
+                RETURNING {_JOB_COLUMNS}
+                """,
+                (RUNNING, now, self.owner, now, QUEUED),
+            ).fetchall()
+        return dict(rows[0]) if rows else None
+
+    def _claim_compare_and_set(self) -> Optional[Dict[str, Any]]:
+        """claim() for SQLite before 3.35: the UPDATE only succeeds if the job is still queued"""
+        while True:
+            now = _now()
+            with self.db.connection() as conn:
+                row = conn.execute("SELECT id FROM ingest_jobs WHERE status = ? ORDER BY id LIMIT 1",
+                                   (QUEUED,)).fetchone()
+                if row is None:
+                    return None
+                claimed = conn.execute(
+                    """
+                    UPDATE ingest_jobs SET status = ?, started_at = ?, attempts = attempts + 1, owner = ?, heartbeat_at = ?
+                    WHERE id = ? AND status = ?
+                    """,
+                    (RUNNING, now, self.owner, now, row["id"], QUEUED),
+                ).rowcount
+                if claimed:
+                    return dict(conn.execute(f"SELECT {_JOB_COLUMNS} FROM ingest_jobs WHERE id = ?",
+                                             (row["id"],)).fetchone())
+            # Another worker took it between the SELECT and the UPDATE; try the next one
+
+    def cancel_for_material(self, material_id: int) -> int:
+        """Cancel the material's queued and running jobs; a running one stops before its next index write"""
+        with self.db.connection() as conn:
+            return conn.execute(
+                "UPDATE ingest_jobs SET status = ?, finished_at = ? WHERE material_id = ? AND status IN (?, ?)",
+                (CANCELLED, _now(), material_id, QUEUED, RUNNING),
+            ).rowcount
+
+    def is_cancelled(self, job_id: int) -> bool:
+        with self.db.connection() as conn:
+            row = conn.execute("SELECT status FROM ingest_jobs WHERE id = ?", (job_id,)).fetchone()
+        return row is not None and row["status"] == CANCELLED
+
+    def raise_if_cancelled(self, job_id: int) -> None:
+        if self.is_cancelled(job_id):
+            raise JobCancelled(f"Ingest job {job_id} was cancelled")
+
+    def status_counts(self) -> Dict[str, int]:
+        """Number of jobs in each status, e.g. how many uploads are waiting for a worker"""
+        with self.db.connection() as conn:
+            rows = conn.execute("SELECT status, COUNT(*) FROM ingest_jobs GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+    def heartbeat(self) -> int:
+        """Mark this queue's running jobs as alive so other processes leave them alone"""
+        with self.db.connection() as conn:
+            return conn.execute(
+                "UPDATE ingest_jobs SET heartbeat_at = ? WHERE owner = ? AND status = ?", (_now(), self.owner, RUNNING)
+            ).rowcount
+
+    def recover(self) -> int:
+        """
+        Requeue running jobs whose owner stopped heartbeating (a crashed or stopped process)
+        Jobs another live process is running keep going; jobs from before owners were recorded have no
+        heartbeat and are requeued
+        """
+        stale_before = (datetime.utcnow() - timedelta(seconds=self.stale_seconds)).isoformat(timespec="microseconds")
+        with self.db.connection() as conn:
+            count = conn.execute(
+                """
+                UPDATE ingest_jobs SET status = ?, started_at = NULL, owner = NULL, heartbeat_at = NULL
+                WHERE status = ? AND (heartbeat_at IS NULL OR heartbeat_at < ?)
+                """,
+                (QUEUED, RUNNING, stale_before),
+            ).rowcount
+        if count:
+            logger.info(f"Requeued {count} interrupted ingest jobs.")
+            with self._wakeup:
+                self._pending += count
+                self._wakeup.notify(count)
+        return count
+
+    def _set_progress(self, job_id: int, processed: int, total: int) -> None:
+        with self.db.connection() as conn:
+            conn.execute(
+                "UPDATE ingest_jobs SET chunks_processed = ?, chunks_total = ? WHERE id = ?",
+                (processed, total, job_id),
+            )
+
+    def _finish(self, job_id: int, status: str, chunks: Optional[int] = None, error: Optional[str] = None) -> None:
+        # A job cancelled (or requeued as stale) meanwhile keeps that status
+        with self.db.connection() as conn:
+            conn.execute(
+                """
+                UPDATE ingest_jobs SET status = ?, finished_at = ?, error = ?,
+                    chunks_total = COALESCE(?, chunks_total), chunks_processed = COALESCE(?, chunks_processed)
+                WHERE id = ? AND status = ? AND owner = ?
+                """,
+                (status, _now(), error, chunks, chunks, job_id, RUNNING, self.owner),
+            )
+
+    def run_once(self) -> bool:
+        """Claim and process a single job; returns False when the queue is empty"""
+        job = self.claim()
+        if job is None:
+            return False
+
+        filename = os.path.basename(job["file_path"])
+        logger.info(f"Ingest job {job['id']} started for '{filename}'.")
+        try:
+            chunks = self.handler(job, lambda processed, total: self._set_progress(job["id"], processed, total))
+        except JobCancelled:
+            logger.info(f"Ingest job {job['id']} for '{filename}' was cancelled.")
+        except Exception as e:
+            logger.error(f"Ingest job {job['id']} for '{filename}' failed: {e}")
+            self._finish(job["id"], FAILED, error=str(e))
+        else:
+            logger.info(f"Ingest job {job['id']} finished: {chunks} chunks indexed for '{filename}'.")
+            self._finish(job["id"], SUCCEEDED, chunks=chunks)
+        return True
+
+    def _worker(self) -> None:
+        while True:
+            with self._wakeup:
+                if self._pending == 0 and not self._stopping:
+                    self._wakeup.wait(timeout=self.poll_seconds)
+                if self._stopping:
+                    return
+                self._pending = max(0, self._pending - 1)
+            try:
+                # Drain the queue before waiting again so a burst of uploads never sits idle
+                while not self._stopping and self.run_once():
+                    pass
+            except Exception as e:
+                logger.error(f"Ingest worker error: {e}")
+
+    def _heartbeat_loop(self) -> None:
+        """Keep this process's jobs alive and pick up jobs left behind by processes that died"""
+        while True:
+            with self._wakeup:
+                if not self._stopping:
+                    self._wakeup.wait(timeout=self.heartbeat_seconds)
+                if self._stopping:
+                    return
+            try:
+                self.heartbeat()
+                self.recover()
+            except Exception as e:
+                logger.error(f"Ingest job heartbeat error: {e}")
+
+    def start(self) -> None:
+        """Requeue interrupted jobs and start the worker and heartbeat threads"""
+        if self._threads:
+            return
+        self._stopping = False
+        self.recover()
+        for n in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"ingest-job-{n}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        heartbeat = threading.Thread(target=self._heartbeat_loop, name="ingest-job-heartbeat", daemon=True)
+        heartbeat.start()
+        self._threads.append(heartbeat)
+        logger.info(f"Started {self.workers} ingest job workers.")
+
+    def stop(self) -> None:
+        with self._wakeup:
+            self._stopping = True
+            self._wakeup.notify_all()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
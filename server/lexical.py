@@ -0,0 +1,134 @@
+"""
+In-process BM25 index over slide text for AI Classroom Co-Pilot
+Exact terms such as "SYN flood", "ARP" or port numbers are matched lexically and fused with
+vector hits; the index also answers retrieval on its own when the embedding service is slow
+"""
+
+import logging
+import math
+import re
+import threading
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+from server.vector_backends import MetadataFilter, metadata_matches
+
+logger = logging.getLogger(__name__)
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+# Words that carry no signal in course questions
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i in is it of on or that the this to was what "
+    "when where which who why will with you your".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN.findall(text.lower()) if t not in STOPWORDS]
+
+
+class BM25Index:
+    """
+    Inverted index with Okapi BM25 scoring, updated one document at a time
+    Documents are keyed by the same IDs as the Chroma collection, so upserts and deletes mirror it
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._lengths: Dict[str, int] = {}
+        self._documents: Dict[str, Document] = {}
+        self._total_length = 0
+        self._lock = threading.RLock()
+        self.loaded = False
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def load(self, fetch: Callable[[], Tuple[List[str], List[Document]]]) -> None:
+        """
+        Fill the index from a snapshot of the collection
+        The lock is held while the snapshot is read, so writes that land during the load
+        are applied after it, in order
+        """
+        with self._lock:
+            ids, documents = fetch()
+            self.upsert(ids, documents)
+            self.loaded = True
+        logger.info(f"Built BM25 index over {len(ids)} chunks")
+
+    def upsert(self, ids: List[str], documents: List[Document]) -> None:
+        with self._lock:
+            for doc_id, document in zip(ids, documents):
+                self._remove(doc_id)
+                counts = Counter(tokenize(document.page_content))
+                for term, tf in counts.items():
+                    self._postings.setdefault(term, {})[doc_id] = tf
+                length = sum(counts.values())
+                self._lengths[doc_id] = length
+                self._total_length += length
+                self._documents[doc_id] = document
+
+    def delete(self, ids: List[str]) -> None:
+        with self._lock:
+            for doc_id in ids:
+                self._remove(doc_id)
+
+    def _remove(self, doc_id: str) -> None:
+        document = self._documents.pop(doc_id, None)
+        if document is None:
+            return
+        for term in set(tokenize(document.page_content)):
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[term]
+        self._total_length -= self._lengths.pop(doc_id, 0)
+
+    def search(self, query: str, k: int = 10,
+               where: Optional[MetadataFilter] = None) -> List[Tuple[str, Document, float]]:
+        """
+        Return up to k (id, document, BM25 score) triples, best first
+        With a metadata filter only matching documents are scored; IDF stays corpus-wide
+        """
+        terms = set(tokenize(query))
+        with self._lock:
+            count = len(self._documents)
+            if not terms or not count:
+                return []
+            average_length = self._total_length / count
+            scores: Dict[str, float] = {}
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, tf in postings.items():
+                    if where and not metadata_matches(self._documents[doc_id].metadata, where):
+                        continue
+                    norm = self.k1 * (1 - self.b + self.b * self._lengths[doc_id] / average_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+            best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+            return [(doc_id, self._documents[doc_id], score) for doc_id, score in best]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"documents": len(self._documents), "terms": len(self._postings), "loaded": self.loaded}
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """
+    Fuse several ranked ID lists: each list contributes 1 / (k + rank) to an ID's score
+    Returns (id, fused score) pairs, best first
+    """
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
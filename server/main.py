@@ -1,23 +1,32 @@
 import sys
 import os
+import hashlib
+import hmac
+import json
+import tempfile
 import threading
 import time
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi import UploadFile, File, Form, Response, status
+from fastapi import UploadFile, File, Form, Request, Response, status
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel, EmailStr
-from langchain_chroma import Chroma
-from langchain_community.embeddings import OllamaEmbeddings
+from server.admission import PRIORITY_INSTRUCTOR, PRIORITY_STUDENT, AdmissionRejected
+from server.bulk_ingest import BulkIngestor
+from server.concurrency import run_blocking
+from server.db import ConnectionPool
 from server.generation import RetrievalAugmentedGeneration
-from server.ingest import ingest_pptx_to_chroma, pptx_to_documents
+from server.ingest import add_index_listener, ingest_pptx_to_chroma, pptx_to_documents, remove_pptx_from_chroma
+from server.jobs import FAILED, QUEUED, RUNNING, IngestJobQueue, JobCancelled
+from server.metrics import ASK_SECONDS, CONTENT_TYPE, ERRORS, REGISTRY, UPLOAD_TO_SEARCHABLE_SECONDS
 from server.profile import get_profile, update_profile
 import logging
 import sqlite3
 from datetime import datetime
-from typing import List, Dict, Any, Literal, Optional
+from typing import List, Dict, Any, AsyncIterator, Literal, Optional, Tuple
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -25,13 +34,60 @@ logger = logging.getLogger(__name__)
 
 app = FastAPI()
 
-# Define constants
-DB_PATH = os.path.join(os.path.dirname(__file__), "app.db")
-UPLOADS_DIR = os.path.join(os.path.dirname(__file__), "uploads")
-CHROMA_DIR = os.path.join(os.path.dirname(__file__), "chroma_db")
+# Define constants; the paths can be overridden, e.g. to run a benchmark against scratch copies
+DB_PATH = os.environ.get("APP_DB_PATH", os.path.join(os.path.dirname(__file__), "app.db"))
+UPLOADS_DIR = os.environ.get("UPLOADS_DIR", os.path.join(os.path.dirname(__file__), "uploads"))
+CHROMA_DIR = os.environ.get("CHROMA_DIR", os.path.join(os.path.dirname(__file__), "chroma_db"))
+# Shared secret that marks a question as an instructor's (X-Instructor-Token header). There are no user
+# accounts yet, so this is the only per-request role the server can trust; unset, every question is
+# generated at student priority
+INSTRUCTOR_TOKEN = os.environ.get("INSTRUCTOR_TOKEN", "")
+MAX_UPLOAD_BYTES = 25 * 1024 * 1024
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# Room for the multipart boundaries, part headers and the week_title field around the file itself
+UPLOAD_FORM_OVERHEAD_BYTES = 64 * 1024
+UPLOAD_TOO_LARGE = "File exceeds 25MB limit."
 
 # --- File Watcher and Bulk Ingestion ---
 
+def _week_title_for(filename: str) -> str:
+    try:
+        return filename.split('-')[0].strip()
+    except IndexError:
+        return "Unassigned"
+
+def _register_material(file_path: str, week_title: str) -> Optional[int]:
+    """Adds an auto-ingested file to the SQLite materials table unless it is already listed, returning its ID."""
+    filename = os.path.basename(file_path)
+    try:
+        with db.connection() as conn:
+            # Check if the material already exists to avoid duplicates
+            row = conn.execute("SELECT id FROM materials WHERE filename = ?", (filename,)).fetchone()
+            if row is not None:
+                logger.info(f"'{filename}' already exists in SQLite materials table.")
+                return row["id"]
+            size_bytes = os.path.getsize(file_path)
+            cur = conn.execute(
+                "INSERT INTO materials (filename, week_title, uploaded_at, size_bytes) VALUES (?, ?, ?, ?)",
+                (filename, week_title, datetime.utcnow().isoformat(), size_bytes),
+            )
+        logger.info(f"'{filename}' also added to SQLite materials table.")
+        return cur.lastrowid
+    except Exception as e:
+        logger.error(f"Failed to add '{filename}' to SQLite: {e}")
+        return None
+
+def _store_slides(material_id: int, documents: List[Any]):
+    """Replaces the stored slide text of a material; the hash of the text becomes the view's ETag."""
+    rows = [(material_id, doc.metadata.get("slide", n), doc.page_content) for n, doc in enumerate(documents, start=1)]
+    slides_hash = hashlib.sha256("\x1e".join(f"{slide}\x1f{content}" for _, slide, content in rows).encode("utf-8")).hexdigest()
+    with db.connection() as conn:
+        # The material may have been deleted while its deck was being ingested
+        if conn.execute("UPDATE materials SET slides_hash = ? WHERE id = ?", (slides_hash, material_id)).rowcount == 0:
+            return
+        conn.execute("DELETE FROM slides WHERE material_id = ?", (material_id,))
+        conn.executemany("INSERT INTO slides (material_id, slide, content) VALUES (?, ?, ?)", rows)
+
 class PPTXHandler(FileSystemEventHandler):
     def on_created(self, event):
         if not event.is_directory and event.src_path.endswith('.pptx'):
@@ -40,42 +96,23 @@ class PPTXHandler(FileSystemEventHandler):
 
     def ingest_file(self, file_path):
         filename = os.path.basename(file_path)
-        try:
-            week_title = filename.split('-')[0].strip()
-        except IndexError:
-            week_title = "Unassigned"
+        week_title = _week_title_for(filename)
         
         logger.info(f"Auto-ingesting '{filename}' with week title '{week_title}'...")
         try:
+            parsed = []
             ingest_pptx_to_chroma(
                 file_path=file_path,
                 week_title=week_title,
-                persist_directory=CHROMA_DIR
+                persist_directory=CHROMA_DIR,
+                on_documents=parsed.extend
             )
             logger.info(f"Successfully auto-ingested '{filename}'.")
 
             # Also update the SQLite database
-            conn = _get_db_conn()
-            cur = conn.cursor()
-            
-            # Check if the material already exists to avoid duplicates
-            cur.execute("SELECT id FROM materials WHERE filename = ?", (filename,))
-            if cur.fetchone() is None:
-                try:
-                    size_bytes = os.path.getsize(file_path)
-                    cur.execute(
-                        "INSERT INTO materials (filename, week_title, uploaded_at, size_bytes) VALUES (?, ?, ?, ?)",
-                        (filename, week_title, datetime.utcnow().isoformat(), size_bytes),
-                    )
-                    conn.commit()
-                    logger.info(f"'{filename}' also added to SQLite materials table.")
-                except Exception as e:
-                    logger.error(f"Failed to add '{filename}' to SQLite: {e}")
-                    conn.rollback()
-            else:
-                logger.info(f"'{filename}' already exists in SQLite materials table.")
-
-            conn.close()
+            material_id = _register_material(file_path, week_title)
+            if material_id is not None and parsed:
+                _store_slides(material_id, parsed)
         except Exception as e:
             logger.error(f"Failed to auto-ingest '{filename}': {e}")
 
@@ -96,7 +133,7 @@ def start_watcher():
 
 def ingest_existing_powerpoints():
     """Scans for existing PowerPoints and ingests them."""
-    directories_to_scan = ["./server/uploads"]
+    directories_to_scan = [UPLOADS_DIR]
     logger.info(f"Performing one-time scan of {directories_to_scan} for existing PowerPoints...")
     
     for directory in directories_to_scan:
@@ -104,11 +141,27 @@ def ingest_existing_powerpoints():
             logger.warning(f"Directory not found for initial scan: {directory}. Skipping.")
             continue
         
+        files = []
         for filename in os.listdir(directory):
             if filename.endswith(".pptx"):
                 file_path = os.path.join(directory, filename)
                 logger.info(f"Found existing file: {file_path}")
-                PPTXHandler().ingest_file(file_path)
+                files.append((file_path, _week_title_for(filename)))
+
+        # Parse, embed and write all decks in parallel instead of one file at a time
+        parsed: Dict[str, List[Any]] = {}
+        try:
+            stats = BulkIngestor(persist_directory=CHROMA_DIR).run(files, on_documents=parsed.__setitem__)
+        except Exception as e:
+            logger.error(f"Bulk ingest of {directory} failed: {e}")
+            continue
+
+        for file_path, week_title in files:
+            if os.path.basename(file_path) not in stats["failed_sources"]:
+                material_id = _register_material(file_path, week_title)
+                # Unchanged decks were not parsed; their slides are already stored or are parsed on first view
+                if material_id is not None and parsed.get(file_path):
+                    _store_slides(material_id, parsed[file_path])
 
 @app.on_event("startup")
 async def startup_event():
@@ -116,8 +169,64 @@ async def startup_event():
     watcher_thread = threading.Thread(target=start_watcher, daemon=True)
     ingest_thread = threading.Thread(target=ingest_existing_powerpoints, daemon=True)
     
+    # Build the BM25 index now rather than on the first question
+    lexical_thread = threading.Thread(target=lambda: rag_system.retriever.lexical_index, daemon=True)
+
     watcher_thread.start()
     ingest_thread.start()
+    lexical_thread.start()
+    job_queue.start()
+
+# --- Upload Size Limit ---
+class UploadTooLarge(HTTPException):
+    def __init__(self):
+        super().__init__(status_code=413, detail=UPLOAD_TOO_LARGE)
+
+@app.exception_handler(UploadTooLarge)
+async def upload_too_large_handler(request: Request, exc: UploadTooLarge):
+    return JSONResponse(status_code=exc.status_code, content={"error": exc.detail})
+
+class UploadSizeLimitMiddleware:
+    """
+    Refuse oversized /upload bodies before Starlette spools them to disk
+    A declared Content-Length over the limit is rejected without reading the body; a chunked body is
+    cut off as soon as the bytes received pass it. _save_upload still enforces the exact file size.
+    """
+
+    def __init__(self, app, path: str = "/upload", max_bytes: int = MAX_UPLOAD_BYTES + UPLOAD_FORM_OVERHEAD_BYTES):
+        self.app = app
+        self.path = path
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] != self.path:
+            await self.app(scope, receive, send)
+            return
+
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > self.max_bytes:
+            logger.warning(f"Upload rejected: Content-Length {int(content_length)} is over the 25MB limit.")
+            response = JSONResponse(status_code=413,
+                                    content={"error": UPLOAD_TOO_LARGE})
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    logger.warning("Upload rejected: body passed the 25MB limit while streaming.")
+                    # FastAPI re-raises HTTPExceptions from body parsing, so this reaches the handler above
+                    raise UploadTooLarge()
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+app.add_middleware(UploadSizeLimitMiddleware)
 
 # --- CORS Middleware ---
 app.add_middleware(
@@ -131,6 +240,18 @@ app.add_middleware(
 # --- Pydantic Models ---
 class QuestionRequest(BaseModel):
     question: str
+    # Optional scope; ingest stores the week title as each slide's module
+    module: Optional[str] = None
+    week: Optional[str] = None
+    source: Optional[str] = None
+
+    def retrieval_filters(self) -> Dict[str, str]:
+        filters = {}
+        if self.module or self.week:
+            filters["module"] = self.module or self.week
+        if self.source:
+            filters["source"] = self.source
+        return filters
 
 class NotificationPreferences(BaseModel):
     newMaterial: bool = True
@@ -155,85 +276,217 @@ class ProfileUpdateRequest(BaseModel):
 
 # --- RAG System Initialization ---
 rag_system = RetrievalAugmentedGeneration(persist_directory=CHROMA_DIR)
+# Cached answers may cite slides that changed, so any index change (upload, watcher, delete) drops them
+add_index_listener(lambda source: rag_system.answer_cache.invalidate())
 
 # --- Database Initialization ---
-def _get_db_conn():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
-
-def _init_db():
-    conn = _get_db_conn()
-    cur = conn.cursor()
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS faqs (
-            question TEXT PRIMARY KEY,
-            answer TEXT NOT NULL,
-            ask_count INTEGER NOT NULL DEFAULT 1,
-            last_asked TEXT NOT NULL
-        );
-    """)
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS materials (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            filename TEXT NOT NULL,
-            week_title TEXT NOT NULL,
-            uploaded_at TEXT NOT NULL,
-            size_bytes INTEGER NOT NULL
-        );
-    """)
-    conn.commit()
-    conn.close()
-
-_init_db()
+db = ConnectionPool(DB_PATH)
+db.migrate()
+
+# --- Upload Ingest Jobs ---
+def _run_ingest_job(job: Dict[str, Any], progress) -> int:
+    def on_documents(documents):
+        if job["material_id"] is not None:
+            _store_slides(job["material_id"], documents)
+
+    # The upload was hashed as it streamed in; reuse that rather than reading the file again
+    material = _get_material(job["material_id"]) if job["material_id"] is not None else None
+    try:
+        chunks = ingest_pptx_to_chroma(
+            job["file_path"], week_title=job["week_title"], persist_directory=CHROMA_DIR,
+            progress=progress, on_documents=on_documents,
+            # A material deleted mid-ingest cancels its job; stop before writing more vectors for it
+            before_write=lambda: job_queue.raise_if_cancelled(job["id"]),
+            content_hash=material["content_hash"] if material else None
+        )
+        job_queue.raise_if_cancelled(job["id"])
+    except JobCancelled:
+        # The delete may have cleared the index while a batch was being written; clear it again
+        remove_pptx_from_chroma(os.path.basename(job["file_path"]), persist_directory=CHROMA_DIR)
+        raise
+    except Exception:
+        ERRORS.inc("ingest")
+        raise
+    queued_at = datetime.fromisoformat(job["created_at"])
+    UPLOAD_TO_SEARCHABLE_SECONDS.observe((datetime.utcnow() - queued_at).total_seconds())
+    return chunks
+
+job_queue = IngestJobQueue(db, _run_ingest_job)
+
+# --- Metrics read at scrape time ---
+def _cache_samples(field: str):
+    return [(("answer",), rag_system.answer_cache.stats()[field]),
+            (("query_embedding",), rag_system.retriever.query_cache.stats()[field])]
+
+REGISTRY.callback("classroom_cache_hits_total", "Answer and query embedding cache hits", "counter",
+                  lambda: _cache_samples("hits"), labelnames=("cache",))
+REGISTRY.callback("classroom_cache_misses_total", "Answer and query embedding cache misses", "counter",
+                  lambda: _cache_samples("misses"), labelnames=("cache",))
+REGISTRY.callback("classroom_generation_queue_depth", "Questions waiting for an LLM generation slot", "gauge",
+                  lambda: [((), rag_system.admission.stats()["queued"])])
+REGISTRY.callback("classroom_generation_active", "LLM generations in progress", "gauge",
+                  lambda: [((), rag_system.admission.stats()["active"])])
+REGISTRY.callback("classroom_admission_rejected_total", "Questions turned away with 429 by admission control",
+                  "counter", lambda: [((), rag_system.admission.stats()["rejected"])])
+REGISTRY.callback("classroom_lexical_fallbacks_total", "Questions answered by BM25 alone because embedding was slow",
+                  "counter", lambda: [((), rag_system.retriever.lexical_fallbacks)])
+REGISTRY.callback("classroom_ingest_queue_depth", "Upload ingest jobs waiting or running", "gauge",
+                  lambda: [((status,), job_queue.status_counts().get(status, 0)) for status in (QUEUED, RUNNING)],
+                  labelnames=("status",))
 
 # --- API Endpoints ---
-def upsert_faq(question: str, answer: str):
-    conn = _get_db_conn()
-    cur = conn.cursor()
+def upsert_faq(question: str, answer: Optional[str]):
+    """Count one ask of the question; answer None (an extractive fallback) keeps the stored model answer"""
     now = datetime.utcnow().isoformat()
-    cur.execute(
-        "UPDATE faqs SET answer = ?, ask_count = ask_count + 1, last_asked = ? WHERE question = ?",
-        (answer, now, question.strip()),
-    )
-    if cur.rowcount == 0:
-        cur.execute(
-            "INSERT INTO faqs (question, answer, ask_count, last_asked) VALUES (?, ?, ?, ?)",
-            (question.strip(), answer, 1, now),
+    with db.connection() as conn:
+        cur = conn.execute(
+            "UPDATE faqs SET answer = COALESCE(?, answer), ask_count = ask_count + 1, last_asked = ? "
+            "WHERE question = ?",
+            (answer, now, question.strip()),
         )
-    conn.commit()
-    conn.close()
+        if cur.rowcount == 0:
+            # A question first seen as a fallback is counted with no answer until the model answers it
+            conn.execute(
+                "INSERT INTO faqs (question, answer, ask_count, last_asked) VALUES (?, ?, ?, ?)",
+                (question.strip(), answer or "", 1, now),
+            )
+
+def _faq_answer(result: Dict[str, Any]) -> Optional[str]:
+    """The answer worth keeping in the faqs table; fallbacks are not"""
+    return None if result.get("fallback") else result.get("answer", "")
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    """Format one Server-Sent Event frame."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def _overloaded_response(rejection: AdmissionRejected) -> JSONResponse:
+    return JSONResponse(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        content={"error": "The assistant is busy. Please try again shortly.", "retry_after": rejection.retry_after},
+        headers={"Retry-After": str(rejection.retry_after)},
+    )
+
+async def _ask_event_stream(question: str, filters: Optional[Dict[str, str]] = None,
+                            priority: int = PRIORITY_STUDENT) -> AsyncIterator[str]:
+    """Relays RAG stream events as SSE frames and records the FAQ once the answer is complete."""
+    done = None
+    started = time.perf_counter()
+    try:
+        async for event in rag_system.astream_question(question, filters=filters, priority=priority):
+            if event["event"] == "done":
+                done = event["data"]
+            yield _sse(event["event"], event["data"])
+    except AdmissionRejected as e:
+        # The queue filled up after the stream started
+        yield _sse("error", {"error": "The assistant is busy. Please try again shortly.", "retry_after": e.retry_after})
+        return
+    except Exception as e:
+        ERRORS.inc("ask_stream")
+        logger.error(f"Error streaming answer: {e}")
+        yield _sse("error", {"error": "Failed to process the question."})
+        return
+    ASK_SECONDS.observe(time.perf_counter() - started, "ask_stream")
+
+    if done is not None:
+        try:
+            await run_blocking(upsert_faq, question=question, answer=_faq_answer(done))
+        except Exception as db_err:
+            logger.warning(f"Failed to upsert FAQ: {db_err}")
+
+def _streaming_answer(question: str, filters: Optional[Dict[str, str]] = None,
+                      priority: int = PRIORITY_STUDENT) -> StreamingResponse:
+    return StreamingResponse(
+        _ask_event_stream(question, filters, priority),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+def _request_priority(http_request: Request) -> int:
+    """Instructor priority only for a request carrying INSTRUCTOR_TOKEN; never taken from the request body"""
+    token = http_request.headers.get("x-instructor-token", "")
+    if INSTRUCTOR_TOKEN and hmac.compare_digest(token.encode("utf-8"), INSTRUCTOR_TOKEN.encode("utf-8")):
+        return PRIORITY_INSTRUCTOR
+    return PRIORITY_STUDENT
+
+@app.post("/ask/stream")
+async def ask_stream(request: QuestionRequest, http_request: Request):
+    logger.info(f"Received streamed question: {request.question}")
+    filters, priority = request.retrieval_filters(), _request_priority(http_request)
+    try:
+        rag_system.check_admission(request.question, filters, priority)
+    except AdmissionRejected as e:
+        return _overloaded_response(e)
+    return _streaming_answer(request.question, filters, priority)
 
 @app.post("/ask")
-async def ask(request: QuestionRequest):
+async def ask(request: QuestionRequest, http_request: Request):
+    if "text/event-stream" in http_request.headers.get("accept", ""):
+        return await ask_stream(request, http_request)
+
     logger.info(f"Received question: {request.question}")
+    started = time.perf_counter()
+    filters, priority = request.retrieval_filters(), _request_priority(http_request)
     try:
-        result = rag_system.ask_question(request.question)
+        # Turn the request away before spending an embedding and a search on it
+        rag_system.check_admission(request.question, filters, priority)
+        result = await rag_system.aask_question(request.question, filters=filters, priority=priority)
+        ASK_SECONDS.observe(time.perf_counter() - started, "ask")
         try:
-            upsert_faq(question=request.question, answer=result.get("answer", ""))
+            await run_blocking(upsert_faq, question=request.question, answer=_faq_answer(result))
         except Exception as db_err:
             logger.warning(f"Failed to upsert FAQ: {db_err}")
         return result
+    except AdmissionRejected as e:
+        return _overloaded_response(e)
     except Exception as e:
+        ERRORS.inc("ask")
         logger.error(f"Error processing question: {e}")
         return {"error": "Failed to process the question."}
 
+@app.get("/stats")
+def get_stats() -> Dict[str, Any]:
+    """Hit/miss counters for the answer and query embedding caches."""
+    return {
+        "answer_cache": rag_system.answer_cache.stats(),
+        "query_embedding_cache": rag_system.retriever.query_cache.stats(),
+        "query_embedding_batcher": rag_system.retriever.embed_batcher.stats(),
+        "coalescing": rag_system.coalescing_stats(),
+        "admission": rag_system.admission.stats(),
+        "context_packer": rag_system.retriever.context_packer.stats(),
+        "lexical_index": rag_system.retriever.lexical_index.stats(),
+        "vector_index": rag_system.retriever.vector_backend.stats(),
+        "lexical_fallbacks": rag_system.retriever.lexical_fallbacks,
+    }
+
+@app.get("/metrics")
+def get_metrics() -> Response:
+    """Latency histograms, counters and gauges in the Prometheus text format."""
+    return Response(content=REGISTRY.render(), media_type=CONTENT_TYPE)
+
 @app.get("/faqs")
 def list_faqs() -> List[Dict[str, Any]]:
-    conn = _get_db_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT question, answer, ask_count, last_asked FROM faqs ORDER BY ask_count DESC, last_asked DESC")
-    rows = [dict(r) for r in cur.fetchall()]
-    conn.close()
+    with db.connection() as conn:
+        rows = [dict(r) for r in conn.execute(
+            "SELECT question, answer, ask_count, last_asked FROM faqs WHERE answer != '' "
+            "ORDER BY ask_count DESC, last_asked DESC"
+        )]
     return rows
 
+# Latest ingest job status -> material status as the client shows it; decks found by the startup
+# scan or the watcher have no job and are indexed by the time they are listed
+_MATERIAL_STATUS = {QUEUED: "processing", RUNNING: "processing", FAILED: "error"}
+
 @app.get("/materials")
 def list_materials_grouped() -> List[Dict[str, Any]]:
-    conn = _get_db_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT id, filename, week_title, uploaded_at, size_bytes FROM materials ORDER BY uploaded_at ASC, id ASC")
-    rows = [dict(r) for r in cur.fetchall()]
-    conn.close()
+    with db.connection() as conn:
+        rows = [dict(r) for r in conn.execute(
+            """
+            SELECT m.id, m.filename, m.week_title, m.uploaded_at, m.size_bytes,
+                   (SELECT j.status FROM ingest_jobs j WHERE j.material_id = m.id ORDER BY j.id DESC LIMIT 1)
+                       AS job_status
+            FROM materials m ORDER BY m.uploaded_at ASC, m.id ASC
+            """
+        )]
 
     grouped: Dict[str, List[Dict[str, Any]]] = {}
     for r in rows:
@@ -243,7 +496,7 @@ def list_materials_grouped() -> List[Dict[str, Any]]:
             "name": r["filename"],
             "size_bytes": r["size_bytes"],
             "uploadDate": (r["uploaded_at"] or "").split("T")[0],
-            "status": "processed"
+            "status": _MATERIAL_STATUS.get(r["job_status"], "processed")
         })
 
     weeks: List[Dict[str, Any]] = []
@@ -255,6 +508,81 @@ def list_materials_grouped() -> List[Dict[str, Any]]:
         })
     return weeks
 
+@app.get("/materials/filters")
+def list_material_filters() -> Dict[str, Any]:
+    """Modules and decks that /ask can be scoped to, in upload order."""
+    with db.connection() as conn:
+        rows = conn.execute(
+            "SELECT filename, week_title FROM materials ORDER BY uploaded_at ASC, id ASC"
+        ).fetchall()
+
+    modules: List[str] = []
+    sources: List[Dict[str, str]] = []
+    seen_sources = set()
+    for r in rows:
+        if r["week_title"] not in modules:
+            modules.append(r["week_title"])
+        if r["filename"] not in seen_sources:
+            seen_sources.add(r["filename"])
+            sources.append({"source": r["filename"], "module": r["week_title"]})
+    return {"modules": modules, "sources": sources}
+
+def _insert_material(filename: str, week_title: str, size_bytes: int, content_hash: Optional[str] = None) -> int:
+    with db.connection() as conn:
+        cur = conn.execute(
+            "INSERT INTO materials (filename, week_title, uploaded_at, size_bytes, content_hash) VALUES (?, ?, ?, ?, ?)",
+            (filename, week_title, datetime.utcnow().isoformat(), size_bytes, content_hash),
+        )
+        return cur.lastrowid
+
+async def _save_upload(file: UploadFile, save_path: str) -> Optional[Tuple[int, str]]:
+    """
+    Stream an upload to disk in fixed-size chunks, hashing as it goes
+    Returns (size_bytes, sha256), or None once the upload passes MAX_UPLOAD_BYTES; the partial
+    temp file is discarded. The temp file lives in the target directory so the final rename is atomic
+    and readers never see a half-written deck.
+    """
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(save_path), prefix=".upload-", suffix=".part")
+    digest = hashlib.sha256()
+    size_bytes = 0
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size_bytes += len(chunk)
+                if size_bytes > MAX_UPLOAD_BYTES:
+                    return None
+                digest.update(chunk)
+                await run_blocking(out.write, chunk)
+        await run_blocking(os.replace, temp_path, save_path)
+        return size_bytes, digest.hexdigest()
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def _get_material(material_id: int) -> Optional[sqlite3.Row]:
+    with db.connection() as conn:
+        return conn.execute(
+            "SELECT id, filename, week_title, uploaded_at, size_bytes, slides_hash, content_hash FROM materials WHERE id = ?",
+            (material_id,)
+        ).fetchone()
+
+def _get_slides(material_id: int, offset: int, limit: Optional[int]) -> Tuple[int, List[Dict[str, Any]]]:
+    with db.connection() as conn:
+        total = conn.execute("SELECT COUNT(*) FROM slides WHERE material_id = ?", (material_id,)).fetchone()[0]
+        rows = conn.execute(
+            "SELECT slide, content FROM slides WHERE material_id = ? ORDER BY slide LIMIT ? OFFSET ?",
+            (material_id, -1 if limit is None else limit, offset),
+        ).fetchall()
+    return total, [dict(r) for r in rows]
+
+def _delete_material_row(material_id: int):
+    with db.connection() as conn:
+        conn.execute("DELETE FROM slides WHERE material_id = ?", (material_id,))
+        conn.execute("DELETE FROM materials WHERE id = ?", (material_id,))
+
 @app.post("/upload")
 async def upload_material(file: UploadFile = File(...), week_title: str = Form("Unassigned")):
     original_name = file.filename
@@ -263,40 +591,50 @@ async def upload_material(file: UploadFile = File(...), week_title: str = Form("
 
     save_path = os.path.join(UPLOADS_DIR, original_name)
     try:
-        content = await file.read()
-        size_bytes = len(content)
-
-        if size_bytes > 25 * 1024 * 1024:
+        saved = await _save_upload(file, save_path)
+        if saved is None:
             logger.warning(f"Upload failed for '{original_name}': size is over the 25MB limit.")
-            return {"error": "File exceeds 25MB limit."}
-
-        with open(save_path, "wb") as f:
-            f.write(content)
+            return JSONResponse(status_code=413, content={"error": UPLOAD_TOO_LARGE})
+        size_bytes, content_hash = saved
 
-        num_docs = ingest_pptx_to_chroma(save_path, week_title=week_title, persist_directory=CHROMA_DIR)
+        # Parsing and embedding happen on the job workers; the client polls /jobs/{job_id}
+        material_id = await run_blocking(_insert_material, original_name, week_title, size_bytes, content_hash)
+        job_id = await run_blocking(job_queue.enqueue, save_path, week_title, material_id)
 
-        conn = _get_db_conn()
-        cur = conn.cursor()
-        cur.execute(
-            "INSERT INTO materials (filename, week_title, uploaded_at, size_bytes) VALUES (?, ?, ?, ?)",
-            (original_name, week_title, datetime.utcnow().isoformat(), size_bytes),
-        )
-        material_id = cur.lastrowid
-        conn.commit()
-        conn.close()
-
-        return {
+        return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content={
             "id": material_id,
-            "status": "processed",
+            "job_id": job_id,
+            "status": "queued",
             "filename": original_name,
             "week_title": week_title,
             "size_bytes": size_bytes,
-            "slides_indexed": num_docs,
-        }
+            "sha256": content_hash,
+        })
     except Exception as e:
+        ERRORS.inc("upload")
         logger.error(f"Failed to process upload {original_name}: {e}")
         return {"error": f"Failed to upload/process file: {str(e)}"}
 
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: int):
+    job = await run_blocking(job_queue.get, job_id)
+    if not job:
+        return {"error": "Job not found."}
+    return {
+        "id": job["id"],
+        "material_id": job["material_id"],
+        "filename": os.path.basename(job["file_path"]),
+        "week_title": job["week_title"],
+        "status": job["status"],
+        "chunks_processed": job["chunks_processed"],
+        "chunks_total": job["chunks_total"],
+        "error": job["error"],
+        "attempts": job["attempts"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+    }
+
 @app.get("/files")
 async def list_files():
     """
@@ -307,33 +645,60 @@ async def list_files():
         return {"error": "Files directory not found on server."}
 
     try:
-        files = [f for f in os.listdir(UPLOADS_DIR) if os.path.isfile(os.path.join(UPLOADS_DIR, f))]
+        # Skip in-progress uploads, which are hidden temp files until they are renamed into place
+        files = [f for f in os.listdir(UPLOADS_DIR)
+                 if os.path.isfile(os.path.join(UPLOADS_DIR, f)) and not f.startswith(".")]
         return {"files": files}
     except Exception as e:
         logger.error(f"Failed to list files in '{UPLOADS_DIR}': {e}")
         return {"error": f"Failed to list files: {str(e)}"}
 
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match check: a list of entity tags or "*", compared weakly (a W/ prefix is ignored)"""
+    if not if_none_match:
+        return False
+    tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in tags or etag.removeprefix("W/") in tags
+
 @app.get("/materials/{material_id}/view")
-async def view_material_content(material_id: int):
-    conn = _get_db_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT filename, week_title FROM materials WHERE id = ?", (material_id,))
-    row = cur.fetchone()
-    conn.close()
+async def view_material_content(material_id: int, request: Request, offset: int = 0, limit: Optional[int] = None):
+    row = await run_blocking(_get_material, material_id)
     if not row:
         return {"error": "Material not found."}
 
-    file_path = os.path.join(UPLOADS_DIR, row["filename"])
-    if not os.path.exists(file_path):
-        return {"error": "File not found on server."}
-
-    try:
-        documents = pptx_to_documents(file_path, week_title=row["week_title"])
-        extracted_content = [{"slide": doc.metadata.get("slide", -1), "content": doc.page_content} for doc in documents]
-        return {"filename": row["filename"], "week_title": row["week_title"], "content": extracted_content}
-    except Exception as e:
-        logger.error(f"Failed to extract content from {row['filename']}: {e}")
-        return {"error": f"Failed to extract content: {str(e)}"}
+    slides_hash = row["slides_hash"]
+    if slides_hash is None:
+        # Decks indexed before slide text was stored are parsed once and kept from then on
+        file_path = os.path.join(UPLOADS_DIR, row["filename"])
+        if not os.path.exists(file_path):
+            return {"error": "File not found on server."}
+        try:
+            documents = await run_blocking(pptx_to_documents, file_path, week_title=row["week_title"])
+            await run_blocking(_store_slides, material_id, documents)
+        except Exception as e:
+            logger.error(f"Failed to extract content from {row['filename']}: {e}")
+            return {"error": f"Failed to extract content: {str(e)}"}
+        row = await run_blocking(_get_material, material_id)
+        if not row:
+            return {"error": "Material not found."}
+        slides_hash = row["slides_hash"]
+
+    offset = max(0, offset)
+    limit = None if limit is None else max(0, limit)
+    etag = f'"{slides_hash[:32]}-{offset}-{"all" if limit is None else limit}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    total, slides = await run_blocking(_get_slides, material_id, offset, limit)
+    return JSONResponse(headers=headers, content={
+        "filename": row["filename"],
+        "week_title": row["week_title"],
+        "total_slides": total,
+        "offset": offset,
+        "limit": limit,
+        "content": slides,
+    })
 
 @app.get("/profile", response_model=Profile)
 async def get_current_profile():
@@ -346,22 +711,16 @@ async def update_current_profile(profile_update: ProfileUpdateRequest):
 
 @app.delete("/materials/{material_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_material(material_id: int):
-    conn = _get_db_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT filename FROM materials WHERE id = ?", (material_id,))
-    row = cur.fetchone()
+    row = await run_blocking(_get_material, material_id)
     if not row:
-        conn.close()
         return Response(status_code=status.HTTP_204_NO_CONTENT)
 
     filename = row["filename"]
-    
+
+    # Stop any ingest still running for it first, so it cannot write vectors after they are removed
+    await run_blocking(job_queue.cancel_for_material, material_id)
     try:
-        embedding_function = OllamaEmbeddings(model="nomic-embed-text", base_url="http://localhost:11434")
-        vector_store = Chroma(persist_directory=CHROMA_DIR, embedding_function=embedding_function)
-        docs_to_delete = vector_store.get(where={"source": filename})
-        if docs_to_delete and docs_to_delete.get('ids'):
-            vector_store.delete(ids=docs_to_delete['ids'])
+        await run_blocking(remove_pptx_from_chroma, filename, persist_directory=CHROMA_DIR)
     except Exception as e:
         logger.error(f"Error deleting from ChromaDB for source {filename}: {e}")
 
@@ -369,9 +728,7 @@ async def delete_material(material_id: int):
     if os.path.exists(file_path):
         os.remove(file_path)
 
-    cur.execute("DELETE FROM materials WHERE id = ?", (material_id,))
-    conn.commit()
-    conn.close()
+    await run_blocking(_delete_material_row, material_id)
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 @app.get("/")
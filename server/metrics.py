@@ -0,0 +1,221 @@
+"""
+Latency and throughput metrics for AI Classroom Co-Pilot
+Per-stage histograms for questions (NFR-1, p95 <= 3 s) and ingest (NFR-2, upload <= 30 s), plus
+counters and gauges, served by /metrics in the Prometheus text exposition format
+Observing a value is a bisect and two additions under a lock; values that other components
+already count (cache hits, queue depth) are read only when /metrics is scraped
+"""
+
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; 3 and 30 are bucket edges so the NFR targets can be read straight off the histograms
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 10.0, 30.0, 60.0)
+SLIDE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+Labels = Tuple[str, ...]
+# A scrape-time callback returns (label values, value) pairs
+Sample = Tuple[Labels, float]
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_text(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    """Base for one metric family; label values are passed positionally in labelnames order"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Sequence[str]) -> Labels:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(label) for label in labels)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, *labels: str) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return self.header() + [f"{self.name}{_label_text(self.labelnames, key)} {_format_value(value)}"
+                                for key, value in values]
+
+
+class Histogram(Metric):
+    """Cumulative-bucket histogram; observe() is the hot-path call"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float] = LATENCY_BUCKETS,
+                 labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [count per bucket..., count above the last bucket], and the running sum
+        self._counts: Dict[Labels, List[int]] = {}
+        self._sums: Dict[Labels, float] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._counts.get(key)
+            if counts is None:
+                counts = self._counts[key] = [0] * (len(self.buckets) + 1)
+                self._sums[key] = 0.0
+            counts[index] += 1
+            self._sums[key] += value
+
+    @contextmanager
+    def time(self, *labels: str) -> Iterator[None]:
+        """Observe the wall time of the with block"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def count(self, *labels: str) -> int:
+        with self._lock:
+            return sum(self._counts.get(self._key(labels), ()))
+
+    def render(self) -> List[str]:
+        with self._lock:
+            snapshot = sorted((key, list(counts), self._sums[key]) for key, counts in self._counts.items())
+        lines = self.header()
+        for key, counts, total in snapshot:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_label_text(self.labelnames, key, ('le', _format_value(bound)))} "
+                             f"{cumulative}")
+            labels = _label_text(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class CallbackMetric(Metric):
+    """A counter or gauge whose samples are read from another component when metrics are scraped"""
+
+    def __init__(self, name: str, documentation: str, kind: str, collect: Callable[[], List[Sample]],
+                 labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.kind = kind
+        self.collect = collect
+
+    def render(self) -> List[str]:
+        return self.header() + [f"{self.name}{_label_text(self.labelnames, key)} {_format_value(value)}"
+                                for key, value in self.collect()]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        """Add a metric; registering a name again replaces the earlier one (e.g. a rebuilt component)"""
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, buckets: Sequence[float] = LATENCY_BUCKETS,
+                  labelnames: Sequence[str] = ()) -> Histogram:
+        return self.register(Histogram(name, documentation, buckets, labelnames))
+
+    def callback(self, name: str, documentation: str, kind: str, collect: Callable[[], List[Sample]],
+                 labelnames: Sequence[str] = ()) -> CallbackMetric:
+        return self.register(CallbackMetric(name, documentation, kind, collect, labelnames))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                # One failing collector must not take the whole scrape down
+                lines.append(f"# {metric.name} unavailable: {_escape(str(e))}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+# Questions
+QUERY_EMBED_SECONDS = REGISTRY.histogram(
+    "classroom_query_embed_seconds", "Time to embed a question that missed the query embedding cache")
+VECTOR_SEARCH_SECONDS = REGISTRY.histogram(
+    "classroom_vector_search_seconds", "Time to find candidate chunks (vector search plus BM25 fusion)")
+CONTEXT_FORMAT_SECONDS = REGISTRY.histogram(
+    "classroom_context_format_seconds", "Time to pack and format retrieved chunks into the LLM context")
+LLM_GENERATION_SECONDS = REGISTRY.histogram(
+    "classroom_llm_generation_seconds", "Time for the LLM to produce a complete answer", labelnames=("mode",))
+ASK_SECONDS = REGISTRY.histogram(
+    "classroom_ask_seconds", "Total time to answer a question, from request to complete answer",
+    labelnames=("endpoint",))
+ERRORS = REGISTRY.counter("classroom_errors_total", "Failed requests and pipeline stages", labelnames=("stage",))
+DEADLINE_FALLBACKS = REGISTRY.counter(
+    "classroom_deadline_fallbacks_total", "Answers replaced by an extractive fallback after missing the deadline")
+
+# Ingest
+INGEST_PARSE_SECONDS = REGISTRY.histogram(
+    "classroom_ingest_parse_seconds_per_slide", "Time to parse and chunk a deck, per slide", SLIDE_BUCKETS)
+INGEST_EMBED_SECONDS = REGISTRY.histogram(
+    "classroom_ingest_embed_seconds_per_slide", "Time to embed new chunks, per chunk embedded", SLIDE_BUCKETS)
+INGEST_WRITE_SECONDS = REGISTRY.histogram(
+    "classroom_ingest_write_seconds_per_slide", "Time to write new chunks to the indexes, per chunk written",
+    SLIDE_BUCKETS)
+UPLOAD_TO_SEARCHABLE_SECONDS = REGISTRY.histogram(
+    "classroom_upload_to_searchable_seconds", "Time from an upload being queued until its slides are searchable")
@@ -0,0 +1,135 @@
+"""
+Micro-batching of query embeddings for AI Classroom Co-Pilot
+Questions that arrive together (a class asking at once) share one embed_documents call to Ollama
+instead of one request each; the vectors are fanned back out to every waiting caller
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+QUERY_BATCH_WINDOW_MS = float(os.environ.get("QUERY_BATCH_WINDOW_MS", "5"))
+QUERY_BATCH_MAX_SIZE = int(os.environ.get("QUERY_BATCH_MAX_SIZE", "32"))
+QUERY_BATCH_MAX_IN_FLIGHT = int(os.environ.get("QUERY_BATCH_MAX_IN_FLIGHT", "2"))
+
+
+class QueryEmbeddingBatcher:
+    """
+    Collects concurrent query embedding requests and sends them to Ollama as one batch
+    A request that arrives while no batch is in flight is sent at once, so a lone user never
+    waits for the window. Requests arriving while Ollama is busy are held for up to window_ms
+    or until max_batch_size are waiting, then sent together; identical texts are embedded once.
+    Usable from threads (embed) and from the event loop (aembed).
+    """
+
+    def __init__(self, embeddings, window_ms: float = QUERY_BATCH_WINDOW_MS,
+                 max_batch_size: int = QUERY_BATCH_MAX_SIZE, max_in_flight: int = QUERY_BATCH_MAX_IN_FLIGHT):
+        self.embeddings = embeddings
+        self.window = max(0.0, window_ms) / 1000
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_in_flight = max(1, max_in_flight)
+        self._pending: List[Tuple[str, Future]] = []
+        self._first_pending_at = 0.0
+        self._in_flight = 0
+        self._cond = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix="query-embed")
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        self.requests = 0
+        self.batches = 0
+        self.texts_embedded = 0
+        self.largest_batch = 0
+
+    def submit(self, text: str) -> "Future[List[float]]":
+        """Queue one query and return a future for its vector"""
+        future: "Future[List[float]]" = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Query embedding batcher is closed")
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="query-embed-batcher", daemon=True)
+                self._thread.start()
+            if not self._pending:
+                self._first_pending_at = time.monotonic()
+            self._pending.append((text, future))
+            self.requests += 1
+            self._cond.notify_all()
+        return future
+
+    def embed(self, text: str) -> List[float]:
+        return self.submit(text).result()
+
+    async def aembed(self, text: str) -> List[float]:
+        return await asyncio.wrap_future(self.submit(text))
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._executor.shutdown(wait=False)
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._closed and (not self._pending or self._in_flight >= self.max_in_flight):
+                    self._cond.wait()
+                if self._closed:
+                    return
+                # Hold the batch open only while Ollama is already busy with another one
+                while self._in_flight and len(self._pending) < self.max_batch_size and not self._closed:
+                    remaining = self._first_pending_at + self.window - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch, self._pending = self._pending[:self.max_batch_size], self._pending[self.max_batch_size:]
+                self._first_pending_at = time.monotonic()
+                self._in_flight += 1
+            self._executor.submit(self._dispatch, batch)
+
+    def _dispatch(self, batch: List[Tuple[str, Future]]) -> None:
+        try:
+            # Callers that gave up (e.g. a cancelled request) are dropped before the Ollama call
+            batch = [(text, future) for text, future in batch if future.set_running_or_notify_cancel()]
+            texts = list(dict.fromkeys(text for text, _ in batch))
+            if not texts:
+                return
+            try:
+                if len(texts) == 1:
+                    vectors = [self.embeddings.embed_query(texts[0])]
+                else:
+                    vectors = self.embeddings.embed_documents(texts)
+            except Exception as e:
+                logger.warning(f"Batched embedding of {len(texts)} queries failed: {e}")
+                for _, future in batch:
+                    future.set_exception(e)
+                return
+            # Counted before any caller is released, so stats() read after an embed includes its batch
+            with self._cond:
+                self.batches += 1
+                self.texts_embedded += len(texts)
+                self.largest_batch = max(self.largest_batch, len(batch))
+            by_text = dict(zip(texts, vectors))
+            for text, future in batch:
+                future.set_result(by_text[text])
+        finally:
+            with self._cond:
+                self._in_flight -= 1
+                self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "requests": self.requests,
+                "batches": self.batches,
+                "texts_embedded": self.texts_embedded,
+                "largest_batch": self.largest_batch,
+                "average_batch": round(self.texts_embedded / self.batches, 2) if self.batches else 0.0,
+                "window_ms": self.window * 1000,
+                "max_batch_size": self.max_batch_size,
+            }
@@ -0,0 +1,128 @@
+"""
+Process-wide registry of shared clients for AI Classroom Co-Pilot
+Retrieval, ingest and delete all use one Chroma client and collection handle per
+persist directory and one pooled Ollama embedding client, instead of reopening
+the persistent index and a new HTTP session on every call
+The vector backend and BM25 index that serve each persist directory live here too
+"""
+
+import logging
+import os
+import threading
+from typing import Dict, Optional
+
+import chromadb
+import ollama
+from langchain_chroma import Chroma
+from langchain_ollama import OllamaEmbeddings
+
+from server.lexical import BM25Index
+from server.vector_backends import ChromaBackend, NumpyBackend, VectorBackend
+
+logger = logging.getLogger(__name__)
+
+OLLAMA_BASE_URL = os.environ.get("OLLAMA_BASE_URL", "http://localhost:11434")
+EMBEDDING_MODEL = os.environ.get("EMBEDDING_MODEL", "nomic-embed-text")
+# "chroma" or "numpy"; see server/vector_backends.py
+VECTOR_BACKEND = os.environ.get("VECTOR_BACKEND", "chroma")
+NUMPY_INDEX_DIRNAME = "numpy_index"
+# numpy backend only: "none", "float16" or "int8" for the in-memory coarse search, and how many
+# candidates per requested result are re-scored against the full-precision vectors on disk
+VECTOR_QUANTIZATION = os.environ.get("VECTOR_QUANTIZATION", "none")
+VECTOR_RESCORE_FACTOR = int(os.environ.get("VECTOR_RESCORE_FACTOR", "4"))
+
+_lock = threading.Lock()
+_embeddings = None
+_ollama_client = None
+_async_ollama_client = None
+_vector_stores: Dict[str, Chroma] = {}
+_vector_backends: Dict[tuple, VectorBackend] = {}
+_lexical_lock = threading.Lock()
+_lexical_indexes: Dict[str, BM25Index] = {}
+
+
+def get_embeddings() -> OllamaEmbeddings:
+    """Shared embedding client; it pools HTTP connections for sync and async calls"""
+    global _embeddings
+    with _lock:
+        if _embeddings is None:
+            _embeddings = OllamaEmbeddings(model=EMBEDDING_MODEL, base_url=OLLAMA_BASE_URL)
+            logger.info(f"Created shared Ollama embedding client for '{EMBEDDING_MODEL}' at {OLLAMA_BASE_URL}")
+        return _embeddings
+
+
+def get_vector_store(persist_directory: str) -> Chroma:
+    """
+    Shared Chroma store for a persist directory
+    The underlying chromadb client is thread-safe, so one handle serves every thread
+    """
+    path = os.path.abspath(persist_directory)
+    embeddings = get_embeddings()
+    with _lock:
+        store = _vector_stores.get(path)
+        if store is None:
+            os.makedirs(path, exist_ok=True)
+            client = chromadb.PersistentClient(path=path)
+            store = Chroma(client=client, embedding_function=embeddings)
+            _vector_stores[path] = store
+            logger.info(f"Opened shared Chroma collection at {path}")
+        return store
+
+
+def get_vector_backend(persist_directory: str, name: Optional[str] = None) -> VectorBackend:
+    """Shared vector backend for a persist directory; defaults to the configured VECTOR_BACKEND"""
+    name = name or VECTOR_BACKEND
+    path = os.path.abspath(persist_directory)
+    if name == ChromaBackend.name:
+        store = get_vector_store(path)
+    elif name != NumpyBackend.name:
+        raise ValueError(f"Unknown vector backend '{name}'")
+    with _lock:
+        backend = _vector_backends.get((name, path))
+        if backend is None:
+            if name == ChromaBackend.name:
+                backend = ChromaBackend(store)
+            else:
+                backend = NumpyBackend(os.path.join(path, NUMPY_INDEX_DIRNAME), quantization=VECTOR_QUANTIZATION,
+                                       rescore_factor=VECTOR_RESCORE_FACTOR)
+                logger.info(f"Opened memory-mapped vector index at {backend.directory} "
+                            f"(quantization: {VECTOR_QUANTIZATION})")
+            _vector_backends[(name, path)] = backend
+        return backend
+
+
+def get_ollama_client() -> ollama.Client:
+    global _ollama_client
+    with _lock:
+        if _ollama_client is None:
+            _ollama_client = ollama.Client(host=OLLAMA_BASE_URL)
+        return _ollama_client
+
+
+def get_async_ollama_client() -> ollama.AsyncClient:
+    global _async_ollama_client
+    with _lock:
+        if _async_ollama_client is None:
+            _async_ollama_client = ollama.AsyncClient(host=OLLAMA_BASE_URL)
+        return _async_ollama_client
+
+
+def get_lexical_index(persist_directory: str) -> BM25Index:
+    """
+    Shared BM25 index for a persist directory, built from the vector backend on first use
+    Ingest keeps it current afterwards through peek_lexical_index
+    """
+    path = os.path.abspath(persist_directory)
+    with _lexical_lock:
+        index = _lexical_indexes.get(path)
+        if index is None:
+            # Registered before loading so writes that race the snapshot are still mirrored
+            index = BM25Index()
+            _lexical_indexes[path] = index
+            index.load(get_vector_backend(path).all_documents)
+        return index
+
+
+def peek_lexical_index(persist_directory: str) -> Optional[BM25Index]:
+    """The BM25 index for a persist directory if one has been built, without building it"""
+    return _lexical_indexes.get(os.path.abspath(persist_directory))
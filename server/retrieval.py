@@ -3,15 +3,164 @@ Data Retrieval System for AI Classroom Co-Pilot
 Updated for LangChain 1.0+
 """
 
-from langchain_chroma import Chroma
-from langchain_community.embeddings import OllamaEmbeddings
 from langchain_core.documents import Document
-from typing import List, Tuple, Dict, Any
+from typing import List, Tuple, Dict, Any, Optional
+import asyncio
 import logging
 import os
+import time
+
+import numpy as np
+
+from server import registry
+from server.cache import QueryEmbeddingCache
+from server.concurrency import run_blocking
+from server.deadline import DEADLINE_EMBED_SHARE, Deadline
+from server.lexical import BM25Index, reciprocal_rank_fusion
+from server.metrics import CONTEXT_FORMAT_SECONDS, QUERY_EMBED_SECONDS, VECTOR_SEARCH_SECONDS
+from server.microbatch import QueryEmbeddingBatcher
+from server.tokens import estimate_tokens, split_words
+from server.vector_backends import MetadataFilter
 
 logger = logging.getLogger(__name__)
 
+# Number of references handed to the LLM, and how many candidates the packer chooses them from
+RETRIEVAL_K = int(os.environ.get("RETRIEVAL_K", "3"))
+RETRIEVAL_FETCH_K = int(os.environ.get("RETRIEVAL_FETCH_K", "12"))
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", "1200"))
+CONTEXT_MMR_LAMBDA = float(os.environ.get("CONTEXT_MMR_LAMBDA", "0.7"))
+CONTEXT_DUPLICATE_SIMILARITY = float(os.environ.get("CONTEXT_DUPLICATE_SIMILARITY", "0.97"))
+
+# Hybrid retrieval: BM25 hits are fused with vector hits by reciprocal rank fusion
+HYBRID_RETRIEVAL = os.environ.get("HYBRID_RETRIEVAL", "1") != "0"
+RRF_K = int(os.environ.get("RRF_K", "60"))
+# Async questions fall back to BM25 alone when the query embedding takes longer than this,
+# or immediately when this many embedding calls are already waiting on Ollama
+EMBED_QUERY_TIMEOUT = float(os.environ.get("EMBED_QUERY_TIMEOUT", "1.0"))
+EMBED_SATURATION_LIMIT = int(os.environ.get("EMBED_SATURATION_LIMIT", "8"))
+
+
+class ContextPacker:
+    """
+    Chooses which retrieved chunks go into the prompt
+    Near-duplicates (the same slide repeated across deck parts) are dropped, the rest are picked by
+    Maximal Marginal Relevance, and references are added until the token budget is reached
+    """
+
+    def __init__(self, max_documents: int = RETRIEVAL_K, token_budget: int = CONTEXT_TOKEN_BUDGET,
+                 mmr_lambda: float = CONTEXT_MMR_LAMBDA,
+                 duplicate_similarity: float = CONTEXT_DUPLICATE_SIMILARITY):
+        self.max_documents = max_documents
+        self.token_budget = token_budget
+        self.mmr_lambda = mmr_lambda
+        self.duplicate_similarity = duplicate_similarity
+        self.requests = 0
+        self.tokens_packed = 0
+        self.tokens_saved = 0
+        self.duplicates_dropped = 0
+
+    @staticmethod
+    def _unit_rows(vectors: List[List[float]]) -> np.ndarray:
+        matrix = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    def pack(self, candidates: List[Tuple[Document, float, Optional[List[float]]]],
+             format_reference) -> Tuple[List[Tuple[Document, float]], Dict[str, int]]:
+        """
+        Select (document, score) pairs from (document, relevance, vector) candidates ranked best first
+        Relevance is in [0, 1], higher is better. Without vectors (lexical-only retrieval) only exact
+        duplicates are detected. format_reference(index, document, score) renders one reference so its
+        tokens can be counted. Returns the selection and packing statistics, including tokens saved
+        compared with sending the top max_documents candidates unfiltered
+        """
+        if not candidates:
+            return [], {"candidates": 0, "selected": 0, "duplicates_dropped": 0,
+                        "context_tokens": 0, "tokens_saved": 0}
+
+        baseline_tokens = sum(estimate_tokens(format_reference(i, doc, score))
+                              for i, (doc, score, _) in enumerate(candidates[:self.max_documents]))
+
+        relevance = np.asarray([score for _, score, _ in candidates], dtype=np.float32)
+        if all(vector is not None for _, _, vector in candidates):
+            vectors = self._unit_rows([vector for _, _, vector in candidates])
+            pairwise = vectors @ vectors.T
+        else:
+            pairwise = np.eye(len(candidates), dtype=np.float32)
+
+        # Drop near-duplicates of a better-ranked candidate
+        kept: List[int] = []
+        seen_text = set()
+        for i, (doc, _, _) in enumerate(candidates):
+            text = " ".join(doc.page_content.split()).lower()
+            if text in seen_text or any(pairwise[i, j] >= self.duplicate_similarity for j in kept):
+                continue
+            seen_text.add(text)
+            kept.append(i)
+        duplicates = len(candidates) - len(kept)
+
+        # Maximal Marginal Relevance, filling the token budget
+        selected: List[Tuple[Document, float]] = []
+        chosen: List[int] = []
+        remaining = list(kept)
+        used_tokens = 0
+        while remaining and len(selected) < self.max_documents:
+            if chosen:
+                redundancy = pairwise[np.ix_(remaining, chosen)].max(axis=1)
+            else:
+                redundancy = np.zeros(len(remaining), dtype=np.float32)
+            mmr = self.mmr_lambda * relevance[remaining] - (1 - self.mmr_lambda) * redundancy
+            pick = remaining.pop(int(np.argmax(mmr)))
+
+            doc, score, _ = candidates[pick]
+            tokens = estimate_tokens(format_reference(len(selected), doc, score))
+            if used_tokens + tokens > self.token_budget:
+                if selected:
+                    # Too big for what is left; a smaller candidate may still fit
+                    continue
+                # Never send an empty context: trim the best candidate to the budget
+                doc = self._truncate(doc, format_reference, score)
+                tokens = estimate_tokens(format_reference(0, doc, score))
+            chosen.append(pick)
+            selected.append((doc, score))
+            used_tokens += tokens
+
+        stats = {
+            "candidates": len(candidates),
+            "selected": len(selected),
+            "duplicates_dropped": duplicates,
+            "context_tokens": used_tokens,
+            "tokens_saved": max(0, baseline_tokens - used_tokens),
+        }
+        self.requests += 1
+        self.tokens_packed += used_tokens
+        self.tokens_saved += stats["tokens_saved"]
+        self.duplicates_dropped += duplicates
+        return selected, stats
+
+    def _truncate(self, document: Document, format_reference, score: float) -> Document:
+        overhead = estimate_tokens(format_reference(0, Document(page_content="", metadata=document.metadata), score))
+        allowance = max(0, self.token_budget - overhead)
+        kept, used = [], 0
+        for word in split_words(document.page_content):
+            cost = estimate_tokens(word)
+            if used + cost > allowance:
+                break
+            kept.append(word)
+            used += cost
+        return Document(page_content="".join(kept).rstrip(), metadata=document.metadata)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "token_budget": self.token_budget,
+            "tokens_packed": self.tokens_packed,
+            "tokens_saved": self.tokens_saved,
+            "duplicates_dropped": self.duplicates_dropped,
+        }
+
+
 class SlideRetriever:
     def __init__(self, persist_directory: str = "./chroma_db"):
         """Initialize the retrieval system with embedding model and ChromaDB"""
@@ -22,16 +171,25 @@ class SlideRetriever:
         logger.info(f"Using ChromaDB persist directory: {abs_path}")
 
         # Initialize embedding model - this converts text to vectors
-        self.embedding_model = OllamaEmbeddings(
-            model="nomic-embed-text",
-            base_url="http://localhost:11434"
-        )
+        # Shared with ingest; it holds one sync and one async Ollama HTTP client that every query reuses
+        self.embedding_model = registry.get_embeddings()
+        # Concurrent questions share one batched Ollama call instead of one request each
+        self.embed_batcher = QueryEmbeddingBatcher(self.embedding_model)
 
-        # Connect to Chroma vector database
-        self.vector_store = Chroma(
-            persist_directory=persist_directory,
-            embedding_function=self.embedding_model
-        )
+        # Connect to the vector backend (Chroma or memory-mapped NumPy) that ingest and delete also use
+        self.persist_directory = persist_directory
+        self.vector_backend = registry.get_vector_backend(persist_directory)
+        self.hybrid = HYBRID_RETRIEVAL
+        self.embed_timeout = EMBED_QUERY_TIMEOUT
+        self.embed_saturation_limit = EMBED_SATURATION_LIMIT
+        self._embeds_in_flight = 0
+        self.lexical_fallbacks = 0
+
+        # Repeated questions reuse their embedding instead of calling Ollama again
+        self.query_cache = QueryEmbeddingCache()
+
+        # Keeps prompts small: dedupes, diversifies and caps the references sent to the LLM
+        self.context_packer = ContextPacker()
 
         logger.info("SlideRetriever initialized successfully")
 
@@ -40,23 +198,86 @@ class SlideRetriever:
         Convert a text query into an embedding vector
         This enables semantic search by representing meaning as numbers
         """
+        embedding = self.query_cache.get(query)
+        if embedding is not None:
+            logger.debug(f"Query embedding cache hit: '{query}'")
+            return embedding
+
         logger.debug(f"Embedding query: '{query}'")
-        embedding = self.embedding_model.embed_query(query)
+        with QUERY_EMBED_SECONDS.time():
+            embedding = self.embed_batcher.embed(query)
         logger.debug(f"Generated embedding vector of length: {len(embedding)}")
+        self.query_cache.put(query, embedding)
         return embedding
 
-    def similarity_search(self, query: str, k: int = 5) -> List[Tuple[Document, float]]:
+    @property
+    def lexical_index(self) -> BM25Index:
+        """BM25 index over the same chunks as the vector store, built on first use"""
+        return registry.get_lexical_index(self.persist_directory)
+
+    async def aembed_query_fast(self, query: str, timeout: Optional[float] = None) -> Optional[List[float]]:
+        """
+        Embed the query unless Ollama is slow or saturated; returns None in that case
+        timeout overrides embed_timeout, e.g. with what is left of a request's deadline
+        A timed-out embedding keeps running and fills the query cache for the next ask
+        """
+        timeout = self.embed_timeout if timeout is None else timeout
+        embedding = self.query_cache.get(query)
+        if embedding is not None:
+            return embedding
+        if self._embeds_in_flight >= self.embed_saturation_limit:
+            logger.warning(f"{self._embeds_in_flight} query embeddings in flight; using lexical retrieval")
+            return None
+
+        self._embeds_in_flight += 1
+        task = asyncio.ensure_future(self.aembed_query(query))
+
+        def finished(_):
+            self._embeds_in_flight -= 1
+            if not task.cancelled():
+                task.exception()  # a late failure has nobody waiting; mark it retrieved
+
+        task.add_done_callback(finished)
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Query embedding took over {timeout:.2f}s; using lexical retrieval")
+            return None
+
+    async def aembed_query(self, query: str) -> List[float]:
+        """Async variant of embed_query; awaits the micro-batcher without blocking the event loop"""
+        embedding = self.query_cache.get(query)
+        if embedding is not None:
+            logger.debug(f"Query embedding cache hit: '{query}'")
+            return embedding
+
+        logger.debug(f"Embedding query: '{query}'")
+        started = time.perf_counter()
+        embedding = await self.embed_batcher.aembed(query)
+        QUERY_EMBED_SECONDS.observe(time.perf_counter() - started)
+        logger.debug(f"Generated embedding vector of length: {len(embedding)}")
+        self.query_cache.put(query, embedding)
+        return embedding
+
+    def similarity_search(self, query: str, k: int = 5, embedding: Optional[List[float]] = None,
+                          filters: Optional[MetadataFilter] = None) -> List[Tuple[Document, float]]:
         """
         Find the most similar slide content to the query
         Returns documents with similarity scores (0-1, where 1 is perfect match)
+        Pass a precomputed embedding to avoid embedding the query a second time,
+        and filters such as {"module": "Module 2"} to search only part of the index
         """
         logger.info(f"Searching for similar content to: '{query}'")
 
-        # This is the core similarity search - Chroma compares vectors
-        results = self.vector_store.similarity_search_with_score(
-            query,
-            k=k  # Return top k most similar documents
-        )
+        if embedding is None:
+            embedding = self.embed_query(query)
+
+        # This is the core similarity search - the vector backend compares vectors
+        results = [(document, score) for _, document, score, _ in self.vector_backend.query(
+            embedding,
+            k=k,  # Return top k most similar documents
+            where=filters
+        )]
 
         logger.info(f"Found {len(results)} relevant documents")
 
@@ -66,6 +287,108 @@ class SlideRetriever:
 
         return results
 
+    async def asimilarity_search(self, query: str, k: int = 5, embedding: Optional[List[float]] = None,
+                                 filters: Optional[MetadataFilter] = None) -> List[Tuple[Document, float]]:
+        """Async variant of similarity_search; the vector query runs on the blocking executor"""
+        if embedding is None:
+            embedding = await self.aembed_query(query)
+        return await run_blocking(self.similarity_search, query, k=k, embedding=embedding, filters=filters)
+
+    def _vector_candidates(self, embedding: List[float], fetch_k: int, filters: Optional[MetadataFilter] = None
+                           ) -> Tuple[List[str], List[Tuple[Document, float, List[float]]]]:
+        hits = self.vector_backend.query(embedding, k=fetch_k, where=filters)
+        return [doc_id for doc_id, _, _, _ in hits], [(doc, score, vector) for _, doc, score, vector in hits]
+
+    def lexical_candidates(self, query: str, fetch_k: int = RETRIEVAL_FETCH_K,
+                           filters: Optional[MetadataFilter] = None) -> List[Tuple[Document, float, Optional[List[float]]]]:
+        """BM25 hits only, with relevance relative to the best hit; needs no embedding"""
+        hits = self.lexical_index.search(query, k=fetch_k, where=filters)
+        if not hits:
+            return []
+        top = hits[0][2]
+        return [(document, score / top, None) for _, document, score in hits]
+
+    def candidate_search(self, embedding: List[float], fetch_k: int = RETRIEVAL_FETCH_K, query: Optional[str] = None,
+                         filters: Optional[MetadataFilter] = None) -> List[Tuple[Document, float, List[float]]]:
+        """
+        Nearest chunks with their stored vectors and relevance, best first, for the context packer
+        Given the query text and with hybrid retrieval on, BM25 hits are fused in by reciprocal rank fusion
+        Filters restrict both searches to matching chunks
+        """
+        with VECTOR_SEARCH_SECONDS.time():
+            return self._candidate_search(embedding, fetch_k, query, filters)
+
+    def _candidate_search(self, embedding: List[float], fetch_k: int, query: Optional[str],
+                          filters: Optional[MetadataFilter]) -> List[Tuple[Document, float, List[float]]]:
+        ids, vector_hits = self._vector_candidates(embedding, fetch_k, filters)
+        if query is None or not self.hybrid:
+            return vector_hits
+
+        lexical_hits = self.lexical_index.search(query, k=fetch_k, where=filters)
+        if not lexical_hits:
+            return vector_hits
+        fused = reciprocal_rank_fusion([ids, [doc_id for doc_id, _, _ in lexical_hits]], k=RRF_K)[:fetch_k]
+
+        by_id = {doc_id: (doc, vector) for doc_id, (doc, _, vector) in zip(ids, vector_hits)}
+        missing = [doc_id for doc_id, _, _ in lexical_hits if doc_id not in by_id]
+        if missing:
+            # Lexical-only hits still need their vectors for duplicate detection and MMR
+            vectors = self.vector_backend.get_vectors(missing)
+            for doc_id, document, _ in lexical_hits:
+                if doc_id in vectors:
+                    by_id.setdefault(doc_id, (document, vectors[doc_id]))
+
+        top = fused[0][1]
+        return [(by_id[doc_id][0], score / top, by_id[doc_id][1]) for doc_id, score in fused if doc_id in by_id]
+
+    def pack_context(self, query: str, embedding: Optional[List[float]],
+                     candidates: List[Tuple[Document, float, Optional[List[float]]]],
+                     mode: str = "hybrid", filters: Optional[MetadataFilter] = None) -> Dict[str, Any]:
+        """Run the context packer and build the retrieval result shared by the sync and async pipelines"""
+        started = time.perf_counter()
+        documents, packing = self.context_packer.pack(candidates, self._format_reference)
+        context = self.format_context_for_llm(documents)
+        CONTEXT_FORMAT_SECONDS.observe(time.perf_counter() - started)
+        logger.info(f"Packed {packing['selected']} of {packing['candidates']} candidates into "
+                    f"{packing['context_tokens']} tokens ({packing['tokens_saved']} saved, "
+                    f"{packing['duplicates_dropped']} duplicates dropped)")
+        return {
+            "query": query,
+            "context": context,
+            "documents_found": len(documents),
+            "documents": documents,
+            "query_embedding_length": len(embedding) if embedding is not None else 0,
+            "retrieval_mode": mode,
+            "filters": dict(filters or {}),
+            "context_tokens": packing["context_tokens"],
+            "tokens_saved": packing["tokens_saved"],
+        }
+
+    @staticmethod
+    def format_citation(metadata: Dict[str, Any]) -> str:
+        """Module, slide range and source of a chunk, e.g. Module 2 | Slide 4 | Source: deck.pptx"""
+        citation_parts = []
+        if 'module' in metadata:
+            citation_parts.append(f"Module {metadata['module']}")
+        if 'slide_end' in metadata:
+            citation_parts.append(f"Slides {metadata['slide']}-{metadata['slide_end']}")
+        elif 'slide' in metadata:
+            citation_parts.append(f"Slide {metadata['slide']}")
+        if 'source' in metadata:
+            citation_parts.append(f"Source: {metadata['source']}")
+        return " | ".join(citation_parts)
+
+    @staticmethod
+    def _format_reference(index: int, document: Document, similarity_score: float) -> str:
+        citation = SlideRetriever.format_citation(document.metadata)
+        confidence = f"(Relevance: {similarity_score:.2f})"
+
+        return (
+            f"\n--- REFERENCE {index+1} {confidence} ---\n"
+            f"Content: {document.page_content}\n"
+            f"Citation: {citation}\n"
+        )
+
     def format_context_for_llm(self, documents: List[Tuple[Document, float]]) -> str:
         """
         Format retrieved documents into context that the LLM can understand
@@ -75,57 +398,75 @@ class SlideRetriever:
             return "No relevant course materials found."
 
         context_parts = ["RELEVANT COURSE MATERIALS:"]
-
         for i, (document, similarity_score) in enumerate(documents):
-            content = document.page_content
-            metadata = document.metadata
-
-            # Build citation information
-            citation_parts = []
-            if 'module' in metadata:
-                citation_parts.append(f"Module {metadata['module']}")
-            if 'slide' in metadata:
-                citation_parts.append(f"Slide {metadata['slide']}")
-            if 'source' in metadata:
-                citation_parts.append(f"Source: {metadata['source']}")
-
-            citation = " | ".join(citation_parts)
-            confidence = f"(Relevance: {similarity_score:.2f})"
-
-            context_parts.append(
-                f"\n--- REFERENCE {i+1} {confidence} ---\n"
-                f"Content: {content}\n"
-                f"Citation: {citation}\n"
-            )
+            context_parts.append(self._format_reference(i, document, similarity_score))
 
         return "\n".join(context_parts)
 
-    def retrieve_relevant_content(self, query: str) -> Dict[str, Any]:
+    def retrieve_relevant_content(self, query: str, filters: Optional[MetadataFilter] = None) -> Dict[str, Any]:
         """
         Complete retrieval pipeline: from query to formatted context
         This is your main function that ties everything together
+        Optional metadata filters (module, source) scope the search inside the index
         """
         logger.info(f"Starting retrieval pipeline for query: '{query}'")
 
         # Step 1: Convert query to embedding
         query_embedding = self.embed_query(query)
 
-        # Step 2: Find similar content in database
-        similar_documents = self.similarity_search(query, k=3)
+        # Step 2: Find candidate content in database, reusing the embedding from step 1
+        candidates = self.candidate_search(query_embedding, query=query, filters=filters)
 
-        # Step 3: Format for LLM consumption
-        context = self.format_context_for_llm(similar_documents)
+        # Step 3: Choose what fits the prompt budget and format it for LLM consumption
+        result = self.pack_context(query, query_embedding, candidates, mode="hybrid" if self.hybrid else "vector",
+                                   filters=filters)
 
-        # Prepare results
-        result = {
-            "query": query,
-            "context": context,
-            "documents_found": len(similar_documents),
-            "documents": similar_documents,
-            "query_embedding_length": len(query_embedding)
-        }
+        logger.info(f"Retrieval complete. Found {result['documents_found']} documents.")
+        return result
+
+    def lexical_retrieve(self, query: str, filters: Optional[MetadataFilter] = None) -> Dict[str, Any]:
+        """
+        Retrieval from the in-memory BM25 index alone: no Ollama call and no Chroma query
+        Blocking: the first call may build the index over the whole collection, so async callers run it
+        on the executor
+        """
+        started = time.perf_counter()
+        result = self.pack_context(query, None, self.lexical_candidates(query, filters=filters), mode="lexical",
+                                   filters=filters)
+        self.lexical_fallbacks += 1
+        logger.info(f"Lexical retrieval answered in {(time.perf_counter() - started) * 1000:.1f} ms")
+        return result
+
+    def embed_budget(self, deadline: Optional[Deadline]) -> Optional[float]:
+        """Seconds the query embedding may take within a request deadline (DEADLINE_EMBED_SHARE of what is left)"""
+        if deadline is None:
+            return None
+        return deadline.timeout(DEADLINE_EMBED_SHARE, cap=self.embed_timeout)
+
+    async def aretrieve_relevant_content(self, query: str, filters: Optional[MetadataFilter] = None,
+                                         deadline: Optional[Deadline] = None,
+                                         query_embedding: Optional[List[float]] = None,
+                                         embedded: bool = False) -> Dict[str, Any]:
+        """
+        Async retrieval pipeline with the same result shape as retrieve_relevant_content
+        Embedding uses the async Ollama client and the searches run off the event loop.
+        When the embedding is slow or Ollama is saturated, BM25 answers on its own (retrieval_mode "lexical");
+        with a deadline the embedding gets only its share of the remaining budget, and BM25 also answers
+        once the budget is spent
+        A caller that already tried to embed the query passes embedded=True with its query_embedding
+        (None if it was abandoned), so the query is never embedded twice
+        """
+        logger.info(f"Starting async retrieval pipeline for query: '{query}'")
+
+        if not embedded:
+            query_embedding = await self.aembed_query_fast(query, timeout=self.embed_budget(deadline))
+        if query_embedding is None or (deadline is not None and deadline.expired()):
+            return await run_blocking(self.lexical_retrieve, query, filters=filters)
+        candidates = await run_blocking(self.candidate_search, query_embedding, query=query, filters=filters)
+        result = self.pack_context(query, query_embedding, candidates, mode="hybrid" if self.hybrid else "vector",
+                                   filters=filters)
 
-        logger.info(f"Retrieval complete. Found {len(similar_documents)} documents.")
+        logger.info(f"Retrieval complete. Found {result['documents_found']} documents.")
         return result
 
 
@@ -0,0 +1,161 @@
+"""
+Single-flight coalescing of identical in-flight work for AI Classroom Co-Pilot
+When many students ask the same question at once, one retrieval + generation runs and every
+identical request shares its result, or replays and follows its token stream
+"""
+
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """
+    Thread-based coalescing: the first caller for a key runs fn, later callers wait for its result
+    Exceptions reach every waiter
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, Future] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def run(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Return (result, shared); shared is True when another caller's run was reused"""
+        with self._lock:
+            future = self._calls.get(key)
+            shared = future is not None
+            if shared:
+                self.coalesced += 1
+            else:
+                future = self._calls[key] = Future()
+                self.leaders += 1
+        if shared:
+            return future.result(), True
+
+        try:
+            result = fn()
+            future.set_result(result)
+            return result, False
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"leaders": self.leaders, "coalesced": self.coalesced, "in_flight": len(self._calls)}
+
+
+class AsyncSingleFlight:
+    """
+    Event-loop coalescing: identical keys await one shared task
+    The task is shielded, so a caller that disconnects does not cancel it for the others
+    """
+
+    def __init__(self):
+        self._tasks: Dict[Hashable, "asyncio.Future[Any]"] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def run(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Return (result, shared); shared is True when another request's task was reused"""
+        task = self._tasks.get(key)
+        shared = task is not None
+        if shared:
+            self.coalesced += 1
+        else:
+            task = asyncio.ensure_future(factory())
+            self._tasks[key] = task
+            self.leaders += 1
+            task.add_done_callback(lambda _: self._tasks.pop(key, None))
+        return await asyncio.shield(task), shared
+
+    def in_flight(self, key: Hashable) -> bool:
+        return key in self._tasks
+
+    def stats(self) -> Dict[str, int]:
+        return {"leaders": self.leaders, "coalesced": self.coalesced, "in_flight": len(self._tasks)}
+
+
+class SharedStream:
+    """
+    One async event stream fanned out to any number of subscribers
+    A background task drains the source into a buffer; subscribers replay the buffer
+    and then follow new events, so late joiners still see the whole stream
+    """
+
+    def __init__(self, source: AsyncIterator[Any], on_done: Optional[Callable[[], None]] = None):
+        self.events: List[Any] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self._changed = asyncio.Event()
+        self._on_done = on_done
+        self._task = asyncio.ensure_future(self._pump(source))
+
+    async def _pump(self, source: AsyncIterator[Any]) -> None:
+        try:
+            async for event in source:
+                self.events.append(event)
+                self._notify()
+        except Exception as e:
+            self.error = e
+        except asyncio.CancelledError:
+            self.error = RuntimeError("Shared stream was cancelled")
+            raise
+        finally:
+            self.done = True
+            if self._on_done is not None:
+                self._on_done()
+            self._notify()
+
+    def _notify(self) -> None:
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def subscribe(self) -> AsyncIterator[Any]:
+        position = 0
+        while True:
+            if position < len(self.events):
+                yield self.events[position]
+                position += 1
+                continue
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            await self._changed.wait()
+
+
+class StreamFlight:
+    """Coalesces identical streaming requests onto one SharedStream per key"""
+
+    def __init__(self):
+        self._streams: Dict[Hashable, SharedStream] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def subscribe(self, key: Hashable, factory: Callable[[], AsyncIterator[Any]]) -> Tuple[AsyncIterator[Any], bool]:
+        """Return (event iterator, shared); must be called from the event loop"""
+        stream = self._streams.get(key)
+        shared = stream is not None
+        if shared:
+            self.coalesced += 1
+        else:
+            stream = SharedStream(factory(), on_done=lambda: self._streams.pop(key, None))
+            self._streams[key] = stream
+            self.leaders += 1
+        return stream.subscribe(), shared
+
+    def in_flight(self, key: Hashable) -> bool:
+        return key in self._streams
+
+    def stats(self) -> Dict[str, int]:
+        return {"leaders": self.leaders, "coalesced": self.coalesced, "in_flight": len(self._streams)}
@@ -0,0 +1,69 @@
+import asyncio
+import pytest
+import os
+
+# Ensure the app can be imported
+import sys
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from server.admission import PRIORITY_INSTRUCTOR, PRIORITY_STUDENT, AdmissionController, AdmissionRejected
+
+
+def test_slots_are_bounded_and_instructors_jump_the_queue():
+    """Test that only max_concurrency requests run and a queued instructor is served before earlier students."""
+    controller = AdmissionController(max_concurrency=1, queue_limit=10, latency_slo=60, service_seconds=1)
+    order = []
+
+    async def generate(name, priority, hold=0.01):
+        async with controller.slot(priority) as admission:
+            order.append(name)
+            assert controller.stats()["active"] == 1
+            await asyncio.sleep(hold)
+        return admission.queue_seconds
+
+    async def scenario():
+        first = asyncio.ensure_future(generate("first", PRIORITY_STUDENT, hold=0.05))
+        await asyncio.sleep(0)
+        students = [asyncio.ensure_future(generate(f"student{n}", PRIORITY_STUDENT)) for n in range(2)]
+        await asyncio.sleep(0)
+        instructor = asyncio.ensure_future(generate("instructor", PRIORITY_INSTRUCTOR))
+        return await asyncio.gather(first, *students, instructor)
+
+    queue_seconds = asyncio.run(scenario())
+
+    assert order == ["first", "instructor", "student0", "student1"]
+    assert queue_seconds[0] < queue_seconds[-1] < queue_seconds[2]
+    stats = controller.stats()
+    assert stats["admitted"] == 4 and stats["active"] == 0 and stats["queued"] == 0
+    assert stats["queue_seconds_max"] >= 0.05
+
+
+def test_rejects_when_estimated_wait_exceeds_slo():
+    """Test that a request is turned away with Retry-After once the expected wait passes the SLO."""
+    controller = AdmissionController(max_concurrency=1, queue_limit=10, latency_slo=5, service_seconds=8)
+
+    async def scenario():
+        async with controller.slot(PRIORITY_STUDENT):
+            with pytest.raises(AdmissionRejected) as rejected:
+                async with controller.slot(PRIORITY_STUDENT):
+                    pass
+            return rejected.value
+
+    rejection = asyncio.run(scenario())
+    assert rejection.retry_after == 3
+    assert controller.stats()["rejected"] == 1
+
+
+def test_rejects_when_queue_is_full():
+    """Test that the wait queue is bounded."""
+    controller = AdmissionController(max_concurrency=1, queue_limit=1, latency_slo=60, service_seconds=1)
+
+    async def scenario():
+        async with controller.slot(PRIORITY_STUDENT):
+            waiting = asyncio.ensure_future(controller.slot(PRIORITY_STUDENT).__aenter__())
+            await asyncio.sleep(0)
+            with pytest.raises(AdmissionRejected):
+                controller.check(PRIORITY_INSTRUCTOR)
+            waiting.cancel()
+
+    asyncio.run(scenario())
@@ -0,0 +1,389 @@
+import asyncio
+import json
+import pytest
+from fastapi.testclient import TestClient
+import os
+from unittest.mock import AsyncMock, patch
+from langchain_core.documents import Document
+
+# Ensure the app can be imported
+import sys
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import main
+from main import app
+from server.admission import PRIORITY_INSTRUCTOR, PRIORITY_STUDENT, AdmissionController
+from server.ingest import notify_index_changed
+
+client = TestClient(app)
+
+
+def _parse_sse(body: str):
+    """Split a text/event-stream body into (event, data) pairs."""
+    events = []
+    for frame in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in frame.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+async def _stream(chunks):
+    """Mimic the async iterator returned by AsyncClient.generate(stream=True)."""
+    for chunk in chunks:
+        yield chunk
+
+
+@pytest.fixture
+def mock_retrieval():
+    """Return two fake slides from the retriever instead of querying Chroma."""
+    documents = [
+        (Document(page_content="SYN flood overview", metadata={"source": "test_deck.pptx", "module": "Module 2", "slide": 4}), 0.12),
+        (Document(page_content="Mitigations", metadata={"source": "test_deck.pptx", "module": "Module 2", "slide": 5}), 0.34),
+    ]
+    result = {
+        "query": "What is a SYN flood?",
+        "context": "RELEVANT COURSE MATERIALS: ...",
+        "documents_found": len(documents),
+        "documents": documents,
+        "query_embedding_length": 768,
+    }
+    main.rag_system.answer_cache.invalidate()
+    with patch.object(main.rag_system.retriever, "aembed_query", new=AsyncMock(return_value=[0.1] * 768)), \
+         patch.object(main.rag_system.retriever, "aretrieve_relevant_content", new=AsyncMock(return_value=result)) as mock:
+        yield mock
+    main.rag_system.answer_cache.invalidate()
+
+
+@patch("main.upsert_faq")
+def test_ask_stream_sends_citations_tokens_then_summary(mock_upsert, mock_retrieval):
+    """
+    Test that /ask/stream emits citations first, then tokens, then a done event.
+    """
+    chunks = [{"response": "A SYN ", "done": False}, {"response": "flood...", "done": False}, {"response": "", "done": True}]
+    mock_generate = AsyncMock(return_value=_stream(chunks))
+    with patch.object(main.rag_system.generator.async_client, "generate", new=mock_generate):
+        response = client.post("/ask/stream", json={"question": "What is a SYN flood?"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert mock_generate.call_args.kwargs["stream"] is True
+
+    events = _parse_sse(response.text)
+    assert [name for name, _ in events] == ["citations", "token", "token", "done"]
+
+    citations = events[0][1]
+    assert citations["documents_retrieved"] == 2
+    assert citations["documents"][0][0]["metadata"]["slide"] == 4
+
+    assert events[1][1]["text"] == "A SYN "
+    assert events[-1][1]["answer"] == "A SYN flood..."
+    mock_upsert.assert_called_once_with(question="What is a SYN flood?", answer="A SYN flood...")
+
+
+@patch("main.upsert_faq")
+def test_ask_accept_header_selects_streaming(mock_upsert, mock_retrieval):
+    """
+    Test that /ask streams when the client sends Accept: text/event-stream.
+    """
+    chunks = [{"response": "Answer", "done": True}]
+    with patch.object(main.rag_system.generator.async_client, "generate", new=AsyncMock(return_value=_stream(chunks))):
+        response = client.post(
+            "/ask",
+            json={"question": "What is a SYN flood?"},
+            headers={"Accept": "text/event-stream"},
+        )
+
+    assert response.status_code == 200
+    events = _parse_sse(response.text)
+    assert events[0][0] == "citations"
+    assert events[-1][0] == "done"
+    assert events[-1][1]["answer"] == "Answer"
+
+
+@patch("main.upsert_faq")
+def test_ask_stream_reports_generation_error(mock_upsert, mock_retrieval):
+    """
+    Test that a failure mid-stream ends with an error event and no FAQ write.
+    """
+    with patch.object(main.rag_system.generator.async_client, "generate", new=AsyncMock(side_effect=ConnectionError("ollama down"))):
+        response = client.post("/ask/stream", json={"question": "What is a SYN flood?"})
+
+    events = _parse_sse(response.text)
+    assert [name for name, _ in events] == ["citations", "error"]
+    mock_upsert.assert_not_called()
+
+
+@patch("main.upsert_faq")
+def test_ask_uses_async_pipeline(mock_upsert, mock_retrieval):
+    """
+    Test that /ask answers through the async client and records the FAQ off the event loop.
+    """
+    mock_generate = AsyncMock(return_value={"response": "A SYN flood exhausts half-open connections."})
+    with patch.object(main.rag_system.generator.async_client, "generate", new=mock_generate):
+        response = client.post("/ask", json={"question": "What is a SYN flood?"})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["answer"] == "A SYN flood exhausts half-open connections."
+    assert body["documents_retrieved"] == 2
+    mock_retrieval.assert_awaited_once()
+    assert mock_retrieval.await_args.args == ("What is a SYN flood?",)
+    assert mock_retrieval.await_args.kwargs["filters"] == {}
+    # The embedding made for the answer cache lookup is reused, not computed again
+    assert mock_retrieval.await_args.kwargs["embedded"] is True
+    assert mock_retrieval.await_args.kwargs["query_embedding"] is not None
+    assert body["fallback"] is False and body["truncated"] is False
+    # The deadline is off by default, so the answer length is not capped
+    assert "num_predict" not in mock_generate.call_args.kwargs["options"]
+    mock_upsert.assert_called_once_with(question="What is a SYN flood?", answer=body["answer"])
+
+
+@patch("main.upsert_faq")
+def test_ask_scopes_retrieval_and_cache_to_filters(mock_upsert, mock_retrieval):
+    """
+    Test that /ask forwards module/source filters to retrieval and caches answers per scope.
+    """
+    mock_generate = AsyncMock(return_value={"response": "Scoped answer."})
+    with patch.object(main.rag_system.generator.async_client, "generate", new=mock_generate):
+        client.post("/ask", json={"question": "What is a SYN flood?", "week": "Module 2", "source": "test_deck.pptx"})
+        client.post("/ask", json={"question": "What is a SYN flood?", "module": "Module 2", "source": "test_deck.pptx"})
+        client.post("/ask", json={"question": "What is a SYN flood?"})
+
+    assert mock_retrieval.await_args_list[0].kwargs["filters"] == {"module": "Module 2", "source": "test_deck.pptx"}
+    # Same scope is a cache hit; the unscoped question is answered separately
+    assert mock_retrieval.await_count == 2
+    assert mock_retrieval.await_args_list[1].kwargs["filters"] == {}
+    assert mock_generate.await_count == 2
+
+
+@patch("main.upsert_faq")
+def test_repeated_question_served_from_answer_cache(mock_upsert, mock_retrieval):
+    """
+    Test that a repeat question skips generation until the course materials change.
+    """
+    before = client.get("/stats").json()["answer_cache"]
+    mock_generate = AsyncMock(return_value={"response": "Cached answer"})
+    with patch.object(main.rag_system.generator.async_client, "generate", new=mock_generate):
+        first = client.post("/ask", json={"question": "What is a SYN flood?"}).json()
+        second = client.post("/ask", json={"question": "what is a syn flood"}).json()
+        assert mock_generate.await_count == 1
+
+        # An index change (upload, watcher or delete) invalidates cached answers
+        notify_index_changed("test_deck.pptx")
+        client.post("/ask", json={"question": "What is a SYN flood?"})
+        assert mock_generate.await_count == 2
+
+    assert "cached" not in first
+    assert second["cached"] is True
+    assert second["answer"] == "Cached answer"
+    assert second["question"] == "what is a syn flood"
+    assert mock_upsert.call_count == 3
+
+    stats = client.get("/stats").json()["answer_cache"]
+    assert stats["hits"] - before["hits"] == 1
+    assert stats["misses"] - before["misses"] == 2
+
+
+@patch("main.upsert_faq")
+def test_stream_replays_cached_answer(mock_upsert, mock_retrieval):
+    """
+    Test that a cached answer is streamed with the usual citations/token/done events.
+    """
+    chunks = [{"response": "Streamed ", "done": False}, {"response": "answer", "done": True}]
+    mock_generate = AsyncMock(return_value=_stream(chunks))
+    with patch.object(main.rag_system.generator.async_client, "generate", new=mock_generate):
+        client.post("/ask/stream", json={"question": "What is a SYN flood?"})
+        response = client.post("/ask/stream", json={"question": "What is a SYN flood?"})
+
+    assert mock_generate.await_count == 1
+    events = _parse_sse(response.text)
+    assert [name for name, _ in events] == ["citations", "token", "done"]
+    assert events[0][1]["documents_retrieved"] == 2
+    assert events[-1][1]["answer"] == "Streamed answer"
+    assert events[-1][1]["cached"] is True
+
+
+async def _slow_stream(chunks):
+    for chunk in chunks:
+        await asyncio.sleep(0.02)
+        yield chunk
+
+
+def test_identical_in_flight_questions_share_one_generation(mock_retrieval):
+    """
+    Test that identical concurrent questions are answered by one generation, while other filters and priorities are not shared.
+    """
+    async def slow_generate(**kwargs):
+        await asyncio.sleep(0.05)
+        return {"response": "Shared answer"}
+
+    async def ask_together():
+        rag = main.rag_system
+        return await asyncio.gather(
+            rag.aask_question("What is a SYN flood?"),
+            rag.aask_question("what is a syn flood"),
+            rag.aask_question("What is a SYN flood?", filters={"module": "Module 2"}),
+            rag.aask_question("What is a SYN flood?", priority=PRIORITY_INSTRUCTOR),
+        )
+
+    mock_generate = AsyncMock(side_effect=slow_generate)
+    with patch.object(main.rag_system.generator.async_client, "generate", new=mock_generate):
+        leader, follower, scoped, instructor = asyncio.run(ask_together())
+
+    assert mock_generate.await_count == 3
+    assert follower["answer"] == leader["answer"] == "Shared answer"
+    assert follower["question"] == "what is a syn flood"
+    assert follower["coalesced"] is True
+    # A higher-priority request never waits in a student's queue position
+    assert "coalesced" not in leader and "coalesced" not in scoped and "coalesced" not in instructor
+
+
+def test_identical_in_flight_streams_share_one_token_stream(mock_retrieval):
+    """
+    Test that a second identical streamed question follows the first one's tokens instead of generating again.
+    """
+    chunks = [{"response": "One ", "done": False}, {"response": "stream", "done": True}]
+    mock_generate = AsyncMock(side_effect=lambda **kwargs: _slow_stream(chunks))
+
+    async def collect(question):
+        return [event async for event in main.rag_system.astream_question(question)]
+
+    async def stream_together():
+        return await asyncio.gather(collect("Explain SYN floods"), collect("explain syn floods?"))
+
+    with patch.object(main.rag_system.generator.async_client, "generate", new=mock_generate):
+        first, second = asyncio.run(stream_together())
+
+    assert mock_generate.await_count == 1
+    assert [e["event"] for e in first] == [e["event"] for e in second] == ["citations", "token", "token", "done"]
+    assert second[-1]["data"]["answer"] == "One stream"
+    assert second[0]["data"]["question"] == "explain syn floods?"
+    assert second[0]["data"]["coalesced"] is True
+
+
+@patch("main.upsert_faq")
+def test_overloaded_generation_returns_429_with_retry_after(mock_upsert, mock_retrieval):
+    """
+    Test that /ask and /ask/stream are rejected quickly with Retry-After when generation is saturated.
+    """
+    saturated = AdmissionController(max_concurrency=1, latency_slo=1, service_seconds=10)
+    saturated._active = 1
+    mock_generate = AsyncMock(return_value={"response": "never"})
+    with patch.object(main.rag_system, "admission", saturated), \
+         patch.object(main.rag_system.generator.async_client, "generate", new=mock_generate):
+        response = client.post("/ask", json={"question": "What is a SYN flood?"})
+        streamed = client.post("/ask/stream", json={"question": "What is a SYN flood?"})
+        stats = client.get("/stats").json()["admission"]
+
+    assert response.status_code == 429
+    assert response.headers["retry-after"] == "9"
+    assert response.json()["retry_after"] == 9
+    assert streamed.status_code == 429
+    assert "retry-after" in streamed.headers
+    mock_generate.assert_not_awaited()
+    # Rejected before any retrieval work is spent on the question
+    mock_retrieval.assert_not_awaited()
+    mock_upsert.assert_not_called()
+    assert stats["rejected"] == 2
+
+
+@patch("main.INSTRUCTOR_TOKEN", "s3cret")
+def test_priority_comes_from_instructor_token_not_request_body():
+    """
+    Test that only a request carrying the instructor token is generated at instructor priority.
+    """
+    with patch.object(main.rag_system, "aask_question", new=AsyncMock(return_value={"answer": "ok"})) as mock_ask, \
+         patch("main.upsert_faq"):
+        client.post("/ask", json={"question": "What is a SYN flood?", "role": "instructor"})
+        assert mock_ask.await_args.kwargs["priority"] == PRIORITY_STUDENT
+
+        client.post("/ask", json={"question": "What is a SYN flood?"}, headers={"X-Instructor-Token": "wrong"})
+        assert mock_ask.await_args.kwargs["priority"] == PRIORITY_STUDENT
+
+        client.post("/ask", json={"question": "What is a SYN flood?"}, headers={"X-Instructor-Token": "s3cret"})
+        assert mock_ask.await_args.kwargs["priority"] == PRIORITY_INSTRUCTOR
+
+
+@patch("main.upsert_faq")
+@patch("server.deadline.ASK_DEADLINE_SECONDS", 0.2)
+@patch("server.generation.GENERATION_MIN_TOKENS", 1)
+def test_slow_generation_falls_back_to_extractive_answer(mock_upsert, mock_retrieval):
+    """
+    Test that an answer that misses the deadline is replaced by the top slides with citations, flagged and not cached.
+    """
+    async def hanging_generate(**kwargs):
+        await asyncio.sleep(5)
+        return {"response": "too late"}
+
+    with patch.object(main.rag_system.generator.async_client, "generate", new=AsyncMock(side_effect=hanging_generate)):
+        response = client.post("/ask", json={"question": "What is a SYN flood?"})
+
+    body = response.json()
+    assert response.status_code == 200
+    assert body["fallback"] is True
+    assert body["model_used"] == "extractive"
+    assert "SYN flood overview" in body["answer"] and "Slide 4" in body["answer"]
+    assert body["documents_retrieved"] == 2
+    assert not main.rag_system.answer_cache.contains("What is a SYN flood?", scope="")
+    assert main.rag_system.admission.stats()["active"] == 0
+    # The ask is counted, but the fallback does not replace the stored model answer
+    mock_upsert.assert_called_once_with(question="What is a SYN flood?", answer=None)
+
+
+@patch("main.upsert_faq")
+@patch("server.deadline.ASK_DEADLINE_SECONDS", 3)
+def test_deadline_too_short_for_an_answer_skips_generation(mock_upsert, mock_retrieval):
+    """
+    Test that when the time left cannot fit a usable answer, the fallback is sent without calling Ollama.
+    """
+    mock_generate = AsyncMock(return_value={"response": "unused"})
+    with patch.object(main.rag_system.generator.async_client, "generate", new=mock_generate):
+        response = client.post("/ask", json={"question": "What is a SYN flood?"})
+        streamed = client.post("/ask/stream", json={"question": "Explain SYN floods"})
+
+    assert response.json()["fallback"] is True
+    assert _parse_sse(streamed.text)[-1][1]["fallback"] is True
+    mock_generate.assert_not_awaited()
+    assert main.rag_system.admission.stats()["active"] == 0
+
+
+@patch("main.upsert_faq")
+@patch("server.deadline.ASK_DEADLINE_SECONDS", 60)
+def test_answer_cut_off_at_token_cap_is_flagged_and_not_cached(mock_upsert, mock_retrieval):
+    """
+    Test that an answer Ollama stopped at num_predict is marked truncated and never cached.
+    """
+    mock_generate = AsyncMock(return_value={"response": "A SYN flood is", "done_reason": "length", "eval_count": 256})
+    with patch.object(main.rag_system.generator.async_client, "generate", new=mock_generate):
+        response = client.post("/ask", json={"question": "What is a SYN flood?"})
+
+    body = response.json()
+    assert mock_generate.call_args.kwargs["options"]["num_predict"] >= 256
+    assert body["truncated"] is True and body["fallback"] is False
+    assert not main.rag_system.answer_cache.contains("What is a SYN flood?", scope="")
+
+
+@patch("main.upsert_faq")
+@patch("server.deadline.ASK_DEADLINE_SECONDS", 0.2)
+@patch("server.generation.GENERATION_MIN_TOKENS", 1)
+def test_stream_without_first_token_in_time_falls_back(mock_upsert, mock_retrieval):
+    """
+    Test that /ask/stream sends the extractive answer when no token arrives before the deadline.
+    """
+    async def stalled_stream(chunks):
+        await asyncio.sleep(5)
+        for chunk in chunks:
+            yield chunk
+
+    chunks = [{"response": "too late", "done": True}]
+    with patch.object(main.rag_system.generator.async_client, "generate",
+                      new=AsyncMock(side_effect=lambda **kwargs: stalled_stream(chunks))):
+        response = client.post("/ask/stream", json={"question": "Explain SYN floods"})
+
+    events = _parse_sse(response.text)
+    assert [name for name, _ in events] == ["citations", "token", "done"]
+    done = events[-1][1]
+    assert done["fallback"] is True
+    assert done["model_used"] == "extractive"
+    assert "Mitigations" in done["answer"]
+    mock_upsert.assert_called_once_with(question="Explain SYN floods", answer=None)
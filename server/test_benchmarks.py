@@ -0,0 +1,85 @@
+import os
+import ollama
+from langchain_ollama import OllamaEmbeddings
+
+# Ensure the app can be imported
+import sys
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from server.benchmarks.fake_ollama import FakeOllama
+from server.benchmarks.loadgen import QuestionSampler, load_faqs_from_db
+from server.benchmarks.suite import compare
+from server.benchmarks.synthetic_decks import generate_corpus, sample_questions
+from server.db import ConnectionPool
+from server.ingest import pptx_to_documents
+
+
+def test_fake_ollama_serves_deterministic_embeddings_and_capped_generation():
+    """
+    Test that the fake Ollama answers the real clients, with repeatable vectors and num_predict honoured.
+    """
+    with FakeOllama(dim=64, embed_latency_ms=0, embed_per_text_ms=0, first_token_ms=0, tokens_per_second=0,
+                    answer_tokens=20) as fake:
+        embeddings = OllamaEmbeddings(model="nomic-embed-text", base_url=fake.url)
+        first, second = embeddings.embed_documents(["SYN cookies", "SYN cookies"])
+        assert first == second and len(first) == 64
+
+        client = ollama.Client(host=fake.url)
+        response = client.generate(model="llama3:8b", prompt="Content: SYN cookies stop floods\n",
+                                   options={"num_predict": 5})
+        assert response["response"].split() == ["SYN", "cookies", "stop", "floods", "SYN"]
+        streamed = [chunk["response"] for chunk in client.generate(model="llama3:8b", prompt="x", stream=True)]
+        assert len([token for token in streamed if token]) == 20
+    assert fake.counts["generate"] == 2
+
+
+def test_synthetic_corpus_is_ingestible(tmp_path):
+    """
+    Test that generated decks parse into one document per slide and questions are distinct.
+    """
+    corpus = generate_corpus(str(tmp_path), decks=2, slides_per_deck=3)
+    assert [week for _, week in corpus] == ["Week 01", "Week 02"]
+    documents = pptx_to_documents(corpus[0][0], week_title="Week 01")
+    assert len(documents) == 3
+    assert documents[0].page_content.startswith("Firewalls:")
+
+    questions = sample_questions(400, decks=2)
+    assert len(set(questions)) == 400
+
+
+def test_compare_flags_slower_timings_and_more_failures():
+    """
+    Test that result comparison reports timings beyond the tolerance and any rise in failure counts.
+    """
+    baseline = {"scenarios": {"ask": {"ask_ms_p95": 1000, "errors": 0, "fallbacks": 1},
+                              "ingest": {"failed": 0, "chunks_per_s": 50.0},
+                              "concurrency": [{"concurrency": 4, "throughput_rps": 2.0, "latency_ms_p95": 900,
+                                               "rejected": 2}]}}
+    current = {"scenarios": {"ask": {"ask_ms_p95": 1100, "errors": 3, "fallbacks": 1},
+                             "ingest": {"failed": 1, "chunks_per_s": 55.0},
+                             "concurrency": [{"concurrency": 4, "throughput_rps": 1.0, "latency_ms_p95": 2000,
+                                              "rejected": 1}]}}
+    assert compare(current, baseline, tolerance=0.2) == [
+        "ask.errors: 0 -> 3",
+        "ingest.failed: 0 -> 1",
+        "concurrency[4].throughput_rps: 2.0 -> 1.0",
+        "concurrency[4].latency_ms_p95: 900 -> 2000",
+    ]
+
+
+def test_loadgen_samples_faqs_by_ask_count(tmp_path):
+    """
+    Test that the load generator reads the faqs table and replays questions in proportion to ask_count.
+    """
+    pool = ConnectionPool(str(tmp_path / "app.db"), size=1)
+    pool.migrate()
+    with pool.connection() as conn:
+        conn.executemany("INSERT INTO faqs (question, answer, ask_count, last_asked) VALUES (?, '', ?, '')",
+                         [("What is a SYN flood?", 9), ("What is ARP?", 1), ("Never asked", 0)])
+    pool.close()
+
+    faqs = load_faqs_from_db(str(tmp_path / "app.db"))
+    assert sorted(faqs) == [("What is ARP?", 1), ("What is a SYN flood?", 9)]
+    sampler = QuestionSampler(faqs, seed=0)
+    draws = [sampler.sample() for _ in range(2000)]
+    assert 0.85 < draws.count("What is a SYN flood?") / len(draws) < 0.95
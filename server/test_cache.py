@@ -0,0 +1,96 @@
+import pytest
+import os
+from unittest.mock import patch
+from langchain_core.documents import Document
+from langchain_ollama import OllamaEmbeddings
+
+# Ensure the app can be imported
+import sys
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from server.cache import QueryEmbeddingCache, SemanticAnswerCache, normalize_question
+from server.retrieval import SlideRetriever
+
+
+def test_normalize_question():
+    """Test that case, spacing and trailing punctuation do not change the key."""
+    assert normalize_question("  What is  ARP spoofing?? ") == "what is arp spoofing"
+    assert normalize_question("what is arp spoofing") == normalize_question("What is ARP Spoofing.")
+
+
+def test_query_cache_hit_and_lru_eviction():
+    """Test that the least recently used entry is evicted once the cache is full."""
+    cache = QueryEmbeddingCache(max_entries=2, ttl_seconds=60)
+    cache.put("first", [1.0])
+    cache.put("second", [2.0])
+    assert cache.get("FIRST?") == [1.0]  # touch "first" so "second" is now oldest
+    cache.put("third", [3.0])
+
+    assert cache.get("second") is None
+    assert cache.get("first") == [1.0]
+    assert cache.get("third") == [3.0]
+    stats = cache.stats()
+    assert stats["entries"] == 2
+    assert stats["hits"] == 3
+    assert stats["misses"] == 1
+
+
+def test_query_cache_ttl_expiry():
+    """Test that entries older than the TTL are treated as misses."""
+    cache = QueryEmbeddingCache(max_entries=10, ttl_seconds=5)
+    with patch("server.cache.time.monotonic", return_value=100.0):
+        cache.put("syn flood", [0.5])
+    with patch("server.cache.time.monotonic", return_value=104.0):
+        assert cache.get("syn flood") == [0.5]
+    with patch("server.cache.time.monotonic", return_value=106.0):
+        assert cache.get("syn flood") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_answer_cache_matches_paraphrase_above_threshold():
+    """Test that a close embedding hits and a distant one misses."""
+    cache = SemanticAnswerCache(similarity_threshold=0.9, max_entries=10)
+    cache.store("What is ARP spoofing?", [1.0, 0.0, 0.0], {"answer": "ARP answer"}, cache.generation)
+
+    hit = cache.lookup("Explain ARP spoofing", [0.98, 0.1, 0.0])
+    assert hit is not None
+    payload, similarity = hit
+    assert payload["answer"] == "ARP answer"
+    assert 0.9 <= similarity < 1.0
+
+    assert cache.lookup("What is a SYN flood?", [0.0, 1.0, 0.0]) is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_answer_cache_invalidation_and_stale_store():
+    """Test that invalidation drops entries and answers from an older corpus are not stored."""
+    cache = SemanticAnswerCache(similarity_threshold=0.9, max_entries=10)
+    generation = cache.generation
+    cache.store("What is ARP spoofing?", [1.0, 0.0], {"answer": "old"}, generation)
+    cache.invalidate()
+
+    assert cache.lookup("What is ARP spoofing?", [1.0, 0.0]) is None
+    assert cache.store("What is ARP spoofing?", [1.0, 0.0], {"answer": "raced"}, generation) is False
+    assert cache.stats()["entries"] == 0
+    assert cache.stats()["invalidations"] == 1
+
+
+@pytest.fixture
+def retriever(tmp_path):
+    return SlideRetriever(persist_directory=str(tmp_path))
+
+
+def test_retrieval_embeds_query_once(retriever):
+    """Test that the retrieval pipeline embeds once and searches Chroma by vector."""
+    hits = [(Document(page_content="ARP spoofing", metadata={"source": "test_deck.pptx", "slide": 2}), 0.2, [0.1] * 768)]
+    with patch.object(OllamaEmbeddings, "embed_query", return_value=[0.1] * 768) as mock_embed, \
+         patch.object(retriever, "candidate_search", return_value=hits) as mock_search:
+        result = retriever.retrieve_relevant_content("What is ARP spoofing?")
+        retriever.retrieve_relevant_content("what is arp spoofing")
+
+    assert result["documents_found"] == 1
+    assert result["query_embedding_length"] == 768
+    mock_embed.assert_called_once_with("What is ARP spoofing?")
+    assert mock_search.call_count == 2
+    assert mock_search.call_args.args[0] == [0.1] * 768
@@ -0,0 +1,67 @@
+import pytest
+import os
+import threading
+
+# Ensure the app can be imported
+import sys
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from server.db import MIGRATIONS, ConnectionPool
+
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = ConnectionPool(str(tmp_path / "test.db"), size=2)
+    pool.migrate()
+    yield pool
+    pool.close()
+
+
+def test_migrate_creates_schema_and_indexes(pool):
+    """Test that migrations set user_version, create the indexes and are safe to rerun."""
+    with pool.connection() as conn:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == len(MIGRATIONS)
+        indexes = {r["name"] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert {"idx_materials_filename", "idx_materials_uploaded", "idx_faqs_rank"} <= indexes
+    assert pool.migrate() == len(MIGRATIONS)
+
+
+def test_connections_use_wal_and_are_reused(pool):
+    """Test that pooled connections run in WAL mode and are handed out again after use."""
+    with pool.connection() as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        first = conn
+    with pool.connection() as conn:
+        assert conn is first
+
+
+def test_failed_unit_of_work_rolls_back(pool):
+    """Test that an exception inside connection() rolls back and still returns the connection."""
+    with pytest.raises(RuntimeError):
+        with pool.connection() as conn:
+            conn.execute(
+                "INSERT INTO materials (filename, week_title, uploaded_at, size_bytes) VALUES ('a.pptx', 'W1', 'now', 1)"
+            )
+            raise RuntimeError("boom")
+
+    with pool.connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM materials").fetchone()[0] == 0
+
+
+def test_pool_is_shared_across_threads(pool):
+    """Test that concurrent writers from many threads all commit without opening extra connections."""
+    def write(n):
+        with pool.connection() as conn:
+            conn.execute(
+                "INSERT INTO faqs (question, answer, ask_count, last_asked) VALUES (?, 'a', 1, 'now')", (f"q{n}",)
+            )
+
+    threads = [threading.Thread(target=write, args=(n,)) for n in range(20)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    with pool.connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM faqs").fetchone()[0] == 20
+    assert pool._created <= pool.size
@@ -0,0 +1,64 @@
+import math
+import os
+import time
+
+# Ensure the app can be imported
+import sys
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from server.deadline import Deadline
+from server.generation import GENERATION_MAX_TOKENS, GENERATION_MIN_TOKENS, AnswerGenerator
+
+
+def test_deadline_budget_shrinks_and_expires():
+    """
+    Test that a deadline hands out shares of what is left, capped, and expires on time.
+    """
+    deadline = Deadline(0.05)
+    assert 0 < deadline.timeout(0.5) <= 0.025
+    assert deadline.timeout(cap=0.01) == 0.01
+    time.sleep(0.06)
+    assert deadline.expired()
+    assert deadline.timeout() == 0.0
+
+
+def test_zero_deadline_is_unlimited():
+    """
+    Test that a deadline of 0 never expires and imposes no stage timeouts.
+    """
+    deadline = Deadline(0)
+    assert deadline.unlimited and not deadline.expired()
+    assert deadline.remaining() == math.inf
+    assert deadline.timeout() is None
+    assert deadline.timeout(cap=1.0) == 1.0
+
+
+def test_token_budget_follows_observed_speed():
+    """
+    Test that the generation token cap scales with the remaining time and the measured tokens per second.
+    """
+    generator = AnswerGenerator()
+    assert generator.token_budget(None) is None
+    assert generator.token_budget(0.0) == 0
+    assert generator.token_budget(3600) == GENERATION_MAX_TOKENS
+
+    generator.tokens_per_second = 10.0
+    generator._observe_speed({"eval_count": 100, "eval_duration": 2_000_000_000})  # 50 tokens/s
+    assert generator.tokens_per_second == 18.0
+    assert generator.token_budget(20.0) == 360
+    # The cap follows the time left; below a usable answer the caller falls back instead of generating
+    assert generator.token_budget(2.0) == 36
+    assert not generator.fits_answer(generator.token_budget(2.0))
+    assert generator.fits_answer(GENERATION_MIN_TOKENS) and generator.fits_answer(None)
+
+
+def test_excluded_queue_wait_does_not_use_the_budget():
+    """
+    Test that time excluded from a deadline (queued for admission) is given back.
+    """
+    deadline = Deadline(0.05)
+    time.sleep(0.06)
+    assert deadline.expired()
+    deadline.exclude(0.06)
+    assert not deadline.expired()
+    assert 0 < deadline.remaining() <= 0.05
@@ -0,0 +1,283 @@
+import pytest
+import os
+import threading
+from unittest.mock import patch
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from pptx import Presentation
+
+# Ensure the app can be imported
+import sys
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from server import ingest, registry
+from server.bulk_ingest import BulkIngestor
+from server.metrics import INGEST_EMBED_SECONDS, INGEST_PARSE_SECONDS, INGEST_WRITE_SECONDS
+from server.tokens import estimate_tokens
+
+
+def _write_deck(path, slide_texts):
+    """Create a small .pptx with one text box per slide."""
+    prs = Presentation()
+    for text in slide_texts:
+        slide = prs.slides.add_slide(prs.slide_layouts[5])
+        slide.shapes.title.text = text
+    prs.save(path)
+
+
+@pytest.fixture(params=["chroma", "numpy"])
+def chroma_dir(tmp_path, request):
+    """
+    Isolated index directory with a deterministic offline embedding model, indexing one chunk per slide
+    Runs once per vector backend
+    """
+    fake = DeterministicFakeEmbedding(size=8)
+    with patch("server.registry.get_embeddings", return_value=fake), patch("server.ingest.CHUNK_POLICY", "slide"), \
+            patch("server.registry.VECTOR_BACKEND", request.param):
+        yield str(tmp_path / "chroma")
+
+
+def _indexed_ids(chroma_dir, source):
+    vector_backend, _ = ingest._init_vector_store(persist_directory=chroma_dir)
+    return set(vector_backend.ids_for_source(source))
+
+
+def test_reingest_unchanged_file_is_skipped(tmp_path, chroma_dir):
+    """Test that a second ingest of the same file does not embed or add anything."""
+    deck = str(tmp_path / "test_deck.pptx")
+    _write_deck(deck, ["Firewalls", "SYN flood", "ARP spoofing"])
+
+    assert ingest.ingest_pptx_to_chroma(deck, week_title="Module 2", persist_directory=chroma_dir) == 3
+    first_ids = _indexed_ids(chroma_dir, "test_deck.pptx")
+    assert len(first_ids) == 3
+
+    with patch("server.ingest.pptx_to_documents") as mock_parse:
+        assert ingest.ingest_pptx_to_chroma(deck, week_title="Module 2", persist_directory=chroma_dir) == 3
+        mock_parse.assert_not_called()
+
+    assert _indexed_ids(chroma_dir, "test_deck.pptx") == first_ids
+
+
+def test_changed_deck_only_rewrites_changed_slides(tmp_path, chroma_dir):
+    """Test that editing one slide replaces only that slide's vector."""
+    deck = str(tmp_path / "test_deck.pptx")
+    _write_deck(deck, ["Firewalls", "SYN flood", "ARP spoofing"])
+    ingest.ingest_pptx_to_chroma(deck, week_title="Module 2", persist_directory=chroma_dir)
+    before = _indexed_ids(chroma_dir, "test_deck.pptx")
+
+    _write_deck(deck, ["Firewalls", "SYN flood mitigations", "ARP spoofing"])
+    listener_calls = []
+    ingest.add_index_listener(listener_calls.append)
+    try:
+        assert ingest.ingest_pptx_to_chroma(deck, week_title="Module 2", persist_directory=chroma_dir) == 3
+    finally:
+        ingest._index_listeners.remove(listener_calls.append)
+
+    after = _indexed_ids(chroma_dir, "test_deck.pptx")
+    assert len(after) == 3
+    assert len(before & after) == 2
+    assert listener_calls == ["test_deck.pptx"]
+
+
+def test_remove_source_clears_index_and_manifest(tmp_path, chroma_dir):
+    """Test that removing a source deletes its vectors and its manifest entry."""
+    deck = str(tmp_path / "test_deck.pptx")
+    _write_deck(deck, ["Firewalls", "SYN flood"])
+    ingest.ingest_pptx_to_chroma(deck, week_title="Module 2", persist_directory=chroma_dir)
+
+    assert ingest.remove_pptx_from_chroma("test_deck.pptx", persist_directory=chroma_dir) == 2
+    assert _indexed_ids(chroma_dir, "test_deck.pptx") == set()
+    assert ingest.get_manifest(chroma_dir).get("test_deck.pptx") is None
+
+
+def test_ingest_keeps_lexical_index_in_step(tmp_path, chroma_dir):
+    """Test that ingest, re-ingest and removal update a built BM25 index incrementally."""
+    index = registry.get_lexical_index(chroma_dir)
+    deck = str(tmp_path / "test_deck.pptx")
+    _write_deck(deck, ["Firewalls", "SYN flood"])
+    ingest.ingest_pptx_to_chroma(deck, week_title="Module 2", persist_directory=chroma_dir)
+    assert index.search("syn flood")[0][1].metadata["slide"] == 2
+
+    _write_deck(deck, ["Firewalls", "ARP spoofing"])
+    ingest.ingest_pptx_to_chroma(deck, week_title="Module 2", persist_directory=chroma_dir)
+    assert index.search("syn flood") == []
+    assert index.search("arp")[0][1].page_content == "ARP spoofing"
+
+    ingest.remove_pptx_from_chroma("test_deck.pptx", persist_directory=chroma_dir)
+    assert len(index) == 0
+
+
+def test_known_content_hash_is_not_recomputed(tmp_path, chroma_dir):
+    """Test that a hash computed while uploading is recorded without reading the deck again to hash it."""
+    deck = str(tmp_path / "test_hashed.pptx")
+    _write_deck(deck, ["Firewalls", "NAT"])
+    content_hash = ingest.file_sha256(deck)
+
+    with patch("server.ingest.file_sha256") as mock_hash:
+        ingest.ingest_pptx_to_chroma(deck, week_title="Module 1", persist_directory=chroma_dir,
+                                     content_hash=content_hash)
+        mock_hash.assert_not_called()
+
+    assert ingest.get_manifest(chroma_dir).get("test_hashed.pptx")["sha256"] == content_hash
+
+
+def test_document_ids_are_deterministic(tmp_path):
+    """Test that IDs depend only on source, slide number and text."""
+    deck = str(tmp_path / "test_deck.pptx")
+    _write_deck(deck, ["Firewalls", "Firewalls"])
+    first = [ingest.document_id(d) for d in ingest.pptx_to_documents(deck, week_title="Module 1")]
+    second = [ingest.document_id(d) for d in ingest.pptx_to_documents(deck, week_title="Module 9")]
+    assert first == second
+    assert first[0] != first[1]
+
+
+def test_bulk_ingest_indexes_new_decks_and_skips_unchanged(tmp_path, chroma_dir):
+    """Test that the bulk engine parses in worker processes, writes all slides and reports throughput."""
+    decks = []
+    for i in range(3):
+        path = str(tmp_path / f"test_bulk_{i}.pptx")
+        _write_deck(path, [f"Deck {i} slide {n}" for n in range(4)])
+        decks.append((path, f"Module {i}"))
+
+    ingestor = BulkIngestor(persist_directory=chroma_dir, workers=2, embed_concurrency=2,
+                            write_batch_size=5, batch_size=3, min_batch_size=1)
+    before = [metric.count() for metric in (INGEST_PARSE_SECONDS, INGEST_EMBED_SECONDS, INGEST_WRITE_SECONDS)]
+    stats = ingestor.run(decks)
+    after = [metric.count() for metric in (INGEST_PARSE_SECONDS, INGEST_EMBED_SECONDS, INGEST_WRITE_SECONDS)]
+
+    assert stats["files_ingested"] == 3
+    assert stats["files_failed"] == 0
+    assert stats["slides_written"] == 12
+    assert stats["slides_per_second"] > 0
+    # Each stage reports to the same per-slide histograms as single-file ingest
+    parsed, embedded, written = (end - start for start, end in zip(before, after))
+    assert parsed == 3
+    assert embedded == 3
+    assert written >= 1
+    for i in range(3):
+        assert len(_indexed_ids(chroma_dir, f"test_bulk_{i}.pptx")) == 4
+
+    # Bulk and single-file ingest share the manifest, so nothing is redone
+    assert ingestor.run(decks)["files_skipped"] == 3
+    with patch("server.ingest.pptx_to_documents") as mock_parse:
+        ingest.ingest_pptx_to_chroma(decks[0][0], week_title="Module 0", persist_directory=chroma_dir)
+        mock_parse.assert_not_called()
+
+
+def _slide(source, slide, text):
+    return Document(page_content=text, metadata={"source": source, "module": "Module 1", "slide": slide})
+
+
+def test_token_policy_merges_small_slides_and_keeps_citations():
+    """Test that adjacent title-only slides merge into one chunk that cites the slide range."""
+    policy = ingest.TokenChunkPolicy(target_tokens=50, overlap_tokens=0, min_tokens=10)
+    slides = [_slide("deck.pptx", 1, "Firewalls"), _slide("deck.pptx", 2, "Stateful inspection"),
+              _slide("deck.pptx", 3, "word " * 40), _slide("other.pptx", 1, "ARP")]
+
+    chunks = policy.chunk(slides)
+
+    assert [c.page_content for c in chunks] == ["Firewalls\n\nStateful inspection", ("word " * 40), "ARP"]
+    assert chunks[0].metadata == {"source": "deck.pptx", "module": "Module 1", "slide": 1, "slide_end": 2}
+    assert chunks[1].metadata["slide"] == 3
+    assert chunks[2].metadata["source"] == "other.pptx"
+
+
+def test_token_policy_splits_large_slides_with_overlap():
+    """Test that a slide over the target is split into overlapping windows within the budget."""
+    policy = ingest.TokenChunkPolicy(target_tokens=20, overlap_tokens=5, min_tokens=0)
+    words = [f"w{n}" for n in range(50)]
+    chunks = policy.chunk([_slide("deck.pptx", 4, " ".join(words))])
+
+    assert len(chunks) > 2
+    for n, chunk in enumerate(chunks):
+        assert estimate_tokens(chunk.page_content) <= 20
+        assert chunk.metadata["slide"] == 4
+        assert chunk.metadata["chunk"] == n
+        assert chunk.metadata["chunks"] == len(chunks)
+    # Consecutive windows repeat the tail of the previous one
+    assert chunks[0].page_content.split()[-1] in chunks[1].page_content.split()
+    # Every word survives the split
+    assert set(" ".join(c.page_content for c in chunks).split()) == set(words)
+    assert len({ingest.document_id(c) for c in chunks}) == len(chunks)
+
+
+def test_changing_chunk_policy_reindexes_deck(tmp_path, chroma_dir):
+    """Test that a deck indexed under one policy is re-chunked when the policy changes."""
+    deck = str(tmp_path / "test_deck.pptx")
+    _write_deck(deck, ["Firewalls", "SYN flood", "ARP spoofing"])
+    assert ingest.ingest_pptx_to_chroma(deck, week_title="Module 2", persist_directory=chroma_dir) == 3
+
+    merged = ingest.TokenChunkPolicy(target_tokens=64, overlap_tokens=0, min_tokens=32)
+    assert ingest.ingest_pptx_to_chroma(deck, week_title="Module 2", persist_directory=chroma_dir,
+                                        chunk_policy=merged) == 1
+    assert len(_indexed_ids(chroma_dir, "test_deck.pptx")) == 1
+    assert ingest.get_manifest(chroma_dir).get("test_deck.pptx")["chunk_policy"] == merged.signature()
+
+
+class _FlakyEmbeddings:
+    """Fake embedding client that records batches and fails chosen calls."""
+
+    def __init__(self, fail_calls=()):
+        self.calls = []
+        self.fail_calls = set(fail_calls)
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts):
+        with self._lock:
+            call = len(self.calls)
+            self.calls.append(list(texts))
+        if call in self.fail_calls:
+            raise ConnectionError("ollama timed out")
+        return [[float(len(t))] for t in texts]
+
+
+def test_embedding_batcher_keeps_order_and_reports_batches():
+    """Test that vectors come back in input order and each batch is reported once."""
+    fake = _FlakyEmbeddings()
+    batcher = ingest.EmbeddingBatcher(fake, batch_size=4, max_in_flight=3, min_batch_size=1, target_latency=60)
+    texts = ["x" * n for n in range(1, 11)]
+    seen = []
+    vectors = batcher.embed(texts, on_batch=lambda start, end, v: seen.append((start, end)))
+    batcher.close()
+
+    assert vectors == [[float(n)] for n in range(1, 11)]
+    covered = sorted(i for start, end in seen for i in range(start, end))
+    assert covered == list(range(10))
+
+
+def test_embedding_batcher_retries_only_the_failed_batch():
+    """Test that a transient failure re-sends just that batch, not the ones that succeeded."""
+    fake = _FlakyEmbeddings(fail_calls={1})
+    batcher = ingest.EmbeddingBatcher(fake, batch_size=2, max_in_flight=1, min_batch_size=2,
+                                      max_batch_size=2, backoff_seconds=0)
+    vectors = batcher.embed(["a", "bb", "ccc", "dddd", "eeeee", "ffffff"])
+    batcher.close()
+
+    assert vectors == [[1.0], [2.0], [3.0], [4.0], [5.0], [6.0]]
+    assert fake.calls == [["a", "bb"], ["ccc", "dddd"], ["ccc", "dddd"], ["eeeee", "ffffff"]]
+
+
+def test_embedding_batcher_gives_up_after_max_retries():
+    """Test that a batch failing every attempt raises after max_retries retries."""
+    fake = _FlakyEmbeddings(fail_calls={0, 1, 2})
+    batcher = ingest.EmbeddingBatcher(fake, batch_size=8, max_retries=2, backoff_seconds=0)
+    with pytest.raises(ConnectionError):
+        batcher.embed(["a", "b"])
+    batcher.close()
+    assert len(fake.calls) == 3
+
+
+def test_embedding_batcher_adapts_batch_size_to_latency():
+    """Test that slow batches shrink the batch size and fast ones grow it."""
+    batcher = ingest.EmbeddingBatcher(_FlakyEmbeddings(), batch_size=32, target_latency=1.0,
+                                      min_batch_size=4, max_batch_size=128)
+    batcher._adapt(32, 8.0)   # 0.25 s per slide -> ideal 4, limited to halving
+    assert batcher.batch_size == 16
+    batcher._adapt(16, 4.0)
+    assert batcher.batch_size == 8
+
+    fast = ingest.EmbeddingBatcher(_FlakyEmbeddings(), batch_size=32, target_latency=1.0, max_batch_size=128)
+    fast._adapt(32, 0.01)     # far below target -> limited to doubling
+    assert fast.batch_size == 64
+    batcher.close()
+    fast.close()
@@ -0,0 +1,53 @@
+import os
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+import pytest
+
+# Ensure the app can be imported
+import sys
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from server import jobs
+from server.db import ConnectionPool
+from server.jobs import QUEUED, RUNNING, SUCCEEDED, IngestJobQueue
+
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = ConnectionPool(str(tmp_path / "jobs.db"), size=2)
+    pool.migrate()
+    yield pool
+    pool.close()
+
+
+def test_recover_requeues_only_jobs_whose_owner_stopped_heartbeating(pool):
+    """Test that a second process sharing app.db leaves live jobs alone and reclaims abandoned ones."""
+    first = IngestJobQueue(pool, handler=lambda job, progress: 0, stale_seconds=60)
+    second = IngestJobQueue(pool, handler=lambda job, progress: 0, stale_seconds=60)
+    live, abandoned = first.enqueue("a.pptx", "Week 1"), first.enqueue("b.pptx", "Week 1")
+    assert first.claim()["id"] == live
+    assert first.claim()["id"] == abandoned
+    long_ago = (datetime.utcnow() - timedelta(minutes=5)).isoformat(timespec="microseconds")
+    with pool.connection() as conn:
+        conn.execute("UPDATE ingest_jobs SET heartbeat_at = ? WHERE id = ?", (long_ago, abandoned))
+
+    assert second.recover() == 1
+    assert first.get(live)["status"] == RUNNING
+    assert first.get(abandoned)["status"] == QUEUED
+
+    # The original owner finishing late does not overwrite the requeued job
+    first._finish(abandoned, SUCCEEDED, chunks=3)
+    assert first.get(abandoned)["status"] == QUEUED
+    assert second.claim()["id"] == abandoned
+
+
+def test_claim_without_returning_takes_each_job_once(pool):
+    """Test that the select-then-update claim used on SQLite before 3.35 hands out each job once, oldest first."""
+    queue = IngestJobQueue(pool, handler=lambda job, progress: 0)
+    ids = [queue.enqueue(f"{n}.pptx", "Week 1") for n in range(3)]
+    with patch.object(jobs, "_HAS_RETURNING", False):
+        claimed = [queue.claim() for _ in range(4)]
+    assert [job["id"] for job in claimed[:3]] == ids
+    assert all(job["status"] == RUNNING and job["attempts"] == 1 for job in claimed[:3])
+    assert claimed[3] is None
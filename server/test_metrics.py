@@ -0,0 +1,71 @@
+import os
+from unittest.mock import AsyncMock, patch
+from fastapi.testclient import TestClient
+from langchain_core.documents import Document
+
+# Ensure the app can be imported
+import sys
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import main
+from main import app
+from server.metrics import ASK_SECONDS, MetricsRegistry
+
+client = TestClient(app)
+
+
+def test_histogram_and_counter_render_prometheus_text():
+    """
+    Test that histograms render cumulative buckets, sum and count, and counters render per label set.
+    """
+    registry = MetricsRegistry()
+    latency = registry.histogram("demo_seconds", "Demo latency", buckets=(0.1, 1.0), labelnames=("stage",))
+    errors = registry.counter("demo_errors_total", "Demo errors", labelnames=("stage",))
+    registry.callback("demo_queue_depth", "Demo queue", "gauge", lambda: [((), 3)])
+    for value in (0.05, 0.5, 2.0):
+        latency.observe(value, "embed")
+    errors.inc("ask")
+    errors.inc("ask")
+
+    text = registry.render()
+    assert "# TYPE demo_seconds histogram" in text
+    assert 'demo_seconds_bucket{stage="embed",le="0.1"} 1' in text
+    assert 'demo_seconds_bucket{stage="embed",le="1"} 2' in text
+    assert 'demo_seconds_bucket{stage="embed",le="+Inf"} 3' in text
+    assert 'demo_seconds_count{stage="embed"} 3' in text
+    assert 'demo_seconds_sum{stage="embed"} 2.55' in text
+    assert 'demo_errors_total{stage="ask"} 2' in text
+    assert "demo_queue_depth 3" in text
+
+
+@patch("main.upsert_faq")
+def test_metrics_endpoint_reports_ask_latency(mock_upsert):
+    """
+    Test that /metrics exposes the per-stage histograms and counts a completed /ask.
+    """
+    result = {
+        "query": "What is a SYN flood?",
+        "context": "RELEVANT COURSE MATERIALS: ...",
+        "documents_found": 1,
+        "documents": [(Document(page_content="SYN flood overview", metadata={"slide": 4}), 0.1)],
+    }
+    before = ASK_SECONDS.count("ask")
+    main.rag_system.answer_cache.invalidate()
+    with patch.object(main.rag_system.retriever, "aembed_query", new=AsyncMock(return_value=[0.1] * 768)), \
+         patch.object(main.rag_system.retriever, "aretrieve_relevant_content", new=AsyncMock(return_value=result)), \
+         patch.object(main.rag_system.generator.async_client, "generate",
+                      new=AsyncMock(return_value={"response": "An answer."})):
+        client.post("/ask", json={"question": "Which metrics does the server expose?"})
+    main.rag_system.answer_cache.invalidate()
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert ASK_SECONDS.count("ask") == before + 1
+    for name in ("classroom_query_embed_seconds", "classroom_vector_search_seconds",
+                 "classroom_context_format_seconds", "classroom_llm_generation_seconds", "classroom_ask_seconds",
+                 "classroom_ingest_parse_seconds_per_slide", "classroom_upload_to_searchable_seconds",
+                 "classroom_cache_hits_total", "classroom_errors_total", "classroom_generation_queue_depth",
+                 "classroom_ingest_queue_depth"):
+        assert f"# TYPE {name} " in response.text
+    assert 'classroom_llm_generation_seconds_count{mode="complete"}' in response.text
@@ -0,0 +1,78 @@
+import asyncio
+import time
+import pytest
+import os
+
+# Ensure the app can be imported
+import sys
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from server.microbatch import QueryEmbeddingBatcher
+
+
+class SlowEmbeddings:
+    """Embedding stub that records each call and takes a fixed time per request."""
+
+    def __init__(self, delay=0.05, fail=False):
+        self.delay = delay
+        self.fail = fail
+        self.calls = []
+
+    def _vector(self, text):
+        return [float(len(text)), 1.0]
+
+    def embed_query(self, text):
+        self.calls.append([text])
+        time.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("ollama unavailable")
+        return self._vector(text)
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        time.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("ollama unavailable")
+        return [self._vector(text) for text in texts]
+
+
+def test_lone_request_is_sent_without_waiting_for_the_window():
+    """Test that a single query is embedded immediately with embed_query."""
+    embeddings = SlowEmbeddings(delay=0)
+    batcher = QueryEmbeddingBatcher(embeddings, window_ms=2000)
+
+    started = time.perf_counter()
+    assert batcher.embed("What is NAT?") == [12.0, 1.0]
+    assert time.perf_counter() - started < 1.0
+    assert embeddings.calls == [["What is NAT?"]]
+    batcher.close()
+
+
+def test_burst_of_questions_shares_batched_calls():
+    """Test that concurrent queries are fanned out from a few batched calls, deduplicating identical text."""
+    embeddings = SlowEmbeddings(delay=0.05)
+    batcher = QueryEmbeddingBatcher(embeddings, window_ms=20, max_batch_size=64, max_in_flight=1)
+    questions = [f"question {n % 30}" for n in range(40)]
+
+    async def ask_all():
+        return await asyncio.gather(*(batcher.aembed(question) for question in questions))
+
+    vectors = asyncio.run(ask_all())
+
+    assert vectors == [[float(len(question)), 1.0] for question in questions]
+    assert len(embeddings.calls) <= 4
+    # Repeats of a question within one batch are embedded once
+    assert all(len(set(call)) == len(call) for call in embeddings.calls)
+    assert sum(len(call) for call in embeddings.calls) <= len(questions)
+    stats = batcher.stats()
+    assert stats["requests"] == 40
+    assert stats["largest_batch"] > 1
+    batcher.close()
+
+
+def test_failed_batch_reaches_every_waiter():
+    """Test that an Ollama error is raised to each caller in the batch."""
+    batcher = QueryEmbeddingBatcher(SlowEmbeddings(delay=0, fail=True))
+    with pytest.raises(RuntimeError):
+        batcher.embed("What is ARP?")
+    batcher.close()
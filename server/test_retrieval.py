@@ -0,0 +1,196 @@
+import pytest
+import asyncio
+import os
+import time
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from unittest.mock import patch
+
+# Ensure the app can be imported
+import sys
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from server.lexical import BM25Index, reciprocal_rank_fusion
+from server.retrieval import ContextPacker, SlideRetriever
+from server.tokens import estimate_tokens
+
+
+def _candidate(text, slide, vector, score=0.5):
+    return (Document(page_content=text, metadata={"source": "test_deck.pptx", "module": "Module 1", "slide": slide}),
+            score, vector)
+
+
+format_reference = SlideRetriever._format_reference
+
+
+def test_packer_drops_near_duplicate_slides():
+    """Test that the same slide repeated across deck parts is sent only once."""
+    packer = ContextPacker(max_documents=3, token_budget=10_000)
+    candidates = [
+        _candidate("Firewalls filter packets", 1, [1.0, 0.0, 0.0]),
+        _candidate("Firewalls  filter packets", 7, [0.9, 0.1, 0.0]),   # same text, different part
+        _candidate("Firewall rules filter packets", 9, [1.0, 0.01, 0.0]),  # near-identical vector
+        _candidate("NAT rewrites addresses", 3, [0.6, 0.8, 0.0]),
+    ]
+
+    selected, stats = packer.pack(candidates, format_reference)
+
+    assert [doc.metadata["slide"] for doc, _ in selected] == [1, 3]
+    assert stats["duplicates_dropped"] == 2
+    assert stats["tokens_saved"] > 0
+
+
+def test_packer_prefers_diverse_chunks():
+    """Test that MMR picks a less similar but novel chunk over a redundant one."""
+    packer = ContextPacker(max_documents=2, token_budget=10_000, mmr_lambda=0.5, duplicate_similarity=0.999)
+    candidates = [
+        _candidate("SYN flood basics", 1, [0.9, 0.44], score=0.9),
+        _candidate("SYN flood again", 2, [0.85, 0.53], score=0.85),
+        _candidate("SYN cookies mitigate floods", 3, [0.8, -0.6], score=0.8),
+    ]
+
+    selected, _ = packer.pack(candidates, format_reference)
+
+    assert [doc.metadata["slide"] for doc, _ in selected] == [1, 3]
+
+
+def test_packer_respects_token_budget():
+    """Test that references stop at the budget and an oversized best chunk is trimmed to fit."""
+    long_text = "word " * 400
+    packer = ContextPacker(max_documents=3, token_budget=120, duplicate_similarity=1.1)
+    candidates = [
+        _candidate(long_text, 1, [1.0, 0.0]),
+        _candidate("short one", 2, [0.0, 1.0]),
+    ]
+
+    selected, stats = packer.pack(candidates, format_reference)
+
+    assert stats["context_tokens"] <= 120
+    assert sum(estimate_tokens(format_reference(i, d, s)) for i, (d, s) in enumerate(selected)) <= 120
+    assert len(selected[0][0].page_content) < len(long_text)
+    assert packer.stats()["tokens_saved"] == stats["tokens_saved"]
+
+
+def _add_texts(retriever, texts, module="Module 1", source="test_deck.pptx"):
+    """Index texts as slides 1..n of a test deck through the retriever's vector backend."""
+    documents = [Document(page_content=text, metadata={"source": source, "module": module, "slide": n})
+                 for n, text in enumerate(texts, start=1)]
+    retriever.vector_backend.upsert([f"{source}-{n}" for n in range(1, len(texts) + 1)],
+                                    retriever.embedding_model.embed_documents(texts), documents)
+    if retriever.lexical_index.loaded:
+        retriever.lexical_index.upsert([f"{source}-{n}" for n in range(1, len(texts) + 1)], documents)
+
+
+@pytest.fixture(params=["chroma", "numpy"])
+def fake_retriever(tmp_path, request):
+    """Retriever over an empty index in the given vector backend, with an offline embedding model."""
+    fake = DeterministicFakeEmbedding(size=8)
+    with patch("server.registry.get_embeddings", return_value=fake), \
+            patch("server.registry.VECTOR_BACKEND", request.param):
+        yield SlideRetriever(persist_directory=str(tmp_path))
+
+
+def test_retrieval_reports_context_tokens(fake_retriever):
+    """Test that the pipeline packs real stored candidates and reports the tokens it used and saved."""
+    retriever = fake_retriever
+    _add_texts(retriever, ["Firewalls filter packets"] * 3 + ["NAT rewrites addresses", "ARP maps IPs to MACs"])
+    result = retriever.retrieve_relevant_content("Firewalls filter packets")
+
+    assert result["documents_found"] == 3
+    texts = [doc.page_content for doc, _ in result["documents"]]
+    assert texts.count("Firewalls filter packets") == 1
+    assert 0 < result["context_tokens"] <= retriever.context_packer.token_budget
+    assert result["tokens_saved"] > 0
+
+
+def test_bm25_ranks_exact_terms_and_tracks_updates():
+    """Test that BM25 ranks exact course terms first and reflects upserts and deletes."""
+    index = BM25Index()
+    index.upsert(["a", "b", "c"], [
+        Document(page_content="A SYN flood exhausts the TCP backlog"),
+        Document(page_content="ARP spoofing poisons the ARP cache"),
+        Document(page_content="Port 443 carries HTTPS traffic"),
+    ])
+
+    assert [doc_id for doc_id, _, _ in index.search("what is arp spoofing?")] == ["b"]
+    assert index.search("port 443")[0][0] == "c"
+
+    index.upsert(["b"], [Document(page_content="Static ARP entries")])
+    assert index.search("spoofing") == []
+    index.delete(["c"])
+    assert index.search("443") == []
+    assert len(index) == 2
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    """Test that an ID ranked well by both retrievers beats one ranked first by only one."""
+    fused = reciprocal_rank_fusion([["x", "y", "z"], ["y", "w"]], k=60)
+    assert [doc_id for doc_id, _ in fused][:2] == ["y", "x"]
+
+
+@pytest.fixture
+def hybrid_retriever(fake_retriever):
+    _add_texts(fake_retriever, ["A SYN flood exhausts the TCP backlog", "ARP spoofing poisons the ARP cache",
+                                "Firewalls filter packets", "NAT rewrites addresses"])
+    return fake_retriever
+
+
+def test_hybrid_retrieval_fuses_lexical_hits(hybrid_retriever):
+    """Test that an exact-term match is retrieved even when its vector is not the nearest."""
+    hybrid_retriever.context_packer.max_documents = 2
+    result = hybrid_retriever.retrieve_relevant_content("ARP spoofing")
+
+    assert result["retrieval_mode"] == "hybrid"
+    assert result["documents"][0][0].page_content == "ARP spoofing poisons the ARP cache"
+
+
+def test_slow_embedding_falls_back_to_lexical_retrieval(hybrid_retriever):
+    """Test that a slow Ollama embedding is abandoned for BM25-only retrieval within the deadline."""
+    async def slow_embed(query):
+        await asyncio.sleep(0.5)
+        return [0.0] * 8
+
+    hybrid_retriever.embed_timeout = 0.05
+    hybrid_retriever.lexical_index  # built at startup in the app
+    with patch.object(hybrid_retriever, "aembed_query", side_effect=slow_embed):
+        result = asyncio.run(hybrid_retriever.aretrieve_relevant_content("What is a SYN flood?"))
+
+    assert result["retrieval_mode"] == "lexical"
+    assert result["documents"][0][0].page_content == "A SYN flood exhausts the TCP backlog"
+    assert hybrid_retriever.lexical_fallbacks == 1
+
+    started = time.perf_counter()
+    hybrid_retriever.lexical_retrieve("ARP spoofing")
+    assert time.perf_counter() - started < 0.01
+
+
+def test_abandoned_embedding_is_not_retried_by_retrieval(hybrid_retriever):
+    """Test that a caller's timed-out embedding sends retrieval straight to BM25 without a second Ollama call."""
+    hybrid_retriever.lexical_index
+    with patch.object(hybrid_retriever, "aembed_query") as mock_embed:
+        result = asyncio.run(hybrid_retriever.aretrieve_relevant_content("What is a SYN flood?",
+                                                                         query_embedding=None, embedded=True))
+
+    mock_embed.assert_not_called()
+    assert result["retrieval_mode"] == "lexical"
+    assert result["documents"][0][0].page_content == "A SYN flood exhausts the TCP backlog"
+
+
+def test_filters_scope_vector_and_lexical_search(fake_retriever):
+    """Test that module and source filters keep other modules out of every retrieval path."""
+    retriever = fake_retriever
+    _add_texts(retriever, ["Firewalls filter packets", "NAT rewrites addresses"], module="Module 1",
+               source="week1.pptx")
+    _add_texts(retriever, ["Firewalls filter packets by port", "ARP maps IPs to MACs"], module="Module 2",
+               source="week2.pptx")
+
+    result = retriever.retrieve_relevant_content("Firewalls filter packets", filters={"module": "Module 2"})
+    assert result["filters"] == {"module": "Module 2"}
+    assert result["documents"]
+    assert {doc.metadata["module"] for doc, _ in result["documents"]} == {"Module 2"}
+
+    lexical = retriever.lexical_retrieve("firewalls", filters={"source": "week1.pptx"})
+    assert [doc.metadata["source"] for doc, _ in lexical["documents"]] == ["week1.pptx"]
+
+    hits = retriever.similarity_search("ARP", k=5, filters={"module": "Module 1", "source": "week2.pptx"})
+    assert hits == []
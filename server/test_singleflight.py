@@ -0,0 +1,45 @@
+import threading
+import time
+import pytest
+import os
+
+# Ensure the app can be imported
+import sys
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from server.singleflight import SingleFlight
+
+
+def test_concurrent_callers_share_one_run():
+    """Test that threads asking for the same key wait for the first caller's result."""
+    flight = SingleFlight()
+    calls = []
+
+    def answer():
+        calls.append(1)
+        time.sleep(0.1)
+        return {"answer": "42"}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.run("q", answer))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert [result for result, _ in results] == [{"answer": "42"}] * 5
+    assert sorted(shared for _, shared in results) == [False, True, True, True, True]
+    assert flight.stats() == {"leaders": 1, "coalesced": 4, "in_flight": 0}
+
+
+def test_failure_is_not_remembered():
+    """Test that an error reaches the caller and the next call runs again."""
+    flight = SingleFlight()
+
+    def fail():
+        raise RuntimeError("ollama down")
+
+    with pytest.raises(RuntimeError):
+        flight.run("q", fail)
+    assert flight.run("q", lambda: "ok") == ("ok", False)
@@ -1,22 +1,27 @@
 import pytest
 from fastapi.testclient import TestClient
+import hashlib
 import io
 import os
-from unittest.mock import patch
+from unittest.mock import ANY, patch
 from langchain_core.documents import Document
 
 # Ensure the app can be imported
 import sys
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from main import app, UPLOADS_DIR, CHROMA_DIR
+import main
+from main import app, job_queue, UPLOADS_DIR, CHROMA_DIR
 
 
 # Clean up any created files in the uploads dir to keep tests idempotent
 @pytest.fixture(autouse=True)
 def cleanup_uploads():
     """Clean up dummy files created during tests."""
-    # Before the test, do nothing
+    # Before the test, settle jobs queued by earlier tests so each test only sees its own
+    with patch("main.ingest_pptx_to_chroma", return_value=0):
+        while job_queue.run_once():
+            pass
     yield
     # After the test, clean up files
     for filename in os.listdir(UPLOADS_DIR):
@@ -43,16 +48,80 @@ def test_upload_file_too_large():
         data={"week_title": "Test Week"}
     )
 
-    assert response.status_code == 200  # App returns 200 for controlled errors
+    # Rejected on Content-Length, before the body is read
+    assert response.status_code == 413
     json_response = response.json()
     assert "error" in json_response
     assert json_response["error"] == "File exceeds 25MB limit."
 
+    assert not os.path.exists(os.path.join(UPLOADS_DIR, "test_large_file.pptx"))
+    assert not [f for f in os.listdir(UPLOADS_DIR) if f.startswith(".upload-")]
+
+
+@patch("main._save_upload")
+def test_chunked_upload_is_cut_off_once_over_the_limit(mock_save):
+    """
+    Test that an upload without a Content-Length is refused as soon as it passes the limit.
+    """
+    boundary = "testboundary"
+
+    def body():
+        head = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"chunked.pptx\"\r\n"
+                "Content-Type: application/octet-stream\r\n\r\n")
+        yield head.encode()
+        for _ in range(40):
+            yield b"a" * (1024 * 1024)
+        yield f"\r\n--{boundary}--\r\n".encode()
+
+    response = client.post(
+        "/upload",
+        content=body(),
+        headers={"Content-Type": f"multipart/form-data; boundary={boundary}"},
+    )
+
+    assert response.status_code == 413
+    assert response.json()["error"] == "File exceeds 25MB limit."
+    # Refused while the form was being parsed, so the handler never ran
+    mock_save.assert_not_called()
+
+
+@patch("main.MAX_UPLOAD_BYTES", 10)
+def test_upload_over_limit_within_form_overhead_is_still_refused():
+    """
+    Test that the exact file size is still enforced for bodies the early check lets through.
+    """
+    response = client.post(
+        "/upload",
+        files={"file": ("slightly_large.pptx", io.BytesIO(b"a" * 11), "application/octet-stream")},
+    )
+
+    assert response.status_code == 413
+    assert response.json()["error"] == "File exceeds 25MB limit."
+    assert not os.path.exists(os.path.join(UPLOADS_DIR, "slightly_large.pptx"))
+    assert not [f for f in os.listdir(UPLOADS_DIR) if f.startswith(".upload-")]
+
+
+@patch("main.ingest_pptx_to_chroma")
+@patch("main.UPLOAD_CHUNK_SIZE", 7)
+def test_upload_streams_in_chunks_and_hashes_content(mock_ingest):
+    """
+    Test that an upload written in many small chunks is saved intact with its SHA-256.
+    """
+    content = b"dummy pptx content spanning several chunks"
+    file = ("test_chunked_file.pptx", io.BytesIO(content), "application/vnd.openxmlformats-officedocument.presentationml.presentation")
+
+    response = client.post("/upload", files={"file": file}, data={"week_title": "Test Week"})
+
+    assert response.status_code == 202
+    assert response.json()["sha256"] == hashlib.sha256(content).hexdigest()
+    with open(os.path.join(UPLOADS_DIR, "test_chunked_file.pptx"), "rb") as f:
+        assert f.read() == content
+
 
 @patch("main.ingest_pptx_to_chroma")
 def test_upload_valid_file(mock_ingest):
     """
-    Test that uploading a valid file (small .pptx) succeeds and returns the material ID.
+    Test that uploading a valid file (small .pptx) is accepted with a job that a worker then completes.
     """
     mock_ingest.return_value = 5  # Mocked to return 5 slides indexed
 
@@ -67,23 +136,69 @@ def test_upload_valid_file(mock_ingest):
         data={"week_title": "Test Week"}
     )
 
-    assert response.status_code == 200, f"Expected status 200, got {response.status_code}. Body: {response.text}"
+    assert response.status_code == 202, f"Expected status 202, got {response.status_code}. Body: {response.text}"
     json_response = response.json()
 
     assert "error" not in json_response, f"Received an unexpected error: {json_response.get('error')}"
     assert "id" in json_response
-    assert json_response["status"] == "processed"
+    assert json_response["status"] == "queued"
     assert json_response["filename"] == small_file_name
     assert json_response["size_bytes"] == len(small_file_content)
-    assert json_response["slides_indexed"] == 5
 
     # Check if the file was actually saved
     saved_path = os.path.join(UPLOADS_DIR, small_file_name)
     assert os.path.exists(saved_path)
 
-    # Check that ingest was called correctly
+    # Nothing is ingested inside the request
+    mock_ingest.assert_not_called()
+    job_id = json_response["job_id"]
+    assert client.get(f"/jobs/{job_id}").json()["status"] == "queued"
+
+    # Run the job the way a background worker would
+    while job_queue.run_once():
+        pass
+
     expected_chroma_dir = os.path.join(os.path.dirname(__file__), "chroma_db")
-    mock_ingest.assert_called_once_with(saved_path, week_title="Test Week", persist_directory=expected_chroma_dir)
+    # The hash computed while streaming is handed to ingest, so the file is not read again to hash it
+    mock_ingest.assert_called_once_with(saved_path, week_title="Test Week", persist_directory=expected_chroma_dir,
+                                        progress=ANY, on_documents=ANY, before_write=ANY,
+                                        content_hash=json_response["sha256"])
+    job = client.get(f"/jobs/{job_id}").json()
+    assert job["status"] == "succeeded"
+    assert job["material_id"] == json_response["id"]
+    assert job["chunks_processed"] == 5
+    assert job["error"] is None
+
+
+@patch("main.ingest_pptx_to_chroma")
+def test_failed_ingest_job_reports_error(mock_ingest):
+    """
+    Test that a job whose ingest raises is marked failed with the error message.
+    """
+    def partial_ingest(file_path, week_title, persist_directory, progress, on_documents, before_write, content_hash):
+        progress(3, 10)
+        raise ConnectionError("ollama unavailable")
+    mock_ingest.side_effect = partial_ingest
+
+    file = ("test_failing_file.pptx", io.BytesIO(b"dummy pptx content"), "application/vnd.openxmlformats-officedocument.presentationml.presentation")
+    response = client.post("/upload", files={"file": file}, data={"week_title": "Test Week"})
+    assert response.status_code == 202
+
+    while job_queue.run_once():
+        pass
+
+    job = client.get(f"/jobs/{response.json()['job_id']}").json()
+    assert job["status"] == "failed"
+    assert job["error"] == "ollama unavailable"
+    assert job["chunks_processed"] == 3
+    assert job["chunks_total"] == 10
+
+
+def test_unknown_job_returns_error():
+    """
+    Test that polling a job ID that does not exist returns an error.
+    """
+    assert client.get("/jobs/999999999").json() == {"error": "Job not found."}
 
 
 @patch("main.ingest_pptx_to_chroma")
@@ -111,7 +226,7 @@ def test_view_material_content(mock_pptx_to_docs, mock_ingest):
         data={"week_title": "Test View Week"}
     )
     
-    assert upload_response.status_code == 200
+    assert upload_response.status_code == 202
     upload_json = upload_response.json()
     assert "id" in upload_json
     material_id = upload_json["id"]
@@ -136,6 +251,87 @@ def test_view_material_content(mock_pptx_to_docs, mock_ingest):
     mock_pptx_to_docs.assert_called_once_with(saved_path, week_title="Test View Week")
 
 
+@patch("main.pptx_to_documents")
+def test_view_serves_stored_slides_with_etag_and_pagination(mock_pptx_to_docs):
+    """
+    Test that slides stored at ingest are served without re-parsing, paginated and revalidated by ETag.
+    """
+    file = ("test_paged_file.pptx", io.BytesIO(b"dummy pptx content"), "application/vnd.openxmlformats-officedocument.presentationml.presentation")
+    upload_json = client.post("/upload", files={"file": file}, data={"week_title": "Paged Week"}).json()
+    material_id = upload_json["id"]
+
+    def fake_ingest(file_path, week_title, persist_directory, progress, on_documents, before_write, content_hash):
+        on_documents([
+            Document(page_content=f"Slide {n} content", metadata={"source": "test_paged_file.pptx", "slide": n})
+            for n in range(1, 6)
+        ])
+        return 5
+
+    with patch("main.ingest_pptx_to_chroma", side_effect=fake_ingest):
+        while job_queue.run_once():
+            pass
+
+    page = client.get(f"/materials/{material_id}/view", params={"offset": 2, "limit": 2})
+    assert page.status_code == 200
+    body = page.json()
+    assert body["total_slides"] == 5
+    assert [s["slide"] for s in body["content"]] == [3, 4]
+    mock_pptx_to_docs.assert_not_called()
+
+    etag = page.headers["etag"]
+    cached = client.get(f"/materials/{material_id}/view", params={"offset": 2, "limit": 2},
+                        headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+
+    # A different page is a different representation
+    other = client.get(f"/materials/{material_id}/view", headers={"If-None-Match": etag})
+    assert other.status_code == 200
+    assert len(other.json()["content"]) == 5
+
+    # Lists, weak validators (e.g. after a proxy recompresses the body) and "*" also revalidate
+    for if_none_match in (f'"stale", {etag}', f"W/{etag}", "*"):
+        revalidated = client.get(f"/materials/{material_id}/view", params={"offset": 2, "limit": 2},
+                                 headers={"If-None-Match": if_none_match})
+        assert revalidated.status_code == 304
+    changed = client.get(f"/materials/{material_id}/view", params={"offset": 2, "limit": 2},
+                         headers={"If-None-Match": '"stale", W/"other"'})
+    assert changed.status_code == 200
+
+
+@patch("main.remove_pptx_from_chroma")
+@patch("main.pptx_to_documents")
+def test_startup_scan_stores_slides_of_parsed_decks(mock_pptx_to_docs, mock_remove, tmp_path):
+    """
+    Test that decks found by the startup scan are viewable from stored slides without re-parsing.
+    """
+    deck = tmp_path / "test_scanned_deck.pptx"
+    deck.write_bytes(b"dummy pptx content")
+
+    class FakeBulkIngestor:
+        def __init__(self, persist_directory):
+            pass
+
+        def run(self, files, on_documents):
+            for file_path, _ in files:
+                on_documents(file_path, [
+                    Document(page_content=f"Scanned slide {n}", metadata={"source": "test_scanned_deck.pptx", "slide": n})
+                    for n in range(1, 4)
+                ])
+            return {"failed_sources": []}
+
+    with patch("main.UPLOADS_DIR", str(tmp_path)), patch("main.BulkIngestor", FakeBulkIngestor):
+        main.ingest_existing_powerpoints()
+        materials = [m for week in client.get("/materials").json() for m in week["materials"]]
+        material_id = next(m["id"] for m in materials if m["name"] == "test_scanned_deck.pptx")
+
+        view = client.get(f"/materials/{material_id}/view")
+        assert view.status_code == 200
+        assert [s["content"] for s in view.json()["content"]] == [f"Scanned slide {n}" for n in range(1, 4)]
+        mock_pptx_to_docs.assert_not_called()
+
+        client.delete(f"/materials/{material_id}")
+
+
 @patch("main.ingest_pptx_to_chroma")
 def test_delete_material(mock_ingest):
     """
@@ -149,7 +345,7 @@ def test_delete_material(mock_ingest):
     file = (file_name, io.BytesIO(file_content), "application/vnd.openxmlformats-officedocument.presentationml.presentation")
 
     upload_response = client.post("/upload", files={"file": file}, data={"week_title": "Delete Test"})
-    assert upload_response.status_code == 200
+    assert upload_response.status_code == 202
     upload_json = upload_response.json()
     material_id = upload_json["id"]
     
@@ -176,3 +372,76 @@ def test_delete_material(mock_ingest):
                 found = True
                 break
     assert not found, "Material record was not deleted from the database."
+
+
+def _material_status(material_id):
+    for week in client.get("/materials").json():
+        for material in week["materials"]:
+            if material["id"] == material_id:
+                return material["status"]
+    return None
+
+
+@patch("main.ingest_pptx_to_chroma")
+def test_material_status_follows_its_ingest_job(mock_ingest):
+    """
+    Test that /materials reports uploads as processing until their job succeeds, and failed ingests as errors.
+    """
+    mock_ingest.return_value = 1
+    file = ("test_status_ok.pptx", io.BytesIO(b"status content"), "application/vnd.openxmlformats-officedocument.presentationml.presentation")
+    material_id = client.post("/upload", files={"file": file}, data={"week_title": "Status Week"}).json()["id"]
+    assert _material_status(material_id) == "processing"
+    while job_queue.run_once():
+        pass
+    assert _material_status(material_id) == "processed"
+
+    mock_ingest.side_effect = ConnectionError("ollama unavailable")
+    file = ("test_status_bad.pptx", io.BytesIO(b"status content"), "application/vnd.openxmlformats-officedocument.presentationml.presentation")
+    material_id = client.post("/upload", files={"file": file}, data={"week_title": "Status Week"}).json()["id"]
+    while job_queue.run_once():
+        pass
+    assert _material_status(material_id) == "error"
+
+
+@patch("main.remove_pptx_from_chroma")
+def test_delete_during_ingest_cancels_job_before_next_write(mock_remove):
+    """
+    Test that deleting a material while its deck is being ingested cancels the job before it writes more vectors.
+    """
+    file = ("test_cancel_file.pptx", io.BytesIO(b"cancel content"), "application/vnd.openxmlformats-officedocument.presentationml.presentation")
+    upload_json = client.post("/upload", files={"file": file}, data={"week_title": "Cancel Week"}).json()
+    writes = []
+
+    def ingest_then_deleted(file_path, week_title, persist_directory, progress, on_documents, before_write, content_hash):
+        before_write()
+        writes.append(1)
+        assert client.delete(f"/materials/{upload_json['id']}").status_code == 204
+        before_write()
+        writes.append(2)
+        return 2
+
+    with patch("main.ingest_pptx_to_chroma", side_effect=ingest_then_deleted):
+        while job_queue.run_once():
+            pass
+
+    assert writes == [1]
+    assert client.get(f"/jobs/{upload_json['job_id']}").json()["status"] == "cancelled"
+    # Once by the delete, once more by the cancelled job in case a batch landed in between
+    assert [c.args[0] for c in mock_remove.call_args_list] == ["test_cancel_file.pptx", "test_cancel_file.pptx"]
+
+
+@patch("main.ingest_pptx_to_chroma")
+def test_material_filters_list_uploaded_modules_and_decks(mock_ingest):
+    """
+    Test that /materials/filters offers each uploaded module and deck as an /ask scope.
+    """
+    mock_ingest.return_value = 1
+    for name, week in [("test_filter_a.pptx", "Filter Week A"), ("test_filter_b.pptx", "Filter Week B")]:
+        file = (name, io.BytesIO(b"filter content"), "application/vnd.openxmlformats-officedocument.presentationml.presentation")
+        client.post("/upload", files={"file": file}, data={"week_title": week})
+
+    response = client.get("/materials/filters")
+    assert response.status_code == 200
+    body = response.json()
+    assert ["Filter Week A", "Filter Week B"] == [m for m in body["modules"] if m.startswith("Filter Week")]
+    assert {"source": "test_filter_b.pptx", "module": "Filter Week B"} in body["sources"]
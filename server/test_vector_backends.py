@@ -0,0 +1,118 @@
+import pytest
+import json
+import os
+import numpy as np
+from unittest.mock import patch
+from langchain_core.documents import Document
+
+# Ensure the app can be imported
+import sys
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from server.vector_backends import NumpyBackend
+
+
+def _doc(source, slide):
+    return Document(page_content=f"{source} slide {slide}", metadata={"source": source, "slide": slide})
+
+
+def test_numpy_backend_top_k_matches_brute_force(tmp_path):
+    """Test that the memory-mapped search returns the exact cosine top-k."""
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(300, 16)).astype(np.float32)
+    backend = NumpyBackend(str(tmp_path), initial_capacity=8)
+    backend.upsert([f"id{n}" for n in range(300)], vectors.tolist(), [_doc("a.pptx", n) for n in range(300)])
+
+    query = rng.normal(size=16).astype(np.float32)
+    hits = backend.query(query.tolist(), k=5)
+
+    unit = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    expected = np.argsort(-(unit @ (query / np.linalg.norm(query))))[:5]
+    assert [doc_id for doc_id, _, _, _ in hits] == [f"id{n}" for n in expected]
+    assert hits[0][1].metadata == {"source": "a.pptx", "slide": int(expected[0])}
+    assert hits[0][2] >= hits[-1][2]
+
+
+def test_numpy_backend_persists_and_recycles_deleted_rows(tmp_path):
+    """Test that deletes free rows for reuse and the index reloads from its files."""
+    backend = NumpyBackend(str(tmp_path), initial_capacity=4)
+    backend.upsert(["a", "b", "c"], [[1, 0], [0, 1], [1, 1]], [_doc("x.pptx", 1), _doc("x.pptx", 2), _doc("y.pptx", 1)])
+    backend.delete(["b"])
+    backend.upsert(["d"], [[0, 1]], [_doc("y.pptx", 2)])
+
+    assert backend.count() == 3
+    assert len(backend._rows) == 3  # "d" took the row freed by "b"
+    assert backend.ids_for_source("x.pptx") == ["a"]
+
+    reopened = NumpyBackend(str(tmp_path))
+    assert reopened.count() == 3
+    assert sorted(reopened.ids_for_source("y.pptx")) == ["c", "d"]
+    assert reopened.query([0, 1], k=1)[0][0] == "d"
+    assert reopened.get_vectors(["a"])["a"] == pytest.approx([1.0, 0.0])
+
+
+@patch("server.vector_backends.SIDECAR_COMPACT_MIN_ROWS", 4)
+def test_numpy_backend_logs_changed_rows_instead_of_rewriting_sidecar(tmp_path):
+    """Test that upserts and deletes append only their rows to the log, which compacts and replays on load."""
+    backend = NumpyBackend(str(tmp_path))
+    sidecar = os.path.join(str(tmp_path), NumpyBackend.SIDECAR_FILENAME)
+    log = os.path.join(str(tmp_path), NumpyBackend.LOG_FILENAME)
+    backend.upsert(["a", "b", "c"], [[1, 0], [0, 1], [1, 1]], [_doc("x.pptx", 1), _doc("x.pptx", 2), _doc("y.pptx", 1)])
+    backend.delete(["b"])
+
+    assert not os.path.exists(sidecar)
+    with open(log, encoding="utf-8") as f:
+        assert [len(json.loads(line)["rows"]) for line in f] == [3, 1]
+
+    # A fifth logged row outgrows both the minimum and the index, so the log is folded into a snapshot
+    backend.upsert(["d"], [[0, 1]], [_doc("y.pptx", 2)])
+    assert os.path.exists(sidecar)
+    assert not os.path.exists(log)
+
+    backend.upsert(["a"], [[0, 1]], [_doc("z.pptx", 1)])
+    with open(log, "a", encoding="utf-8") as f:
+        f.write('{"dimension": 2, "capacity"')  # torn write from a crash
+
+    reopened = NumpyBackend(str(tmp_path))
+    assert reopened.count() == 3
+    assert reopened.ids_for_source("z.pptx") == ["a"]
+    assert sorted(reopened.ids_for_source("y.pptx")) == ["c", "d"]
+    # The partial line was dropped, so later changes still replay
+    reopened.delete(["c"])
+    assert NumpyBackend(str(tmp_path)).ids_for_source("y.pptx") == ["d"]
+
+
+def test_numpy_backend_rejects_dimension_change(tmp_path):
+    """Test that vectors from a different embedding model are refused."""
+    backend = NumpyBackend(str(tmp_path))
+    backend.upsert(["a"], [[1.0, 0.0]], [_doc("x.pptx", 1)])
+    with pytest.raises(ValueError):
+        backend.upsert(["b"], [[1.0, 0.0, 0.0]], [_doc("x.pptx", 2)])
+
+
+@pytest.mark.parametrize("quantization", ["float16", "int8"])
+def test_quantized_search_rescores_to_exact_results(tmp_path, quantization):
+    """Test that compact coarse search plus exact re-scoring matches full-precision search, also after reload."""
+    rng = np.random.default_rng(1)
+    vectors = rng.normal(size=(500, 32)).astype(np.float32).tolist()
+    documents = [_doc("a.pptx", n) for n in range(500)]
+    exact = NumpyBackend(str(tmp_path / "exact"))
+    exact.upsert([f"id{n}" for n in range(500)], vectors, documents)
+    compact = NumpyBackend(str(tmp_path / "compact"), initial_capacity=64, quantization=quantization)
+    compact.upsert([f"id{n}" for n in range(500)], vectors, documents)
+    reopened = NumpyBackend(str(tmp_path / "compact"), quantization=quantization)
+
+    for query in rng.normal(size=(20, 32)).tolist():
+        expected = [(doc_id, pytest.approx(score, abs=1e-6)) for doc_id, _, score, _ in exact.query(query, k=5)]
+        assert [(doc_id, score) for doc_id, _, score, _ in compact.query(query, k=5)] == expected
+        assert [(doc_id, score) for doc_id, _, score, _ in reopened.query(query, k=5)] == expected
+
+    stats = compact.stats()
+    assert stats["search_bytes"] < stats["full_precision_bytes"]
+    assert stats["vectors"] == 500
+
+
+def test_numpy_backend_rejects_unknown_quantization(tmp_path):
+    """Test that a misspelled quantization mode fails fast."""
+    with pytest.raises(ValueError):
+        NumpyBackend(str(tmp_path), quantization="int4")
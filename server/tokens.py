@@ -0,0 +1,26 @@
+"""
+Token estimates for prompt budgeting and chunk sizing
+llama3 and nomic-embed-text use different BPE vocabularies; a character and word based
+estimate is close enough for budgets and avoids loading a tokenizer on the request path
+"""
+
+import math
+import re
+from typing import List
+
+# English prose averages about four characters per BPE token
+CHARS_PER_TOKEN = 4.0
+
+_WORDS = re.compile(r"\S+\s*")
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate token count: the larger of the character and word based estimates"""
+    if not text:
+        return 0
+    return max(math.ceil(len(text) / CHARS_PER_TOKEN), len(text.split()))
+
+
+def split_words(text: str) -> List[str]:
+    """Split text into words that keep their trailing whitespace, so joining them restores the text"""
+    return _WORDS.findall(text)
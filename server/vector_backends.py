@@ -0,0 +1,480 @@
+"""
+Vector storage backends for AI Classroom Co-Pilot
+Ingest, delete and retrieval talk to a VectorBackend; VECTOR_BACKEND selects the implementation:
+  chroma  the persistent Chroma collection (default)
+  numpy   a memory-mapped float32 matrix searched with one matrix-vector product, plus a JSON sidecar
+          snapshot and an append-only log of row changes
+The numpy backend can also keep a compact float16 or int8 copy in memory for the coarse search
+and re-score only the best candidates against the full-precision rows on disk
+Queries accept metadata filters such as {"module": "Module 2"}, applied inside the index
+"""
+
+import json
+import logging
+import os
+import threading
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+from langchain_chroma import Chroma
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+# (id, document, relevance in [0, 1], stored vector), best first
+VectorHit = Tuple[str, Document, float, List[float]]
+
+# Exact-match metadata filters, e.g. {"module": "Module 2", "source": "week2.pptx"}; every field must match
+MetadataFilter = Dict[str, Any]
+# Metadata fields the numpy backend keeps posting lists for, so filtered queries skip other rows
+INDEXED_METADATA_FIELDS = ("source", "module")
+
+QUANTIZATIONS = ("none", "float16", "int8")
+# Rows scored per block when upcasting compact codes, which bounds the temporary float32 copy
+SEARCH_BLOCK_ROWS = 8192
+# The row-change log is folded into a fresh sidecar snapshot once it holds more rows than this or than
+# the index itself, so each change costs amortized O(1) writes instead of a rewrite of every chunk's text
+SIDECAR_COMPACT_MIN_ROWS = 1024
+
+
+def metadata_matches(metadata: Dict[str, Any], where: Optional[MetadataFilter]) -> bool:
+    return not where or all(metadata.get(field) == value for field, value in where.items())
+
+
+def chroma_where(where: Optional[MetadataFilter]) -> Optional[Dict[str, Any]]:
+    """Chroma's where syntax: a single field as is, several combined with $and"""
+    if not where:
+        return None
+    if len(where) == 1:
+        return dict(where)
+    return {"$and": [{field: value} for field, value in where.items()]}
+
+
+class VectorBackend:
+    """Storage and nearest-neighbour search for embedded chunks keyed by deterministic IDs"""
+
+    name = "base"
+
+    def upsert(self, ids: List[str], embeddings: List[List[float]], documents: List[Document]) -> None:
+        raise NotImplementedError
+
+    def delete(self, ids: List[str]) -> None:
+        raise NotImplementedError
+
+    def ids_for_source(self, source: str) -> List[str]:
+        raise NotImplementedError
+
+    def query(self, embedding: List[float], k: int, where: Optional[MetadataFilter] = None) -> List[VectorHit]:
+        raise NotImplementedError
+
+    def get_vectors(self, ids: List[str]) -> Dict[str, List[float]]:
+        raise NotImplementedError
+
+    def all_documents(self) -> Tuple[List[str], List[Document]]:
+        raise NotImplementedError
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name, "vectors": self.count()}
+
+
+class ChromaBackend(VectorBackend):
+    """The persistent Chroma collection, written with precomputed embeddings"""
+
+    name = "chroma"
+
+    def __init__(self, store: Chroma):
+        self.store = store
+        self._collection = store._collection
+
+    def upsert(self, ids: List[str], embeddings: List[List[float]], documents: List[Document]) -> None:
+        self._collection.upsert(
+            ids=ids,
+            embeddings=embeddings,
+            documents=[doc.page_content for doc in documents],
+            metadatas=[doc.metadata for doc in documents],
+        )
+
+    def delete(self, ids: List[str]) -> None:
+        if ids:
+            self._collection.delete(ids=ids)
+
+    def ids_for_source(self, source: str) -> List[str]:
+        existing = self._collection.get(where={"source": source}, include=[])
+        return list(existing.get("ids", [])) if existing else []
+
+    def _relevance_fn(self) -> Callable[[float], float]:
+        """Map Chroma distances to relevance in [0, 1] for the collection's distance metric"""
+        try:
+            return self.store._select_relevance_score_fn()
+        except ValueError:
+            return lambda distance: 1.0 / (1.0 + distance)
+
+    def query(self, embedding: List[float], k: int, where: Optional[MetadataFilter] = None) -> List[VectorHit]:
+        # Chroma resolves the where clause against its SQLite metadata index before the vector search
+        results = self._collection.query(
+            query_embeddings=[embedding],
+            n_results=k,
+            where=chroma_where(where),
+            include=["documents", "metadatas", "distances", "embeddings"],
+        )
+        if not results["ids"] or not results["ids"][0]:
+            return []
+        relevance = self._relevance_fn()
+        return [
+            (doc_id, Document(page_content=text, metadata=metadata or {}), relevance(float(distance)), list(vector))
+            for doc_id, text, metadata, distance, vector in zip(
+                results["ids"][0], results["documents"][0], results["metadatas"][0],
+                results["distances"][0], results["embeddings"][0]
+            )
+        ]
+
+    def get_vectors(self, ids: List[str]) -> Dict[str, List[float]]:
+        if not ids:
+            return {}
+        rows = self._collection.get(ids=ids, include=["embeddings"])
+        return {doc_id: list(vector) for doc_id, vector in zip(rows["ids"], rows["embeddings"])}
+
+    def all_documents(self) -> Tuple[List[str], List[Document]]:
+        rows = self._collection.get(include=["documents", "metadatas"])
+        documents = [Document(page_content=text or "", metadata=metadata or {})
+                     for text, metadata in zip(rows["documents"], rows["metadatas"])]
+        return list(rows["ids"]), documents
+
+    def count(self) -> int:
+        return self._collection.count()
+
+
+class NumpyBackend(VectorBackend):
+    """
+    Contiguous float32 matrix in a memory-mapped file, searched with a single matrix-vector product
+    Rows are unit-normalized on write so the dot product is the cosine similarity. Deleted rows are
+    recycled, and the file doubles in size when full. IDs, text and metadata for each row live in a
+    JSON sidecar snapshot; each upsert or delete appends only the rows it changed to a JSON-lines log,
+    which is replayed on load and compacted into a new snapshot once it outgrows the index.
+
+    With quantization "float16" or "int8" the coarse search runs over a compact in-memory copy
+    (int8 uses one scale per row), and the top rescore_factor * k candidates are re-scored exactly
+    against the memory-mapped float32 rows, so only those pages are read from disk.
+
+    Posting lists per source and module value let filtered queries score only the matching rows.
+    """
+
+    name = "numpy"
+    VECTORS_FILENAME = "vectors.f32"
+    SIDECAR_FILENAME = "vectors.json"
+    LOG_FILENAME = "vectors.log"
+
+    def __init__(self, directory: str, initial_capacity: int = 1024, quantization: str = "none",
+                 rescore_factor: int = 4):
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unknown vector quantization '{quantization}'; expected one of {QUANTIZATIONS}")
+        self.directory = directory
+        self.initial_capacity = initial_capacity
+        self.quantization = quantization
+        self.rescore_factor = max(1, rescore_factor)
+        self._lock = threading.RLock()
+        self._vectors_path = os.path.join(directory, self.VECTORS_FILENAME)
+        self._sidecar_path = os.path.join(directory, self.SIDECAR_FILENAME)
+        self._log_path = os.path.join(directory, self.LOG_FILENAME)
+        self._log_rows = 0
+        self.dimension: Optional[int] = None
+        self._capacity = 0
+        self._matrix: Optional[np.memmap] = None
+        self._codes: Optional[np.ndarray] = None    # compact copy of the matrix when quantized
+        self._scales: Optional[np.ndarray] = None   # per-row int8 scale
+        self._live = np.zeros(0, dtype=bool)
+        self._rows: List[Optional[Dict[str, Any]]] = []   # per row: {"id", "text", "metadata"} or None
+        self._row_of: Dict[str, int] = {}
+        self._free: List[int] = []
+        self._field_rows: Dict[Tuple[str, Any], Set[int]] = {}
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _load(self) -> None:
+        if os.path.exists(self._sidecar_path):
+            with open(self._sidecar_path, "r", encoding="utf-8") as f:
+                sidecar = json.load(f)
+            self.dimension = sidecar["dimension"]
+            self._capacity = sidecar["capacity"]
+            self._rows = sidecar["rows"]
+        torn = self._replay_log()
+        if self.dimension is None:
+            return
+        self._matrix = np.memmap(self._vectors_path, dtype=np.float32, mode="r+",
+                                 shape=(self._capacity, self.dimension))
+        self._live = np.zeros(self._capacity, dtype=bool)
+        if self.quantization != "none":
+            self._resize_codes(self._capacity)
+            for start in range(0, len(self._rows), SEARCH_BLOCK_ROWS):
+                self._encode_rows(start, np.asarray(self._matrix[start:start + SEARCH_BLOCK_ROWS]))
+        for row, entry in enumerate(self._rows):
+            if entry is None:
+                self._free.append(row)
+            else:
+                self._row_of[entry["id"]] = row
+                self._live[row] = True
+                self._index_metadata(row, entry["metadata"])
+        if torn:
+            # Start a clean log so the next append does not land on the partial line
+            self._save_sidecar()
+        logger.info(f"Loaded {len(self._row_of)} vectors from {self._vectors_path}")
+
+    def _replay_log(self) -> bool:
+        """Apply the row changes logged since the last snapshot; returns True if a torn final line was dropped"""
+        if not os.path.exists(self._log_path):
+            return False
+        with open(self._log_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    change = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f"Ignoring an incomplete change at the end of {self._log_path}")
+                    return True
+                self.dimension = change["dimension"]
+                # Replaying changes already in the snapshot (a crash before the log was removed) is harmless
+                self._capacity = max(self._capacity, change["capacity"])
+                for row, entry in change["rows"]:
+                    if row >= len(self._rows):
+                        self._rows.extend([None] * (row + 1 - len(self._rows)))
+                    self._rows[row] = entry
+                self._log_rows += len(change["rows"])
+        return False
+
+    def _index_metadata(self, row: int, metadata: Dict[str, Any]) -> None:
+        for field in INDEXED_METADATA_FIELDS:
+            if field in metadata:
+                self._field_rows.setdefault((field, metadata[field]), set()).add(row)
+
+    def _unindex_metadata(self, row: int, metadata: Dict[str, Any]) -> None:
+        for field in INDEXED_METADATA_FIELDS:
+            rows = self._field_rows.get((field, metadata.get(field)))
+            if rows is not None:
+                rows.discard(row)
+                if not rows:
+                    del self._field_rows[(field, metadata.get(field))]
+
+    def _matching_rows(self, where: Optional[MetadataFilter]) -> Optional[np.ndarray]:
+        """Sorted rows matching every filter field, or None when unfiltered"""
+        if not where:
+            return None
+        indexed = [self._field_rows.get((field, value), set())
+                   for field, value in where.items() if field in INDEXED_METADATA_FIELDS]
+        others = {field: value for field, value in where.items() if field not in INDEXED_METADATA_FIELDS}
+        if indexed:
+            rows = set.intersection(*sorted(indexed, key=len))
+        else:
+            rows = {row for row, entry in enumerate(self._rows) if entry is not None}
+        if others:
+            rows = {row for row in rows if metadata_matches(self._rows[row]["metadata"], others)}
+        return np.fromiter(sorted(rows), dtype=np.int64, count=len(rows))
+
+    def _resize_codes(self, capacity: int) -> None:
+        if self.quantization == "none":
+            return
+        dtype = np.int8 if self.quantization == "int8" else np.float16
+        codes = np.zeros((capacity, self.dimension), dtype=dtype)
+        scales = np.zeros(capacity, dtype=np.float32)
+        if self._codes is not None:
+            codes[:len(self._codes)] = self._codes
+            scales[:len(self._scales)] = self._scales
+        self._codes, self._scales = codes, scales
+
+    def _encode_rows(self, start: int, vectors: np.ndarray) -> None:
+        """Store the compact form of consecutive rows starting at start"""
+        if self.quantization == "none" or not len(vectors):
+            return
+        end = start + len(vectors)
+        if self.quantization == "float16":
+            self._codes[start:end] = vectors.astype(np.float16)
+            return
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        self._codes[start:end] = np.round(vectors / scales[:, None]).astype(np.int8)
+        self._scales[start:end] = scales
+
+    def _coarse_scores(self, query: np.ndarray, rows: Optional[np.ndarray], used: int) -> np.ndarray:
+        """Scores for the given rows, or for every used row when rows is None"""
+        if self.quantization == "none":
+            return (self._matrix[:used] if rows is None else self._matrix[rows]) @ query
+        total = used if rows is None else len(rows)
+        scores = np.empty(total, dtype=np.float32)
+        for start in range(0, total, SEARCH_BLOCK_ROWS):
+            end = min(start + SEARCH_BLOCK_ROWS, total)
+            block = slice(start, end) if rows is None else rows[start:end]
+            scores[start:end] = self._codes[block].astype(np.float32) @ query
+            if self.quantization == "int8":
+                scores[start:end] *= self._scales[block]
+        return scores
+
+    def _save_sidecar(self) -> None:
+        """Write a full snapshot atomically and start a new, empty log"""
+        tmp_path = f"{self._sidecar_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"dimension": self.dimension, "capacity": self._capacity, "rows": self._rows}, f)
+        os.replace(tmp_path, self._sidecar_path)
+        if os.path.exists(self._log_path):
+            os.remove(self._log_path)
+        self._log_rows = 0
+
+    def _log_changes(self, rows: List[int]) -> None:
+        """Append the current contents of the changed rows to the log, compacting once it outgrows the index"""
+        rows = list(dict.fromkeys(rows))
+        change = {"dimension": self.dimension, "capacity": self._capacity,
+                  "rows": [[row, self._rows[row]] for row in rows]}
+        with open(self._log_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(change) + "\n")
+        self._log_rows += len(rows)
+        if self._log_rows > max(SIDECAR_COMPACT_MIN_ROWS, len(self._row_of)):
+            self._save_sidecar()
+
+    def _grow(self, needed: int) -> None:
+        capacity = max(self._capacity or self.initial_capacity, 1)
+        while capacity < needed:
+            capacity *= 2
+        if capacity == self._capacity:
+            return
+        tmp_path = f"{self._vectors_path}.tmp"
+        matrix = np.memmap(tmp_path, dtype=np.float32, mode="w+", shape=(capacity, self.dimension))
+        if self._matrix is not None:
+            matrix[:self._capacity] = self._matrix
+            self._matrix.flush()
+        matrix.flush()
+        del matrix
+        os.replace(tmp_path, self._vectors_path)
+        self._matrix = np.memmap(self._vectors_path, dtype=np.float32, mode="r+", shape=(capacity, self.dimension))
+        self._live = np.concatenate([self._live, np.zeros(capacity - self._capacity, dtype=bool)])
+        self._resize_codes(capacity)
+        self._capacity = capacity
+
+    def upsert(self, ids: List[str], embeddings: List[List[float]], documents: List[Document]) -> None:
+        if not ids:
+            return
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        vectors /= norms
+        with self._lock:
+            if self.dimension is None:
+                self.dimension = vectors.shape[1]
+            elif vectors.shape[1] != self.dimension:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match index dimension {self.dimension}")
+
+            new_rows = sum(1 for doc_id in ids if doc_id not in self._row_of)
+            used = len(self._rows)
+            if new_rows > len(self._free) + self._capacity - used:
+                self._grow(used + new_rows - len(self._free))
+
+            changed = []
+            for doc_id, vector, document in zip(ids, vectors, documents):
+                row = self._row_of.get(doc_id)
+                if row is not None:
+                    self._unindex_metadata(row, self._rows[row]["metadata"])
+                else:
+                    if self._free:
+                        row = self._free.pop()
+                    else:
+                        row = len(self._rows)
+                        self._rows.append(None)
+                    self._row_of[doc_id] = row
+                self._matrix[row] = vector
+                self._encode_rows(row, vector[None, :])
+                self._live[row] = True
+                self._rows[row] = {"id": doc_id, "text": document.page_content, "metadata": document.metadata}
+                self._index_metadata(row, document.metadata)
+                changed.append(row)
+            self._matrix.flush()
+            self._log_changes(changed)
+
+    def delete(self, ids: List[str]) -> None:
+        with self._lock:
+            changed = []
+            for doc_id in ids:
+                row = self._row_of.pop(doc_id, None)
+                if row is None:
+                    continue
+                self._unindex_metadata(row, self._rows[row]["metadata"])
+                self._rows[row] = None
+                self._live[row] = False
+                self._free.append(row)
+                changed.append(row)
+            if changed:
+                self._log_changes(changed)
+
+    def ids_for_source(self, source: str) -> List[str]:
+        with self._lock:
+            return [self._rows[row]["id"] for row in sorted(self._field_rows.get(("source", source), ()))]
+
+    def query(self, embedding: List[float], k: int, where: Optional[MetadataFilter] = None) -> List[VectorHit]:
+        query = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+        with self._lock:
+            if self._matrix is None or not self._row_of:
+                return []
+            used = len(self._rows)
+            rows = self._matching_rows(where)
+            scores = self._coarse_scores(query, rows, used)
+            if rows is None:
+                scores[~self._live[:used]] = -np.inf
+                available = len(self._row_of)
+            else:
+                available = len(rows)
+            k = min(k, available)
+            if k <= 0:
+                return []
+
+            if self.quantization == "none":
+                top = np.argpartition(-scores, k - 1)[:k]
+                top_rows, top_scores = (top if rows is None else rows[top]), scores[top]
+            else:
+                # Exact re-scoring of the best coarse candidates against the float32 rows
+                fetch = min(k * self.rescore_factor, available)
+                candidates = np.argpartition(-scores, fetch - 1)[:fetch]
+                candidate_rows = np.sort(candidates if rows is None else rows[candidates])
+                exact = self._matrix[candidate_rows] @ query
+                best = np.argpartition(-exact, k - 1)[:k]
+                top_rows, top_scores = candidate_rows[best], exact[best]
+            order = np.argsort(-top_scores)
+            return [
+                (self._rows[row]["id"],
+                 Document(page_content=self._rows[row]["text"], metadata=dict(self._rows[row]["metadata"])),
+                 float(max(score, 0.0)),
+                 self._matrix[row].tolist())
+                for row, score in zip(top_rows[order], top_scores[order])
+            ]
+
+    def get_vectors(self, ids: List[str]) -> Dict[str, List[float]]:
+        with self._lock:
+            return {doc_id: self._matrix[self._row_of[doc_id]].tolist() for doc_id in ids if doc_id in self._row_of}
+
+    def all_documents(self) -> Tuple[List[str], List[Document]]:
+        with self._lock:
+            entries = [entry for entry in self._rows if entry is not None]
+        return ([entry["id"] for entry in entries],
+                [Document(page_content=entry["text"], metadata=dict(entry["metadata"])) for entry in entries])
+
+    def count(self) -> int:
+        return len(self._row_of)
+
+    def stats(self) -> Dict[str, Any]:
+        """Vector counts plus the bytes scanned per query versus the full-precision matrix"""
+        with self._lock:
+            used, dimension = len(self._rows), self.dimension or 0
+        full_bytes = used * dimension * 4
+        if self.quantization == "none":
+            search_bytes = full_bytes
+        elif self._codes is None:
+            search_bytes = 0
+        else:
+            search_bytes = self._codes[:used].nbytes + (self._scales[:used].nbytes if self.quantization == "int8" else 0)
+        return {
+            **super().stats(),
+            "quantization": self.quantization,
+            "dimension": dimension,
+            "full_precision_bytes": full_bytes,
+            "search_bytes": search_bytes,
+        }